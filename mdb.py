@@ -93,7 +93,12 @@ def create_query_plan(query, keywords, action):
 
     if action=='insert into':
         if dic['values'][0] == '(' and dic['values'][-1] == ')':
-            dic['values'] = dic['values'][1:-1]
+            # more than one row, e.g. values (a,b),(c,d), is inserted as a batch
+            rows = re.findall(r'\(([^()]*)\)', dic['values'])
+            if len(rows) > 1:
+                dic = {'insert many': dic['insert into'], 'values': [row.strip() for row in rows]}
+            else:
+                dic['values'] = dic['values'][1:-1]
         else:
             raise ValueError('Your parens are not right m8')
 
@@ -196,8 +201,8 @@ def interpret_meta(command):
         [print(fold.removesuffix('_db')) for fold in os.listdir('dbdata')]
 
     def list_tables(db_name):
-        [print(pklf.removesuffix('.pkl')) for pklf in os.listdir(f'dbdata/{db_name}_db') if pklf.endswith('.pkl')\
-            and not pklf.startswith('meta')]
+        [print(tblf.removesuffix('.tbl').removesuffix('.pkl')) for tblf in os.listdir(f'dbdata/{db_name}_db')\
+            if (tblf.endswith('.tbl') or tblf.endswith('.pkl')) and not tblf.startswith('meta')]
 
     def change_db(db_name):
         global db
@@ -249,6 +254,16 @@ if __name__ == "__main__":
                     break
                 if line.startswith('.'):
                     interpret_meta(line)
+                elif line.startswith('explain analyze'):
+                    # run the query, also reporting the cost of the index against a sequential scan
+                    dic = interpret(line.removeprefix('explain analyze '))
+                    db.analyze = True
+                    try:
+                        result = execute_dic(dic)
+                    finally:
+                        db.analyze = False
+                    if result is not None:
+                        result.show()
                 elif line.startswith('explain'):
                     dic = interpret(line.removeprefix('explain '))
                     pprint(dic, sort_dicts=False)
@@ -1,16 +1,20 @@
 '''
 https://en.wikipedia.org/wiki/B%2B_tree
 '''
+import math
+from bisect import bisect_left, bisect_right
+from contextlib import nullcontext
 
 class Node:
     '''
     Node abstraction. Represents a single bucket
     '''
-    def __init__(self, b, values=[], ptrs=[],
+    def __init__(self, b, values=None, ptrs=None,
                  left_sibling=None, right_sibling=None, parent=None, is_leaf=False):
         self.b = b # branching factor
-        self.values = values # Values (the data from the pk column)
-        self.ptrs = ptrs # ptrs (the indexes of each datapoint or the index of another bucket)
+        # (a new list for every node, a shared default list would be filled by every tree)
+        self.values = values if values is not None else [] # Values (the data from the indexed column)
+        self.ptrs = ptrs if ptrs is not None else [] # ptrs (the indexes of the datapoints with each value or the index of another bucket)
         self.left_sibling = left_sibling # the index of a buckets left sibling
         self.right_sibling = right_sibling # the index of a buckets right sibling
         self.parent = parent # the index of a buckets parent
@@ -26,24 +30,18 @@ class Node:
             value: float. The value being searched for.
             return_ops: boolean. Set to True if you want to use the number of operations (for benchmarking).
         '''
-        ops = 0 # number of operations (<>= etc). Used for benchmarking
         if self.is_leaf: #
             return
 
-        # for each value in the node, if the user supplied value is smaller, return the btrees value index
-        # else (no value in the node is larger) return the last ptr
-        for index, existing_val in enumerate(self.values):
-            ops+=1
-            if value<existing_val:
-                if return_ops:
-                    return self.ptrs[index], ops
-                else:
-                    return self.ptrs[index]
+        # the ptr to follow is the one before the first value that is larger than the user supplied value
+        # (the last ptr if no value in the node is larger). The values are sorted, so binary search finds it
+        index = bisect_right(self.values, value)
+        ops = len(self.values).bit_length() # number of operations (<>= etc) of the binary search. Used for benchmarking
 
         if return_ops:
-            return self.ptrs[-1], ops
+            return self.ptrs[index], ops
         else:
-            return self.ptrs[-1]
+            return self.ptrs[index]
 
 
     def insert(self, value, ptr, ptr1=None):
@@ -56,23 +54,18 @@ class Node:
             ptr: float. The ptr of the inserted value (e.g. its index).
             ptr1: float. The 2nd ptr (e.g. in case the user wants to insert into a nonleaf node).
         '''
-        # for each value in the node, if the user supplied value is smaller, insert the value and its ptr into that position
+        # find (binary search) the position of the first value that is larger than the user supplied value
+        # and insert the value there. In a leaf, every value is next to its ptr. In a non leaf node, the ptr
+        # is the one after the value (the ptr to the new node that holds the values larger than it).
         # if a second ptr is provided, insert it right next to the 1st ptr
-        # else (no value in the node is larger) append value and ptr/s to the back of the list.
-
-        for index, existing_val in enumerate(self.values):
-            if value<existing_val:
-
-                self.values.insert(index, value)
-                self.ptrs.insert(index+1, ptr)
-
-                if ptr1:
-                    self.ptrs.insert(index+1, ptr1)
-                return
-        self.values.append(value)
-        self.ptrs.append(ptr)
-        if ptr1:
-            self.ptrs.append(ptr1)
+        index = bisect_right(self.values, value)
+        self.values.insert(index, value)
+        if self.is_leaf:
+            self.ptrs.insert(index, ptr)
+        else:
+            self.ptrs.insert(index+1, ptr)
+            if ptr1:
+                self.ptrs.insert(index+1, ptr1)
 
 
 
@@ -93,9 +86,16 @@ class Btree:
         The tree abstraction.
         '''
         self.b = b # branching factor
-        self.nodes = [] # list of nodes. Every new node is appended here
+        self.nodes = [] # list of nodes. Every new node is appended here (nodes read from an index file, see pager.py)
         self.root = None # the index of the root node
 
+    def _changes(self):
+        '''
+        Context of an operation that changes the tree. Nodes read from an index file are only written back
+        (at the next checkpoint) if they were read during such an operation.
+        '''
+        return self.nodes.changes() if hasattr(self.nodes, 'changes') else nullcontext()
+
     def insert(self, value, ptr, rptr=None):
         '''
         Insert the value and its ptr/s to the appropriate node (node-level insertion is covered by the node object).
@@ -105,6 +105,13 @@ class Btree:
             value: float. The input value.
             ptr: float. The ptr of the inserted value (e.g. its index).
         '''
+        with self._changes():
+            self._insert(value, ptr)
+
+    def _insert(self, value, ptr):
+        '''
+        Insert the value and its ptr to the appropriate leaf (see insert).
+        '''
         # if the tree is empty, add the first node and set the root index to 0 (the only node's index)
         if self.root is None:
             self.nodes.append(Node(self.b, is_leaf=True))
@@ -112,12 +119,90 @@ class Btree:
 
         # find the index of the node that the value and its ptr/s should be inserted to (_search)
         index = self._search(value)
+        node = self.nodes[index]
+        # the ptr of a leaf value is the list of the ptrs of every record with that value (duplicate values),
+        # so if the value already exists, its ptr is added to that list
+        if node.is_leaf:
+            position = bisect_left(node.values, value)
+            if position < len(node.values) and node.values[position] == value:
+                node.ptrs[position].append(ptr)
+                return
+            ptr = [ptr]
         # insert to it
-        self.nodes[index].insert(value,ptr)
+        node.insert(value,ptr)
         # if the node has more elements than b-1, split the node
         if len(self.nodes[index].values)==self.b:
             self.split(index)
 
+    def bulk_load(self, pairs, fill_factor=0.75):
+        '''
+        Build the tree bottom-up from (value, ptr) pairs, replacing its contents.
+        The pairs are sorted once, then the leaves are filled from left to right and linked to their siblings,
+        and each level of non leaf nodes is built on top of the previous one until a single root is left.
+
+        Args:
+            pairs: iterable. The (value, ptr) pairs (e.g. the values of a column and their indexes). Values may repeat.
+            fill_factor: float. How full (0 to 1) the nodes are filled. Free space lets later inserts avoid splits.
+        '''
+        pairs = sorted(pairs, key=lambda pair: pair[0])
+        self.nodes = []
+        self.root = None
+        if not pairs:
+            return
+
+        # group the ptrs of equal values, every leaf value has the list of its ptrs
+        grouped = []
+        for value, ptr in pairs:
+            if grouped and grouped[-1][0] == value:
+                grouped[-1][1].append(ptr)
+            else:
+                grouped.append((value, [ptr]))
+        pairs = grouped
+
+        # leaves hold up to b-1 values. For each node keep its index and the smallest value under it
+        level = []
+        start = 0
+        for size in self._bulk_load_sizes(len(pairs), self.b-1, fill_factor, 1):
+            leaf = Node(self.b, [value for value, _ in pairs[start:start+size]], [ptr for _, ptr in pairs[start:start+size]],
+                        left_sibling=level[-1][0] if level else None, is_leaf=True)
+            if level:
+                self.nodes[level[-1][0]].right_sibling = len(self.nodes)
+            level.append((len(self.nodes), leaf.values[0]))
+            self.nodes.append(leaf)
+            start += size
+
+        # non leaf nodes hold up to b ptrs. The value before each ptr (but the first) is the smallest value under it
+        while len(level) > 1:
+            upper_level = []
+            start = 0
+            for size in self._bulk_load_sizes(len(level), self.b, fill_factor, 2):
+                children = level[start:start+size]
+                for child, _ in children:
+                    self.nodes[child].parent = len(self.nodes)
+                upper_level.append((len(self.nodes), children[0][1]))
+                self.nodes.append(Node(self.b, [value for _, value in children[1:]], [child for child, _ in children], is_leaf=False))
+                start += size
+            level = upper_level
+
+        self.root = level[0][0]
+
+    def _bulk_load_sizes(self, n, capacity, fill_factor, minimum):
+        '''
+        Split n entries into nodes with at most capacity entries each (and at least minimum, if possible),
+        filled up to fill_factor. Returns the number of entries of each node.
+
+        Args:
+            n: int. The number of entries.
+            capacity: int. The maximum number of entries of a node.
+            fill_factor: float. How full (0 to 1) the nodes are filled.
+            minimum: int. The minimum number of entries of a node.
+        '''
+        capacity = max(capacity, 1)
+        target = max(round(capacity*fill_factor), minimum, 1)
+        # as many nodes as the fill factor needs, but not fewer than the capacity allows or more than the minimum allows
+        no_of_nodes = max(math.ceil(n/capacity), min(round(n/target), n//minimum), 1)
+        return [n//no_of_nodes + (1 if i < n%no_of_nodes else 0) for i in range(no_of_nodes)]
+
     def _search(self, value, return_ops=False):
         '''
         Returns the index of the node that the given value exists or should exist in.
@@ -129,7 +214,8 @@ class Btree:
         ops=0 # number of operations (<>= etc). Used for benchmarking
 
         #start with the root node
-        node = self.nodes[self.root]
+        idx = self.root
+        node = self.nodes[idx]
         # while the node that we are searching in is not a leaf
         # keep searching
         while not node.is_leaf:
@@ -139,9 +225,9 @@ class Btree:
 
         # finally return the index of the appropriate node (and the ops if you want to)
         if return_ops:
-            return self.nodes.index(node), ops
+            return idx, ops
         else:
-            return self.nodes.index(node)
+            return idx
 
 
     def split(self, node_id):
@@ -189,12 +275,14 @@ class Btree:
             for ptr in right_ptrs:
                 self.nodes[ptr].parent = len(self.nodes)
 
-        # old node (left) keeps only the first half of the values/ptrs
-        node.values = node.values[:len(node.values)//2]
-        if self.b%2==1:
+        # old node (left) keeps only the first half of the values/ptrs (a leaf keeps exactly one ptr per value)
+        if node.is_leaf:
+            node.ptrs = node.ptrs[:len(node.values)//2]
+        elif self.b%2==1:
             node.ptrs = node.ptrs[:len(node.ptrs)//2]
         else:
             node.ptrs = node.ptrs[:len(node.ptrs)//2+1]
+        node.values = node.values[:len(node.values)//2]
 
         # append the new node (right) to the nodes list
         self.nodes.append(right)
@@ -222,6 +310,130 @@ class Btree:
 
 
 
+    def delete(self, value, ptr):
+        '''
+        Remove a ptr of a value. When the last ptr of a value is removed, the value is removed from its leaf
+        and the nodes that are left with too few values borrow from or are merged with a sibling.
+        Returns False if the value/ptr pair is not part of the tree.
+
+        Args:
+            value: float. The value of the removed record.
+            ptr: float. The ptr of the removed record (e.g. its index).
+        '''
+        with self._changes():
+            return self._delete(value, ptr)
+
+    def _delete(self, value, ptr):
+        '''
+        Remove a ptr of a value (see delete).
+        '''
+        if self.root is None:
+            return False
+
+        index = self._search(value)
+        node = self.nodes[index]
+        position = bisect_left(node.values, value)
+        if position == len(node.values) or node.values[position] != value or ptr not in node.ptrs[position]:
+            return False
+
+        node.ptrs[position].remove(ptr)
+        # other records still have the value
+        if node.ptrs[position]:
+            return True
+
+        node.values.pop(position)
+        node.ptrs.pop(position)
+        self._rebalance(index)
+        return True
+
+    def _rebalance(self, node_id):
+        '''
+        Fix the node with index=node_id if it has too few values, by moving a value from a sibling
+        (if the sibling can spare one) or by merging it with a sibling (which removes a value from the parent,
+        so the parent is fixed next). Removed nodes are replaced by None in the nodes list, so that the indexes of
+        the rest of the nodes do not change.
+
+        Args:
+            node_id: float. The corresponding ID of the node.
+        '''
+        node = self.nodes[node_id]
+
+        if node_id == self.root:
+            # a non leaf root that is left with a single child is removed, the child becomes the root
+            if not node.is_leaf and not node.values:
+                self.root = node.ptrs[0]
+                self.nodes[self.root].parent = None
+                self.nodes[node_id] = None
+            return
+
+        # a leaf needs at least one value, half full nodes can always be merged without becoming too large
+        minimum = max((self.b-1)//2, 1) if node.is_leaf else (self.b-1)//2
+        if len(node.values) >= minimum:
+            return
+
+        parent = self.nodes[node.parent]
+        # the siblings used are the ones with the same parent
+        child_idx = parent.ptrs.index(node_id)
+        left_id = parent.ptrs[child_idx-1] if child_idx > 0 else None
+        right_id = parent.ptrs[child_idx+1] if child_idx+1 < len(parent.ptrs) else None
+
+        # borrow from the left sibling, the value before the node in the parent becomes the new smallest value
+        if left_id is not None and len(self.nodes[left_id].values) > minimum:
+            left = self.nodes[left_id]
+            if node.is_leaf:
+                node.values.insert(0, left.values.pop())
+                node.ptrs.insert(0, left.ptrs.pop())
+                parent.values[child_idx-1] = node.values[0]
+            else:
+                node.values.insert(0, parent.values[child_idx-1])
+                node.ptrs.insert(0, left.ptrs.pop())
+                parent.values[child_idx-1] = left.values.pop()
+                self.nodes[node.ptrs[0]].parent = node_id
+            return
+
+        # borrow from the right sibling, the value after the node in the parent becomes the sibling's smallest value
+        if right_id is not None and len(self.nodes[right_id].values) > minimum:
+            right = self.nodes[right_id]
+            if node.is_leaf:
+                node.values.append(right.values.pop(0))
+                node.ptrs.append(right.ptrs.pop(0))
+                parent.values[child_idx] = right.values[0]
+            else:
+                node.values.append(parent.values[child_idx])
+                node.ptrs.append(right.ptrs.pop(0))
+                parent.values[child_idx] = right.values.pop(0)
+                self.nodes[node.ptrs[-1]].parent = node_id
+            return
+
+        # merge with a sibling, the right node of the two is merged into the left one
+        if left_id is None and right_id is None: # only possible in trees with b=2 (non leaf nodes may have one child)
+            return
+        if left_id is not None:
+            left_id, right_id, separator = left_id, node_id, child_idx-1
+        else:
+            left_id, right_id, separator = node_id, right_id, child_idx
+        left, right = self.nodes[left_id], self.nodes[right_id]
+        if left.is_leaf:
+            left.values.extend(right.values)
+            left.ptrs.extend(right.ptrs)
+            left.right_sibling = right.right_sibling
+            if right.right_sibling is not None:
+                self.nodes[right.right_sibling].left_sibling = left_id
+        else:
+            # the value of the parent that separated the two nodes moves down between their values
+            left.values.extend([parent.values[separator]] + right.values)
+            left.ptrs.extend(right.ptrs)
+            for ptr in right.ptrs:
+                self.nodes[ptr].parent = left_id
+        parent.values.pop(separator)
+        parent.ptrs.pop(separator+1)
+        self.nodes[right_id] = None
+        # in trees with b=2 the merged node can be too large, it is split again
+        if len(left.values) == self.b:
+            self.split(left_id)
+
+        self._rebalance(node.parent)
+
     def show(self):
         '''
         Show important info for each node (sort by level - root first, then left to right).
@@ -277,71 +489,77 @@ class Btree:
             with open('graph.gv','w') as f:
                 f.write(g)
 
-    def find(self, operator, value):
+    def find(self, operator, value, return_ops=False):
         '''
         Return ptrs of elements where btree_value"operator"value.
         Important, the user supplied "value" is the right value of the operation. That is why the operation are reversed below.
         The left value of the op is the btree value.
+        Every leaf value has a list of ptrs (one for each record with that value), the returned list has all of them
+        (in the order of the values).
 
         Args:
             operator: string. The provided evaluation operator.
-            value: float. The value being searched for.
+            value: float. The value being searched for ((low, high) pair for between).
+            return_ops: boolean. Set to True if you want to use the number of operations (for benchmarking).
         '''
-        results = []
-        # find the index of the node that the element should exist in
-        leaf_idx, ops = self._search(value, True)
-        target_node = self.nodes[leaf_idx]
-
-        if operator == '=':
-            # if the element exist, append to list, else pass and return
-            try:
-                results.append(target_node.ptrs[target_node.values.index(value)])
-                # print('Found')
-            except:
-                # print('Not found')
-                pass
-
-        # for all other ops, the code is the same, only the operations themselves and the sibling indexes change
-        # for > and >= (btree value is >/>= of user supplied value), we return all the right siblings (all values are larger than current cell)
-        # for < and <= (btree value is </<= of user supplied value), we return all the left siblings (all values are smaller than current cell)
-
-        if operator == '>':
-            for idx, node_value in enumerate(target_node.values):
-                ops+=1
-                if node_value > value:
-                    results.append(target_node.ptrs[idx])
-            while target_node.right_sibling is not None:
-                target_node = self.nodes[target_node.right_sibling]
-                results.extend(target_node.ptrs)
-
-
-        if operator == '>=':
-            for idx, node_value in enumerate(target_node.values):
-                ops+=1
-                if node_value >= value:
-                    results.append(target_node.ptrs[idx])
-            while target_node.right_sibling is not None:
-                target_node = self.nodes[target_node.right_sibling]
-                results.extend(target_node.ptrs)
-
-        if operator == '<':
-            for idx, node_value in enumerate(target_node.values):
-                ops+=1
-                if node_value < value:
-                    results.append(target_node.ptrs[idx])
-            while target_node.left_sibling is not None:
-                target_node = self.nodes[target_node.left_sibling]
-                results.extend(target_node.ptrs)
-
-        if operator == '<=':
-            for idx, node_value in enumerate(target_node.values):
-                ops+=1
-                if node_value <= value:
-                    results.append(target_node.ptrs[idx])
-            while target_node.left_sibling is not None:
-                target_node = self.nodes[target_node.left_sibling]
-                results.extend(target_node.ptrs)
-
-        # print the number of operations (usefull for benchamrking)
-        # print(f'With BTree -> {ops} comparison operations')
-        return results
+        # for = the range starts and ends at the value
+        # for > and >= (btree value is >/>= of user supplied value), the range starts at the value and has no end
+        # for < and <= (btree value is </<= of user supplied value), the range starts at the smallest value and ends at the value
+        if operator == 'between':
+            lo, hi, lo_incl, hi_incl = value[0], value[1], True, True
+        elif operator == '=':
+            lo, hi, lo_incl, hi_incl = value, value, True, True
+        elif operator in ('>', '>='):
+            lo, hi, lo_incl, hi_incl = value, None, operator=='>=', True
+        elif operator in ('<', '<='):
+            lo, hi, lo_incl, hi_incl = None, value, True, operator=='<='
+        else:
+            return ([], 0) if return_ops else []
+
+        results = list(self.range(lo, hi, lo_incl, hi_incl))
+        if not return_ops:
+            return results
+
+        # the path to the first leaf, the binary search inside it and one comparison for every value in the range
+        ops = 0
+        if self.root is not None and lo is not None:
+            leaf_idx, ops = self._search(lo, True)
+            ops += len(self.nodes[leaf_idx].values).bit_length()
+        return results, ops + len(results)
+
+    def range(self, lo=None, hi=None, lo_incl=True, hi_incl=True):
+        '''
+        Yield the ptrs of the elements with values between lo and hi, in the order of the values.
+        The leaf of lo is found with a search, then the leaves are walked from left to right (using the right siblings)
+        until a value larger than hi is met, so only the leaves that hold the range (and the path to the first one) are read.
+        The ptrs are yielded lazily, so the walk also stops when the caller stops asking for more (e.g. top k).
+
+        Args:
+            lo: float. The smallest value of the range (None for no lower bound).
+            hi: float. The largest value of the range (None for no upper bound).
+            lo_incl: boolean. Whether values equal to lo are part of the range.
+            hi_incl: boolean. Whether values equal to hi are part of the range.
+        '''
+        if self.root is None:
+            return
+
+        if lo is None:
+            # start from the first value of the leftmost leaf
+            node_id = self.root
+            while not self.nodes[node_id].is_leaf:
+                node_id = self.nodes[node_id].ptrs[0]
+            position = 0
+        else:
+            # start from the position of lo in the leaf that it exists or should exist in
+            node_id = self._search(lo)
+            node = self.nodes[node_id]
+            position = bisect_left(node.values, lo) if lo_incl else bisect_right(node.values, lo)
+
+        while node_id is not None:
+            node = self.nodes[node_id]
+            for idx in range(position, len(node.values)):
+                if hi is not None and (node.values[idx] > hi or (node.values[idx] == hi and not hi_incl)):
+                    return
+                yield from node.ptrs[idx]
+            node_id = node.right_sibling
+            position = 0
@@ -1,11 +1,20 @@
 from __future__ import annotations
 import pickle
 from table import Table
-from time import sleep, localtime, strftime
+from time import sleep, localtime, strftime, time_ns
 import os,sys
 from btree import Btree
+from hash_index import HashIndex
+from locks import LockManager
+from storage import read_table, write_table, heap_paths, keys_path, is_paged, BUFFER_POOL_PAGES
+from pager import BufferPool, PagedRows, NodePages, read_btree, write_btree, apply_patches, remove_files
 import shutil
-from misc import split_condition
+from misc import split_condition, infer_type
+from itertools import chain, islice
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+import csv
 import logging
 import warnings
 import readline
@@ -14,27 +23,167 @@ import numpy as np
 
 # sys.setrecursionlimit(100)
 
+# the write-ahead log is folded into the table files (checkpoint) once it grows larger than this (in bytes)
+WAL_CHECKPOINT_SIZE = 4*1024*1024
+
 # Clear command cache (journal)
 readline.clear_history()
 
+def fsync_path(path):
+    '''
+    Flush a file to the disk, or a directory (so that the files renamed or created in it survive a crash).
+
+    Args:
+        path: string. The path of the file or directory.
+    '''
+    if os.name == 'nt' and os.path.isdir(path): # directories cannot be opened (nor flushed) on windows
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class Tables(MutableMapping):
+    '''
+    The tables of a database, by name. Every table of the database is known (by its name), but a table is only read
+    from its file the first time it is used. Optionally, only a number of (non meta) tables are kept in memory:
+    the least recently used unmodified tables are dropped and read again if they are used again.
+    '''
+    def __init__(self, read, max_loaded=None):
+        '''
+        Args:
+            read: function. Reads a table from its file, given its name.
+            max_loaded: int. The maximum number of (non meta) tables kept in memory (no limit if None).
+        '''
+        self._read = read
+        self.max_loaded = max_loaded
+        self._names = set() # the names of all the tables, loaded or not
+        self._loaded = OrderedDict() # name -> table, least recently used first
+
+    def __getitem__(self, name):
+        if name in self._loaded:
+            self._loaded.move_to_end(name)
+            return self._loaded[name]
+        if name not in self._names:
+            raise KeyError(name)
+        table = self._read(name)
+        self._loaded[name] = table
+        self._evict()
+        return table
+
+    def __setitem__(self, name, table):
+        self._names.add(name)
+        self._loaded[name] = table
+        self._loaded.move_to_end(name)
+        self._evict()
+
+    def __delitem__(self, name):
+        self._names.remove(name)
+        self._loaded.pop(name, None)
+
+    def pop(self, name, *default):
+        '''
+        Remove a table and return it (without reading it, if it was not loaded).
+        '''
+        if name not in self._names:
+            if default:
+                return default[0]
+            raise KeyError(name)
+        self._names.remove(name)
+        return self._loaded.pop(name, None)
+
+    def __iter__(self):
+        return iter(list(self._names))
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def add(self, name):
+        '''
+        Add the name of a table that is read when it is first used.
+        '''
+        self._names.add(name)
+
+    def is_loaded(self, name):
+        return name in self._loaded
+
+    def loaded(self):
+        '''
+        Return the (name, table) pairs of the tables in memory.
+        '''
+        return list(self._loaded.items())
+
+    def _evict(self):
+        '''
+        Drop the least recently used tables that have no unsaved changes, until at most max_loaded (non meta) tables are left.
+        The meta tables are used by every operation, so they are always kept. Tables that keep old row versions (for the
+        open snapshots) are kept too, the versions would be lost.
+        '''
+        if self.max_loaded is None:
+            return
+        candidates = [name for name in self._loaded if name[:4] != 'meta']
+        # the most recently used table (the one just read) is never dropped
+        for name in candidates[:-1]:
+            if len(candidates) <= self.max_loaded:
+                break
+            table = self._loaded[name]
+            if not getattr(table, '_dirty', True) and not getattr(table, '_versions', None):
+                self._loaded.pop(name)
+                candidates.remove(name)
+
+
 class Database:
     '''
     Main Database class, containing tables.
     '''
 
-    def __init__(self, name, load=True):
-        self.tables = {}
+    def __init__(self, name, load=True, max_loaded_tables=None):
+        '''
+        Args:
+            name: string. Name of the database.
+            load: boolean. Whether the database is loaded from its directory (if it exists).
+            max_loaded_tables: int. The maximum number of (non meta) tables kept in memory (no limit if None).
+        '''
+        # the tables are read from their files when they are first used
+        self.tables = Tables(self._read_table, max_loaded_tables)
         self._name = name
+        # (mtime, size) of every table file, as it was when we last loaded or saved it
+        self._file_stats = {}
+        # loaded indexes (index name -> (mtime, size) of the index file, index object))
+        self._indexes = {}
+        # indexes that have been modified since they were last saved
+        self._dirty_indexes = set()
+        # header of the write-ahead log we are reading and the position up to which it has been applied
+        self._wal_header = None
+        self._wal_offset = 0
+        # if True, indexed selects also report the cost of a sequential scan (explain analyze)
+        self.analyze = False
+        # the pages of the paged (large) tables that are kept in memory
+        self._buffer_pool = BufferPool(BUFFER_POOL_PAGES)
+        # every write applied to a table (ours or replayed from the log) is a transaction, with an increasing id
+        self._txid = 0
+        # the transaction ids of the open snapshots, oldest first (see snapshot)
+        self._snapshots = []
 
         self.savedir = f'dbdata/{name}_db'
+        # the locks of the tables (and of the database and the log) held by this process
+        self._locks = LockManager(f'{self.savedir}/locks')
 
         if load:
-            try:
-                self.load_database()
+            if self._exists():
+                # another process may be saving the database (checkpoint) meanwhile, the files are read once it is done
+                self._locks.acquire('database', 's')
+                try:
+                    self.load_database()
+                finally:
+                    self._locks.release('database')
                 logging.info(f'Loaded "{name}".')
                 return
-            except:
-                warnings.warn(f'Database "{name}" does not exist. Creating new.')
+            warnings.warn(f'Database "{name}" does not exist. Creating new.')
 
         # create dbdata directory if it doesnt exist
         if not os.path.exists('dbdata'):
@@ -48,54 +197,371 @@ class Database:
 
         # create all the meta tables with added arguments
         self.create_table('meta_length', 'table_name,no_of_rows', 'str,int', '')
-        self.create_table('meta_locks', 'table_name,locked', 'str,int,bool', '')
+        self.create_table('meta_locks', 'table_name,locked', 'str,bool', '')
         self.create_table('meta_insert_stack', 'table_name,indexes', 'str,list', '')
-        self.create_table('meta_indexes', 'table_name,index_name', 'str,str', '')
+        self.create_table('meta_indexes', 'table_name,index_name,column_name', 'str,str,str', '')
         self.save_database()
 
+    def _exists(self):
+        '''
+        Check whether the database has been created (its directory has the meta tables).
+        '''
+        return any(os.path.isfile(f'{self.savedir}/meta_length.{extension}') for extension in ('tbl', 'pkl'))
+
     def save_database(self):
         '''
-        Save database as a pkl file. This method saves the database object, including all tables and attributes.
+        Save database as table files (binary table format, see storage.py). Only the tables that were modified since they were last saved (dirty tables) are written to disk.
+
+        Saving is also a checkpoint of the write-ahead log: the dirty tables are written to temporary files (or, for the
+        files that are changed in place, only their changes are written to double-write files), a checkpoint record is
+        appended to the log, the temporary files replace the old ones (and the changes are applied) and finally the log
+        is emptied. The database is locked in exclusive mode during the checkpoint, so no statement runs meanwhile.
+        '''
+        if self._locks.mode('database') == 's':
+            # a statement is running (e.g. its log record made the log too large). If other processes are running
+            # statements, the checkpoint is left for later, the records are safe in the log
+            if not self._locks.acquire('database', 'x', blocking=False):
+                return
+        else:
+            self._locks.acquire('database', 'x')
+        try:
+            # records appended by other processes must be part of the checkpoint, else they would be lost
+            self._replay_wal()
+
+            dirty = []
+            # the tables that are not loaded have not changed since they were saved
+            for name, table in self.tables.loaded():
+                # tables loaded from pkl files that were saved before dirty tracking existed do not have the flag
+                if not getattr(table, '_dirty', True):
+                    continue
+                # the flag is cleared before dumping, so that the saved table is loaded as clean
+                table._dirty = False
+                self._remove_checkpoint_files(name)
+                write_table(table, f'{self._table_path(name)}.tmp', in_place=True)
+                dirty.append(name)
+
+            # the indexes are kept up to date by the row operations, so they are part of the checkpoint too
+            for index_name in self._dirty_indexes:
+                if index_name not in self._indexes:
+                    continue
+                index = self._indexes[index_name][1]
+                path = self._index_path(index_name, index)
+                self._remove_checkpoint_files(os.path.relpath(path, self.savedir))
+                self._write_index(index, f'{path}.tmp', in_place=True)
+                dirty.append(os.path.relpath(path, self.savedir))
+
+            # the written files must be on the disk before the checkpoint record is, else recovering from a crash
+            # could replace the files of the tables with incomplete ones
+            for name in dirty:
+                for path in self._checkpoint_paths(name):
+                    for written_path in (f'{path}.tmp', f'{path}.dw'):
+                        if os.path.isfile(written_path):
+                            fsync_path(written_path)
+            if dirty:
+                self._append_to_wal(('checkpoint', dirty))
+            self._finish_checkpoint(dirty)
+
+            for name in dirty:
+                if not self.tables.is_loaded(name):
+                    continue
+                table = self.tables[name]
+                if isinstance(table.data, PagedRows):
+                    # the modified pages are now part of the heap file
+                    table.data.checkpointed()
+                elif is_paged(table):
+                    # the table became large enough to be paged, its rows are read from the heap file from now on
+                    table.data = PagedRows(*heap_paths(self._table_path(name)), self._buffer_pool)
+
+            for index_name in self._dirty_indexes:
+                if index_name in self._indexes:
+                    index = self._indexes[index_name][1]
+                    if isinstance(index, Btree) and isinstance(index.nodes, NodePages):
+                        # the modified nodes are now part of the index file
+                        index.nodes.checkpointed()
+                    stat = os.stat(self._index_path(index_name, index))
+                    self._indexes[index_name] = ((stat.st_mtime_ns, stat.st_size), index)
+            self._dirty_indexes = set()
+            self._vacuum()
+        finally:
+            self._locks.release('database')
+
+    def _table_path(self, table_name):
+        '''
+        Return the path of a table's file.
+
+        Args:
+            table_name: string. Table name.
+        '''
+        return f'{self.savedir}/{table_name}.tbl'
+
+    def _remember_file_stat(self, table_name):
+        '''
+        Store the current (mtime, size) of a table's file, so that the table is not reloaded unless the file changes.
+
+        Args:
+            table_name: string. Table name (must be part of database).
+        '''
+        stat = os.stat(self._table_path(table_name))
+        self._file_stats[table_name] = (stat.st_mtime_ns, stat.st_size)
+
+    def _load_table(self, table_name):
+        '''
+        Load a single table from its file, if the file changed since the table was last loaded or saved.
+        Tables that are not in memory are only added by name, they are read when they are first used.
+
+        Args:
+            table_name: string. Table name (must be part of database).
+        '''
+        if not self.tables.is_loaded(table_name):
+            self.tables.add(table_name)
+            return
+        if not os.path.isfile(self._table_path(table_name)):
+            return
+        stat = os.stat(self._table_path(table_name))
+        if self._file_stats.get(table_name) == (stat.st_mtime_ns, stat.st_size):
+            return
+        self.tables[table_name] = self._read_table(table_name)
+
+    def _read_table(self, table_name):
+        '''
+        Read a table from its file. Tables saved as pkl files (by older versions) are read as modified,
+        so that the next save writes them as table files (and removes the pkl files).
+
+        Args:
+            table_name: string. Table name (must be part of database).
+        '''
+        if not os.path.isfile(self._table_path(table_name)):
+            with open(f'{self.savedir}/{table_name}.pkl', 'rb') as f:
+                table = pickle.load(f)
+            table._dirty = True
+            return table
+        stat = os.stat(self._table_path(table_name))
+        table = read_table(self._table_path(table_name), self._buffer_pool)
+        self._file_stats[table_name] = (stat.st_mtime_ns, stat.st_size)
+        return table
+
+    def _append_to_wal(self, record):
+        '''
+        Append a record to the end of the write-ahead log.
+        The records appended by other processes (to other tables) since the log was last read are applied first,
+        since the log is only read after the position of the last record appended by this process.
+
+        Args:
+            record: tuple. The logged operation, its first element is the name of the operation.
+        '''
+        self._locks.acquire('wal', 'x')
+        try:
+            self._replay_wal()
+            with open(f'{self.savedir}/wal.log', 'ab') as f:
+                pickle.dump(record, f)
+                f.flush()
+                # the statement is only committed once its record is on the disk
+                os.fsync(f.fileno())
+                self._wal_offset = f.tell()
+        finally:
+            self._locks.release('wal')
+
+    def _log(self, *record):
+        '''
+        Log a row operation (insert, update or delete) that has been applied to the in-memory tables.
+        The tables themselves are only written to disk when the log grows too large (or the database is saved).
+
+        Args:
+            record: tuple. The name of the operation followed by the arguments of the matching _apply_* method.
+        '''
+        self._append_to_wal(record)
+        if self._wal_offset > WAL_CHECKPOINT_SIZE:
+            # the meta tables are saved along with the table, so they have to count the logged operation too
+            self._update([record[1]])
+            self.save_database()
+
+    def _finish_checkpoint(self, table_names):
+        '''
+        Replace the table files with the ones written during a checkpoint (or change them in place) and start a new
+        (empty) log.
+        Running it more than once is harmless, so it is also used to complete a checkpoint interrupted by a crash.
+
+        Args:
+            table_names: list. The tables (and indexes, as 'indexes/<file name>') that were written during the checkpoint.
+        '''
+        for name in table_names:
+            *data_paths, path = self._checkpoint_paths(name)
+            for file_path in data_paths:
+                self._replace_file(file_path)
+            if self._replace_file(path):
+                # the table (or btree) is no longer saved as a pkl file (written by older versions)
+                old_path = f'{path.removesuffix(".idx")}.pkl' if name.startswith('indexes/') else f'{self.savedir}/{name}.pkl'
+                if old_path != path and os.path.isfile(old_path):
+                    os.remove(old_path)
+            if self.tables.is_loaded(name) and not self.tables[name]._dirty:
+                self._remember_file_stat(name)
+
+        # the renamed files must be on the disk before the log that could complete the checkpoint is emptied
+        fsync_path(self.savedir)
+        if any(name.startswith('indexes/') for name in table_names):
+            fsync_path(f'{self.savedir}/indexes')
+
+        # a unique header lets other processes know that the log they were reading has been emptied
+        self._wal_header = ('wal', os.getpid(), time_ns())
+        with open(f'{self.savedir}/wal.log', 'wb') as f:
+            pickle.dump(self._wal_header, f)
+            f.flush()
+            os.fsync(f.fileno())
+            self._wal_offset = f.tell()
+        fsync_path(self.savedir)
+
+    def _replace_file(self, path):
+        '''
+        Replace a file with the one written by a checkpoint (its temporary file), or change it in place by applying the
+        changes of its double-write file. Returns False if the checkpoint did not write the file.
+
+        Args:
+            path: string. The path of the file.
+        '''
+        if os.path.isfile(f'{path}.tmp'):
+            os.replace(f'{path}.tmp', path)
+            return True
+        if os.path.isfile(f'{path}.dw'):
+            # the file has all the changes when the double-write file is removed, if the process crashes before that,
+            # they are applied again when the checkpoint is finished
+            apply_patches(f'{path}.dw', path)
+            os.remove(f'{path}.dw')
+            return True
+        return False
+
+    def _remove_checkpoint_files(self, name):
         '''
-        for name, table in self.tables.items():
-            with open(f'{self.savedir}/{name}.pkl', 'wb') as f:
-                pickle.dump(table, f)
+        Remove the files that an interrupted checkpoint (one that was not logged) wrote for a table (or index), so that
+        they are not mistaken for the files of the next checkpoint.
 
-    def _save_locks(self):
+        Args:
+            name: string. The name of the table (or index, as 'indexes/<file name>').
         '''
-        Stores the meta_locks table to file as meta_locks.pkl.
+        remove_files(*(f'{path}{suffix}' for path in self._checkpoint_paths(name) for suffix in ('.tmp', '.dw')))
+
+    def _checkpoint_paths(self, name):
         '''
-        with open(f'{self.savedir}/meta_locks.pkl', 'wb') as f:
-            pickle.dump(self.tables['meta_locks'], f)
+        Return the paths of the files that a checkpoint writes for a table (or index), in the order they are replaced:
+        the heap file and the row directory of paged tables and the key index file are replaced before the table file.
+
+        Args:
+            name: string. The name of the table (or index, as 'indexes/<file name>') in the checkpoint record.
+        '''
+        if name.startswith('indexes/'):
+            # the name of an index file includes its extension (logs written by older versions only had pkl files)
+            return [f'{self.savedir}/{name}' if name.endswith(('.idx', '.pkl')) else f'{self.savedir}/{name}.pkl']
+        path = self._table_path(name)
+        return [*heap_paths(path), keys_path(path), path]
+
+    def _replay_wal(self):
+        '''
+        Apply the records of the write-ahead log that are not yet part of the in-memory tables
+        (written by another process or left behind by a crash).
+        '''
+        # the log is read (and a partially written record may be removed) while no other process writes to it
+        self._locks.acquire('wal', 'x')
+        try:
+            path = f'{self.savedir}/wal.log'
+            if not os.path.isfile(path):
+                return
+
+            records = []
+            with open(path, 'rb') as f:
+                try:
+                    header = pickle.load(f)
+                except Exception:
+                    header = None
+                # a different header means the log was emptied after a checkpoint, so it has to be read from the start
+                if header != self._wal_header:
+                    self._wal_header = header
+                    self._wal_offset = f.tell()
+                f.seek(self._wal_offset)
+
+                while True:
+                    try:
+                        records.append(pickle.load(f))
+                    except EOFError:
+                        break
+                    except Exception:
+                        # a partially written record (the writer crashed), drop it so that new records can follow
+                        logging.info('Truncating partially written record of the write-ahead log.')
+                        f.close()
+                        os.truncate(path, self._wal_offset)
+                        break
+                    self._wal_offset = f.tell()
+
+            if records and records[-1][0] == 'checkpoint':
+                # the checkpoint was interrupted (it is always the last record), complete it and reload the tables that
+                # were written. The records before it are part of the checkpoint, they are not applied: the files of the
+                # tables may already have some of the changes of the checkpoint (they are changed in place)
+                names = records[-1][1]
+                self._finish_checkpoint(names)
+                for name in names:
+                    # the indexes are reloaded when they are used, since their files changed
+                    if not name.startswith('indexes/'):
+                        self._file_stats.pop(name, None)
+                        self._load_table(name)
+                return
+
+            applied = set() # the tables changed by the applied records
+            for record in records:
+                getattr(self, f'_apply_{record[0]}')(*record[1:])
+                applied.add(record[1])
+            if applied:
+                self._update(list(applied))
+        finally:
+            self._locks.release('wal')
 
     def load_database(self):
         '''
         Load all tables that are part of the database (indices noted here are loaded).
+        Tables are cached in memory, only the ones whose file changed on disk (e.g. by another process) are read again.
 
         Args:
             path: string. Directory (path) of the database on the system.
         '''
         path = f'dbdata/{self._name}_db'
+        on_disk = []
         for file in os.listdir(path):
 
-            if file[-3:]!='pkl': # if used to load only pkl files
+            # load only table files (and pkl files, the tables saved by older versions)
+            if not file.endswith('.tbl') and not file.endswith('.pkl'):
                 continue
-            f = open(path+'/'+file, 'rb')
-            tmp_dict = pickle.load(f)
-            f.close()
             name = f'{file.split(".")[0]}'
-            self.tables.update({name: tmp_dict})
+            if name in on_disk:
+                continue
+            on_disk.append(name)
+            self._load_table(name)
             # setattr(self, name, self.tables[name])
 
+        self._upgrade_meta_indexes()
+
+        # apply the row operations that have been logged since the last checkpoint
+        self._replay_wal()
+
+        # forget the tables whose file has been removed (e.g. dropped by another process). Their unsaved changes
+        # (if any) are not lost, they were logged and the process that dropped the table saved them first
+        for name in list(self.tables):
+            if name not in on_disk:
+                self.tables.pop(name, None)
+                self._file_stats.pop(name, None)
+
     #### IO ####
 
-    def _update(self):
+    def _update(self, table_names=None):
         '''
         Update all meta tables.
+
+        Args:
+            table_names: list. The tables whose records in the meta tables are updated (every table in memory if None,
+                         the rest have not changed since they were last read).
         '''
-        self._update_meta_length()
-        self._update_meta_locks()
-        self._update_meta_insert_stack()
+        if table_names is None:
+            table_names = [name for name, _ in self.tables.loaded()]
+        tables = [self.tables[name] for name in table_names if name[:4] != 'meta' and name in self.tables]
+        self._update_meta_length(tables)
+        self._update_meta_locks(tables)
+        self._update_meta_insert_stack(tables)
 
     def create_table(self, name, column_names, column_types, column_extras, primary_key=None, load=None):
         '''
@@ -109,13 +575,18 @@ class Database:
             load: boolean. Defines table object parameters as the name of the table and the column names.
         '''
         # print('here -> ', column_names.split(','))
-        #the new table has more arguments
-        self.tables.update({name: Table(name=name, column_names=column_names.split(','), column_types=column_types.split(','), column_extras=column_extras.split(','), primary_key=primary_key, load=load)})
-        # self._name = Table(name=name, column_names=column_names, column_types=column_types, load=load)
-        # check that new dynamic var doesnt exist already
-        # self.no_of_tables += 1
-        self._update()
-        self.save_database()
+        self._lock_database()
+        try:
+            self.load_database()
+            #the new table has more arguments
+            self.tables.update({name: Table(name=name, column_names=column_names.split(','), column_types=column_types.split(','), column_extras=column_extras.split(','), primary_key=primary_key, load=load)})
+            # self._name = Table(name=name, column_names=column_names, column_types=column_types, load=load)
+            # check that new dynamic var doesnt exist already
+            # self.no_of_tables += 1
+            self._update([name])
+            self.save_database()
+        finally:
+            self._locks.release('database')
         # (self.tables[name])
         print(f'Created table "{name}".')
 
@@ -127,68 +598,130 @@ class Database:
         Args:
             table_name: string. Name of table.
         '''
-        self.load_database()
-        if self.is_locked(table_name):
-            return
+        self._lock_database()
+        try:
+            self.load_database()
+            self._drop_table(table_name)
+        finally:
+            self._locks.release('database')
+
+    def _drop_table(self, table_name):
+        '''
+        Drop table from current database (the database must be locked, see drop_table).
 
+        Args:
+            table_name: string. Name of table.
+        '''
         self.tables.pop(table_name)
-        if os.path.isfile(f'{self.savedir}/{table_name}.pkl'):
+        self._file_stats.pop(table_name, None)
+        if os.path.isfile(self._table_path(table_name)):
+            os.remove(self._table_path(table_name))
+        elif os.path.isfile(f'{self.savedir}/{table_name}.pkl'): # not saved since it was loaded from a pkl file
             os.remove(f'{self.savedir}/{table_name}.pkl')
         else:
-            warnings.warn(f'"{self.savedir}/{table_name}.pkl" not found.')
+            warnings.warn(f'"{self._table_path(table_name)}" not found.')
+        for file_path in [*heap_paths(self._table_path(table_name)), keys_path(self._table_path(table_name))]: # paged tables and key indexes
+            if os.path.isfile(file_path):
+                os.remove(file_path)
         self.delete_from('meta_locks', f'table_name={table_name}')
         self.delete_from('meta_length', f'table_name={table_name}')
         self.delete_from('meta_insert_stack', f'table_name={table_name}')
+        # the indexes of the table are dropped too (they would be kept up to date if a table with the same name is created)
+        for index_name in self.tables['meta_indexes']._select_where('index_name', f'table_name={table_name}').column_by_name('index_name'):
+            self._indexes.pop(index_name, None)
+            self._dirty_indexes.discard(index_name)
+            for extension in ('idx', 'pkl'):
+                if os.path.isfile(f'{self.savedir}/indexes/meta_{index_name}_index.{extension}'):
+                    os.remove(f'{self.savedir}/indexes/meta_{index_name}_index.{extension}')
+        self.delete_from('meta_indexes', f'table_name={table_name}')
 
         # self._update()
         self.save_database()
 
 
-    def import_table(self, table_name, filename, column_types=None, primary_key=None):
+    def import_table(self, table_name, filename, column_types=None, primary_key=None, delimiter=',', sample_size=1000, chunk_size=10000):
         '''
-        Creates table from CSV file.
+        Creates table from CSV file. The first line of the file has the column names.
+        The file is read row by row (quoted fields are supported) and the rows are inserted in chunks,
+        so the file is never held in memory as a whole. Every chunk is inserted and logged as a batch.
 
         Args:
             filename: string. CSV filename. If not specified, filename's name will be used.
-            column_types: list. Types of columns. If not specified, all will be set to type str.
+            column_types: string. Comma separated types of columns. If not specified, they are inferred from the first rows of the file.
             primary_key: string. The primary key (if it exists).
+            delimiter: string. The character that separates the fields of a row.
+            sample_size: int. The number of rows used to infer the column types.
+            chunk_size: int. The number of rows inserted at once.
         '''
-        file = open(filename, 'r')
-
-        first_line=True
-        for line in file.readlines():
-            if first_line:
-                colnames = line.strip('\n')
-                if column_types is None:
-                    column_types = ",".join(['str' for _ in colnames.split(',')])
-                self.create_table(name=table_name, column_names=colnames, column_types=column_types, primary_key=primary_key)
-                self.lock_table(table_name, mode='x')
-                first_line = False
-                continue
-            self.tables[table_name]._insert(line.strip('\n').split(','))
+        with open(filename, 'r', newline='') as file:
+            reader = csv.reader(file, delimiter=delimiter)
+            colnames = next(reader)
+            sample = list(islice(reader, sample_size))
+            if column_types is None:
+                column_types = ','.join([infer_type([row[i] for row in sample if i < len(row)]).__name__ for i in range(len(colnames))])
+            self.create_table(name=table_name, column_names=','.join(colnames), column_types=column_types, column_extras='', primary_key=primary_key)
+            types = self.tables[table_name].column_types
 
-        self.unlock_table(table_name)
-        self._update()
+            self.lock_table(table_name, mode='x')
+            try:
+                self.load_database()
+                rows = chain(sample, reader)
+                while True:
+                    chunk = list(islice(rows, chunk_size))
+                    if not chunk:
+                        break
+                    # empty fields of columns that are not strings are nulls
+                    chunk = [[value if value != '' or types[i] == str else 'null' for i, value in enumerate(row)] for row in chunk]
+                    self._apply_insert_many(table_name, [list(row) for row in chunk])
+                    self._log('insert_many', table_name, chunk)
+                self._update([table_name])
+            finally:
+                self.unlock_table(table_name)
         self.save_database()
 
 
-    def export(self, table_name, filename=None):
+    def export(self, table_name, filename=None, columns='*', condition=None, delimiter=',', chunk_size=10000):
         '''
-        Transform table to CSV.
+        Transform table to CSV. The rows are written to the file in chunks (deleted rows are skipped),
+        so the output is never built in memory as a whole.
 
         Args:
-            table_name: string. Name of table.
+            table_name: string. Name of table (or a Table object, e.g. the result of a select).
             filename: string. Output CSV filename.
+            columns: string. Comma separated names of the exported columns ('*' for all columns).
+            condition: string. Only the rows where condition is met are exported (all rows if None).
+            delimiter: string. The character that separates the fields of a row.
+            chunk_size: int. The number of rows written at once.
         '''
-        res = ''
-        for row in [self.tables[table_name].column_names]+self.tables[table_name].data:
-            res+=str(row)[1:-1].replace('\'', '').replace('"','').replace(' ','')+'\n'
-
-        if filename is None:
-            filename = f'{table_name}.csv'
+        self._locks.acquire('database', 's')
+        try:
+            if isinstance(table_name, Table):
+                table = table_name
+            else:
+                self.load_database()
+                table = self._read_view(table_name)
 
-        with open(filename, 'w') as file:
-           file.write(res)
+            if columns == '*':
+                column_idxs = list(range(len(table.column_names)))
+            else:
+                column_idxs = [table.column_names.index(col.strip()) for col in columns.split(',')]
+            row_idxs = table._where_rows(condition) if condition is not None else range(len(table.data))
+
+            if filename is None:
+                filename = f'{table._name}.csv'
+
+            with open(filename, 'w', newline='') as file:
+                writer = csv.writer(file, delimiter=delimiter)
+                writer.writerow([table.column_names[i] for i in column_idxs])
+                # deleted rows are all None
+                rows = ([row[i] for i in column_idxs] for row in map(table.data.__getitem__, row_idxs) if any(value is not None for value in row))
+                while True:
+                    chunk = list(islice(rows, chunk_size))
+                    if not chunk:
+                        break
+                    writer.writerows(chunk)
+        finally:
+            self._locks.release('database')
 
     def table_from_object(self, new_table):
         '''
@@ -197,24 +730,28 @@ class Database:
         Args:
             new_table: string. Name of new table.
         '''
-
-        self.tables.update({new_table._name: new_table})
-        if new_table._name not in self.__dir__():
-            setattr(self, new_table._name, new_table)
-        else:
-            raise Exception(f'"{new_table._name}" attribute already exists in class "{self.__class__.__name__}".')
-        self._update()
-        self.save_database()
+        self._lock_database()
+        try:
+            self.tables.update({new_table._name: new_table})
+            # the object may be a copy of a clean table (e.g. a select result), it still needs to be saved
+            new_table._dirty = True
+            if new_table._name not in self.__dir__():
+                setattr(self, new_table._name, new_table)
+            else:
+                raise Exception(f'"{new_table._name}" attribute already exists in class "{self.__class__.__name__}".')
+            self._update([new_table._name])
+            self.save_database()
+        finally:
+            self._locks.release('database')
 
 
 
     ##### table functions #####
 
-    # In every table function a load command is executed to fetch the most recent table.
-    # In every table function, we first check whether the table is locked. Since we have implemented
-    # only the X lock, if the tables is locked we always abort.
-    # After every table function, we update and save. Update updates all the meta tables and save saves all
-    # tables.
+    # In every table function, we first lock the table (S to read it, X to change it), waiting for the conflicting
+    # locks of other processes, and then a load command is executed to fetch the most recent table.
+    # After every table function, we update the meta tables and log the change (the tables are saved when
+    # the log grows too large), then unlock the table.
 
     # these function calls are named close to the ones in postgres
 
@@ -228,14 +765,23 @@ class Database:
             column_name: string. The column that will be casted (must be part of database).
             cast_type: type. Cast type (do not encapsulate in quotes).
         '''
-        self.load_database()
-        if self.is_locked(table_name):
-            return
-        self.lock_table(table_name, mode='x')
-        self.tables[table_name]._cast_column(column_name, eval(cast_type))
-        self.unlock_table(table_name)
-        self._update()
-        self.save_database()
+        # the cast is not logged, the table is saved right away
+        self._lock_database()
+        try:
+            self.load_database()
+            with self._transaction(table_name) as table:
+                table._cast_column(column_name, eval(cast_type))
+            # the indexes of the column have keys of the old type, they are built again from the cast values
+            column_idx = self.tables[table_name].column_names.index(column_name)
+            for index_name, indexed_column, index in self._table_indexes(table_name):
+                if indexed_column == column_idx:
+                    index_type = 'hash' if isinstance(index, HashIndex) else 'btree'
+                    self._indexes[index_name] = (self._indexes[index_name][0], self._build_index(table_name, column_name, index_type))
+                    self._dirty_indexes.add(index_name)
+            self._update([table_name])
+            self.save_database()
+        finally:
+            self._locks.release('database')
 
     def insert_into(self, table_name, row_str, lock_load_save=True):
         '''
@@ -248,25 +794,87 @@ class Database:
         '''
         row = row_str.strip().split(',')
         if lock_load_save:
-            self.load_database()
-            if self.is_locked(table_name):
-                return
-            # fetch the insert_stack. For more info on the insert_stack
-            # check the insert_stack meta table
+            # the table is loaded after it is locked, so that no other process changes it in between
             self.lock_table(table_name, mode='x')
-        insert_stack = self._get_insert_stack_for_table(table_name)
         try:
-            self.tables[table_name]._insert(row, insert_stack)
+            if lock_load_save:
+                self.load_database()
+            # _insert casts the values in place, the original ones are logged
+            self._apply_insert(table_name, list(row))
+            self._log('insert', table_name, row)
+            if lock_load_save:
+                self._update([table_name])
         except Exception as e:
             logging.info(e)
             logging.info('ABORTED')
-        # sleep(2)
+        finally:
+            # sleep(2)
+            if lock_load_save:
+                self.unlock_table(table_name)
+
+    def _apply_insert(self, table_name, row):
+        '''
+        Insert a row to the in-memory table, reusing the last slot of its insert_stack (if any).
+
+        Args:
+            table_name: string. Name of table (must be part of database).
+            row: list. A list of values to be inserted.
+        '''
+        # fetch the insert_stack. For more info on the insert_stack
+        # check the insert_stack meta table
+        insert_stack = self._get_insert_stack_for_table(table_name)
+        with self._transaction(table_name) as table:
+            rowid = table._insert(row, insert_stack)
+        # the slot is only consumed if the insert succeeded
         self._update_meta_insert_stack_for_tb(table_name, insert_stack[:-1])
-        if lock_load_save:
+
+        for index_name, column_idx, index in self._table_indexes(table_name):
+            self._index_insert(index_name, index, self.tables[table_name], column_idx, rowid)
+
+
+    def insert_many(self, table_name, rows):
+        '''
+        Inserts a batch of rows to given table, under a single lock and with a single record in the write-ahead log.
+        If any of the rows cannot be inserted (e.g. duplicate primary key), none of them is.
+
+        Args:
+            table_name: string. Name of table (must be part of database).
+            rows: list. The rows to be inserted, either lists of values or strings of comma separated values
+                  (will be casted to a predifined type automatically).
+        '''
+        rows = [row.strip().split(',') if isinstance(row, str) else list(row) for row in rows]
+        self.lock_table(table_name, mode='x')
+        try:
+            self.load_database()
+            # _insert_many casts the values in place, the original ones are logged
+            self._apply_insert_many(table_name, [list(row) for row in rows])
+            self._log('insert_many', table_name, rows)
+            self._update([table_name])
+        except Exception as e:
+            logging.info(e)
+            logging.info('ABORTED')
+        finally:
             self.unlock_table(table_name)
-            self._update()
-            self.save_database()
 
+    def _apply_insert_many(self, table_name, rows):
+        '''
+        Insert a batch of rows to the in-memory table, reusing the last slots of its insert_stack (if any).
+
+        Args:
+            table_name: string. Name of table (must be part of database).
+            rows: list. A list of rows (lists of values) to be inserted.
+        '''
+        insert_stack = self._get_insert_stack_for_table(table_name)
+        with self._transaction(table_name) as table:
+            rowids = table._insert_many(rows, insert_stack)
+        # the slots are only consumed if the insert succeeded
+        self._update_meta_insert_stack_for_tb(table_name, insert_stack[:max(len(insert_stack)-len(rows), 0)])
+
+        for index_name, column_idx, index in self._table_indexes(table_name):
+            # the rows are added in the order of their values, so consecutive inserts reach neighbouring nodes
+            batch = [rowid for rowid in rowids if self._is_indexed_value(table, column_idx, table.data[rowid][column_idx])]
+            for rowid in sorted(batch, key=lambda rowid: table.data[rowid][column_idx]):
+                self._index_insert(index_name, index, table, column_idx, rowid)
 
     def update_table(self, table_name, set_args, condition):
         '''
@@ -283,14 +891,40 @@ class Database:
                 Operatores supported: (<,<=,==,>=,>)
         '''
         set_column, set_value = set_args.replace(' ','').split('=')
-        self.load_database()
-        if self.is_locked(table_name):
-            return
         self.lock_table(table_name, mode='x')
-        self.tables[table_name]._update_rows(set_value, set_column, condition)
-        self.unlock_table(table_name)
-        self._update()
-        self.save_database()
+        try:
+            self.load_database()
+            self._apply_update(table_name, set_value, set_column, condition)
+            self._log('update', table_name, set_value, set_column, condition)
+            self._update([table_name])
+        finally:
+            self.unlock_table(table_name)
+
+    def _apply_update(self, table_name, set_value, set_column, condition):
+        '''
+        Update the in-memory table where condition is met.
+
+        Args:
+            table_name: string. Name of table (must be part of database).
+            set_value: string. New value of the predifined column name.
+            set_column: string. The column to be altered.
+            condition: string. The condition of the update.
+        '''
+        table = self.tables[table_name]
+        rows = table._where_rows(condition)
+        set_column_idx = table.column_names.index(set_column)
+        old_values = [table.data[row][set_column_idx] for row in rows]
+        with self._transaction(table_name):
+            table._set_rows(rows, set_value, set_column)
+
+        # the rows move inside the indexes of the updated column (from the old value to the new one)
+        for index_name, column_idx, index in self._table_indexes(table_name):
+            if column_idx != set_column_idx:
+                continue
+            for row, old_value in zip(rows, old_values):
+                if old_value != table.data[row][column_idx]:
+                    self._index_delete(index_name, index, table, column_idx, row, old_value)
+                    self._index_insert(index_name, index, table, column_idx, row)
 
     def delete_from(self, table_name, condition):
         '''
@@ -304,18 +938,33 @@ class Database:
 
                 Operatores supported: (<,<=,==,>=,>)
         '''
-        self.load_database()
-        if self.is_locked(table_name):
-            return
         self.lock_table(table_name, mode='x')
-        deleted = self.tables[table_name]._delete_where(condition)
-        self.unlock_table(table_name)
-        self._update()
-        self.save_database()
-        # we need the save above to avoid loading the old database that still contains the deleted elements
+        try:
+            self.load_database()
+            self._apply_delete(table_name, condition)
+            self._log('delete', table_name, condition)
+            self._update([table_name])
+        finally:
+            self.unlock_table(table_name)
+
+    def _apply_delete(self, table_name, condition):
+        '''
+        Delete rows of the in-memory table where condition is met and add their slots to the insert_stack.
+
+        Args:
+            table_name: string. Name of table (must be part of database).
+            condition: string. The condition of the delete.
+        '''
+        table = self.tables[table_name]
+        rows = table._where_rows(condition)
+        # the rows are removed from the indexes while their values are still there
+        for index_name, column_idx, index in self._table_indexes(table_name):
+            for row in rows:
+                self._index_delete(index_name, index, table, column_idx, row, table.data[row][column_idx])
+        with self._transaction(table_name):
+            deleted = table._delete_rows(rows)
         if table_name[:4]!='meta':
             self._add_to_insert_stack(table_name, deleted)
-        self.save_database()
 
     def select(self, columns, table_name, condition, order_by=None, top_k=True,\
                desc=None, save_as=None, return_object=True):
@@ -327,9 +976,10 @@ class Database:
             columns: list. The columns that will be part of the output table (use '*' to select all available columns)
             condition: string. A condition using the following format:
                 'column[<,<=,==,>=,>]value' or
-                'value[<,<=,==,>=,>]column'.
+                'value[<,<=,==,>=,>]column' or
+                'column between value and value'.
 
-                Operatores supported: (<,<=,==,>=,>)
+                Operatores supported: (<,<=,==,>=,>,between)
             order_by: string. A column name that signals that the resulting table should be ordered based on it (no order if None).
             desc: boolean. If True, order_by will return results in descending order (True by default).
             top_k: int. An integer that defines the number of rows that will be returned (all rows if None).
@@ -337,25 +987,26 @@ class Database:
             return_object: boolean. If True, the result will be a table object (useful for internal use - the result will be printed by default).
         '''
         # print(table_name)
-        self.load_database()
         if isinstance(table_name,Table):
             return table_name._select_where(columns, condition, order_by, desc, top_k)
 
         if condition is not None:
-            condition_column = split_condition(condition)[0]
+            condition_column, condition_operator, _ = split_condition(condition)
         else:
-            condition_column = ''
+            condition_column, condition_operator = '', None
 
-        if self.is_locked(table_name):
-            return
-        self.lock_table(table_name, mode='x')
-        if self._has_index(table_name) and condition_column==self.tables[table_name].column_names[self.tables[table_name].pk_idx]:
-            index_name = self.select('*', 'meta_indexes', f'table_name={table_name}', return_object=True).column_by_name('index_name')[0]
-            bt = self._load_idx(index_name)
-            table = self.tables[table_name]._select_where_with_btree(columns, bt, condition, order_by, desc, top_k)
-        else:
-            table = self.tables[table_name]._select_where(columns, condition, order_by, desc, top_k)
-        self.unlock_table(table_name)
+        # readers do not lock the table (writers are not blocked), they read the snapshot they are in (if any)
+        self._locks.acquire('database', 's')
+        try:
+            self.load_database()
+            view = self._read_view(table_name)
+            bt = self._get_view_index(view, table_name, condition_column, condition_operator)
+            if bt is not None:
+                table = view._select_where_with_btree(columns, bt, condition, order_by, desc, top_k, self.analyze)
+            else:
+                table = view._select_where(columns, condition, order_by, desc, top_k)
+        finally:
+            self._locks.release('database')
         if save_as is not None:
             table._name = save_as
             self.table_from_object(table)
@@ -372,10 +1023,12 @@ class Database:
         Args:
             table_name: string. Name of table (must be part of database).
         '''
-        self.load_database()
-        if self.is_locked(table_name):
-            return
-        self.tables[table_name].show(no_of_rows, self.is_locked(table_name))
+        self._locks.acquire('database', 's')
+        try:
+            self.load_database()
+            self._read_view(table_name).show(no_of_rows)
+        finally:
+            self._locks.release('database')
 
     def sort(self, table_name, column_name, asc=False):
         '''
@@ -387,14 +1040,15 @@ class Database:
             asc: If True sort will return results in ascending order (False by default).
         '''
 
-        self.load_database()
-        if self.is_locked(table_name):
-            return
-        self.lock_table(table_name, mode='x')
-        self.tables[table_name]._sort(column_name, asc=asc)
-        self.unlock_table(table_name)
-        self._update()
-        self.save_database()
+        # the sort is not logged, the table is saved right away
+        self._lock_database()
+        try:
+            self.load_database()
+            self.tables[table_name]._sort(column_name, asc=asc)
+            self._update([table_name])
+            self.save_database()
+        finally:
+            self._locks.release('database')
 
     def join(self, mode, left_table, right_table, condition, save_as=None, return_object=True):
         '''
@@ -411,48 +1065,52 @@ class Database:
         save_as: string. The output filename that will be used to save the resulting table in the database (won't save if None).
         return_object: boolean. If True, the result will be a table object (useful for internal usage - the result will be printed by default).
         '''
-        self.load_database()
-        left_table = left_table if isinstance(left_table, Table) else self.tables[left_table]
-        right_table = right_table if isinstance(right_table, Table) else self.tables[right_table]
-
-        if self.is_locked(left_table) or self.is_locked(right_table):
-            warnings.warn(f'Table(s) are currently locked.')
-            return
-
-        if mode=='inner':
-            # get columns and operator
-            column_name_left, operator, column_name_right = left_table._parse_condition(condition, join=True)
-            #Both Index Nested-Loops Join and Sort-Merge Join can be run on equi-join/natural join
-            if (operator != "="):
-                print("Can't run inlj or smj , running inner join")
-                res = left_table._inner_join(right_table, condition)
-            else:
-                #Checking if the tables can be indexed
-                #Smj can be used iff both of the columns of the condition are indexed(have a pk)
-
-                if right_table.pk is None or column_name_right != right_table.pk:
-                    if left_table.pk is None or column_name_left != left_table.pk:
-                        #If the tables can't be indexed, run inner join
-                        print("can't join tables using inlj, attempting inner join instead.")
-                        res = left_table._inner_join(right_table, condition)
-                    else:
-                        print("Results were successful using Inlj")
-                        #Swap the tables's conditions
-                        condition = column_name_right+operator+column_name_left
-                        #If the left table has an index, but right hasn't, swap and use Inlj
-                        res = right_table._inlj_join(left_table, condition)
+        # keep the names, they are needed to find the saved indexes
+        left_table_name, right_table_name = left_table, right_table
+        # like selects, joins do not lock the tables, they read the snapshot they are in (if any)
+        self._locks.acquire('database', 's')
+        try:
+            self.load_database()
+            left_table = left_table if isinstance(left_table, Table) else self._read_view(left_table)
+            right_table = right_table if isinstance(right_table, Table) else self._read_view(right_table)
+
+            if mode=='inner':
+                # get columns and operator
+                column_name_left, operator, column_name_right = left_table._parse_condition(condition, join=True)
+                #Both Index Nested-Loops Join and Sort-Merge Join can be run on equi-join/natural join
+                if (operator != "="):
+                    #Inlj needs an equi-join, but a band join (<,<=,>,>=) can still be merged after sorting
+                    print("Can't run inlj, running smj band join")
+                    res = left_table._smj_join(right_table, condition)
                 else:
-                    if left_table.pk is None or column_name_left != left_table.pk:
-                        #If only right table has an index, use inlj
-                        print("Results were successful using Inlj ")
-                        res = left_table._inlj_join(right_table, condition)
+                    #Checking if the tables can be indexed
+                    #Smj can be used iff both of the columns of the condition are indexed(have a pk)
+
+                    if right_table.pk is None or column_name_right != right_table.pk:
+                        if left_table.pk is None or column_name_left != left_table.pk:
+                            #If the tables can't be indexed, a hash join is much faster than the nested loop inner join
+                            print("can't join tables using inlj, using hash join instead.")
+                            res = left_table._hash_join(right_table, condition)
+                        else:
+                            print("Results were successful using Inlj")
+                            #Swap the tables's conditions
+                            condition = column_name_right+operator+column_name_left
+                            #If the left table has an index, but right hasn't, swap and use Inlj
+                            res = right_table._inlj_join(left_table, condition, self._get_view_index(left_table, left_table_name, column_name_left, '='))
                     else:
-                        #If the on condition is refered to both of the columns pk's,use the Smj
-
-                        print("Results were successful using Smj ")
-                        res = left_table._smj_join(right_table, condition)
-        else:
-            raise NotImplementedError
+                        if left_table.pk is None or column_name_left != left_table.pk:
+                            #If only right table has an index, use inlj
+                            print("Results were successful using Inlj ")
+                            res = left_table._inlj_join(right_table, condition, self._get_view_index(right_table, right_table_name, column_name_right, '='))
+                        else:
+                            #If the on condition is refered to both of the columns pk's,use the Smj
+
+                            print("Results were successful using Smj ")
+                            res = left_table._smj_join(right_table, condition)
+            else:
+                raise NotImplementedError
+        finally:
+            self._locks.release('database')
 
 
         '''if mode=='inlj':
@@ -471,55 +1129,132 @@ class Database:
             else:
                 res.show()
 
-    def lock_table(self, table_name, mode):
+    def lock_table(self, table_name, mode='x'):
         '''
-        Locks the specified table using the exclusive lock (X).
+        Locks the specified table, waiting until other processes release their conflicting locks.
+        Shared locks (S) keep the writers out, any number of processes can hold them at the same time (the reads of the
+        database do not need them, they read a snapshot, see snapshot).
+        Exclusive locks (X) are for writes, they conflict with every other lock of the table.
+        The database is locked in shared mode too, so that it is not saved (checkpoint) while the table is used.
 
         Args:
             table_name: string. Table name (must be part of database).
+            mode: string. The mode of the lock, 's' (shared) or 'x' (exclusive).
         '''
-        if table_name[:4]=='meta':
+        if isinstance(table_name, Table) or table_name[:4]=='meta': # meta tables are never locked (they are internal)
             return
-
-        if mode=='x':
-            self.tables['meta_locks']._update_rows(True, 'locked', f'table_name={table_name}')
-        else:
-            raise NotImplementedError
-        self._save_locks()
+        self._locks.acquire('database', 's')
+        try:
+            self._locks.acquire(table_name, mode)
+        except:
+            self._locks.release('database')
+            raise
         # print(f'Locking table "{table_name}"')
 
     def unlock_table(self, table_name):
         '''
-        Unlocks the specified table that is exclusively locked (X).
+        Releases the last lock of the specified table.
 
         Args:
             table_name: string. Table name (must be part of database).
         '''
-        self.tables['meta_locks']._update_rows(False, 'locked', f'table_name={table_name}')
-        self._save_locks()
+        if isinstance(table_name, Table) or table_name[:4]=='meta':
+            return
+        self._locks.release(table_name)
+        self._locks.release('database')
         # print(f'Unlocking table "{table_name}"')
 
     def is_locked(self, table_name):
         '''
-        Check whether the specified table is exclusively locked (X).
+        Check whether the specified table is exclusively locked (X) by another process.
 
         Args:
             table_name: string. Table name (must be part of database).
         '''
         if isinstance(table_name,Table) or table_name[:4]=='meta':  # meta tables will never be locked (they are internal)
             return False
+        res = self._locks.is_locked(table_name)
+        if res:
+            logging.info(f'Table "{table_name}" is currently locked.')
+        return res
 
-        with open(f'{self.savedir}/meta_locks.pkl', 'rb') as f:
-            self.tables.update({'meta_locks': pickle.load(f)})
+    @contextmanager
+    def snapshot(self):
+        '''
+        Read the database as it is when the snapshot is taken (multi-version concurrency control). The selects, joins
+        and exports that run inside the with block do not see the changes that are made after the snapshot was taken,
+        by other processes or by this one, and they never wait for the writers:
 
+            with db.snapshot():
+                db.select('*', 'accounts', None)
+                ...
+                db.select('*', 'accounts', None) # the same rows, even if they were updated meanwhile
+
+        Until the snapshot is closed, the tables keep the old versions of the rows that are changed and the database is
+        not saved by other processes (their changes are safe in the write-ahead log).
+        '''
+        # other processes cannot replace the table files (checkpoint) while the snapshot is open
+        self._locks.acquire('database', 's')
         try:
-            res = self.select('locked','meta_locks',  f'table_name={table_name}', return_object=True).locked[0]
-            if res:
-                logging.info(f'Table "{table_name}" is currently locked.')
-            return res
+            self.load_database()
+            self._snapshots.append(self._txid)
+            try:
+                yield self._txid
+            finally:
+                self._snapshots.pop()
+                self._vacuum()
+        finally:
+            self._locks.release('database')
+
+    def _read_view(self, table_name):
+        '''
+        Return a table as the reads of the database see it: as it was when the newest open snapshot was taken
+        (if any), else as it is now.
+
+        Args:
+            table_name: string. Table name (must be part of database).
+        '''
+        table = self.tables[table_name]
+        if not self._snapshots:
+            return table
+        return table._as_of(self._snapshots[-1])
 
-        except IndexError:
+    @contextmanager
+    def _transaction(self, table_name):
+        '''
+        Run a write to a table as a new transaction. While snapshots are open, the table keeps the versions of the
+        rows that the transaction changes, as they were before it.
+
+        Args:
+            table_name: string. Name of the table that is written (must be part of database).
+        '''
+        self._txid += 1
+        table = self.tables[table_name]
+        table._txid = self._txid if self._snapshots else None
+        try:
+            yield table
+        finally:
+            table._txid = None
+
+    def _vacuum(self):
+        '''
+        Remove the row versions of the loaded tables that no open snapshot can see.
+        '''
+        oldest_txid = self._snapshots[0] if self._snapshots else None
+        for name, table in self.tables.loaded():
+            table._vacuum(oldest_txid)
+
+    def _lock_database(self):
+        '''
+        Locks the whole database in exclusive mode, for the operations that change tables without logging
+        their changes (e.g. create or drop a table). Release it with self._locks.release('database').
+        '''
+        if self._locks.mode('database') == 's':
+            # waiting could deadlock, another process may be waiting for a table locked by this one
+            if not self._locks.acquire('database', 'x', blocking=False):
+                raise Exception('Cannot lock the database, it is used by other processes (unlock the tables locked by this one first).')
             return
+        self._locks.acquire('database', 'x')
 
     def journal(idx = None):
         if idx != None:
@@ -538,41 +1273,43 @@ class Database:
     # Important: Meta tables contain info regarding the NON meta tables ONLY.
     # i.e. meta_length will not show the number of rows in meta_locks etc.
 
-    def _update_meta_length(self):
+    def _update_meta_length(self, tables):
         '''
         Updates the meta_length table.
+
+        Args:
+            tables: list. The (non meta) tables whose records are updated.
         '''
-        for table in self.tables.values():
-            if table._name[:4]=='meta': #skip meta tables
-                continue
+        for table in tables:
             if table._name not in self.tables['meta_length'].column_by_name('table_name'): # if new table, add record with 0 no. of rows
                 self.tables['meta_length']._insert([table._name, 0])
 
             # the result needs to represent the rows that contain data. Since we use an insert_stack
-            # some rows are filled with Nones. We skip these rows.
-            non_none_rows = len([row for row in table.data if any(row)])
-            self.tables['meta_length']._update_rows(non_none_rows, 'no_of_rows', f'table_name={table._name}')
+            # some rows are filled with Nones. We skip these rows (the table keeps count of the rest).
+            self.tables['meta_length']._update_rows(table._count_rows(), 'no_of_rows', f'table_name={table._name}')
             # self.update_row('meta_length', len(table.data), 'no_of_rows', 'table_name', '==', table._name)
 
-    def _update_meta_locks(self):
+    def _update_meta_locks(self, tables):
         '''
-        Updates the meta_locks table.
+        Updates the meta_locks table (kept for compatibility, the locks are lock files, see locks.py).
+
+        Args:
+            tables: list. The (non meta) tables whose records are updated.
         '''
-        for table in self.tables.values():
-            if table._name[:4]=='meta': #skip meta tables
-                continue
+        for table in tables:
             if table._name not in self.tables['meta_locks'].column_by_name('table_name'):
 
                 self.tables['meta_locks']._insert([table._name, False])
                 # self.insert('meta_locks', [table._name, False])
 
-    def _update_meta_insert_stack(self):
+    def _update_meta_insert_stack(self, tables):
         '''
         Updates the meta_insert_stack table.
+
+        Args:
+            tables: list. The (non meta) tables whose records are updated.
         '''
-        for table in self.tables.values():
-            if table._name[:4]=='meta': #skip meta tables
-                continue
+        for table in tables:
             if table._name not in self.tables['meta_insert_stack'].column_by_name('table_name'):
                 self.tables['meta_insert_stack']._insert([table._name, []])
 
@@ -614,76 +1351,273 @@ class Database:
     def create_index(self, index_name, table_name, index_type='btree'):
         '''
         Creates an index on a specified table with a given name.
-        Important: An index can only be created on a primary key (the user does not specify the column).
+        The indexed column is specified as table_name(column_name). If only the table name is specified, the primary key is indexed.
+        Any column can be indexed, since every value of the index keeps the indexes of all the records that have it.
 
         Args:
-            table_name: string. Table name (must be part of database).
+            table_name: string. Table name (must be part of database), optionally followed by the column name in parentheses.
             index_name: string. Name of the created index.
+            index_type: string. Type of the index, 'btree' ('btree' if None) or 'hash' (only used for equality conditions).
         '''
-        if self.tables[table_name].pk_idx is None: # if no primary key, no index
-            raise Exception('Cannot create index. Table has no primary key.')
-        if index_name not in self.tables['meta_indexes'].column_by_name('index_name'):
-            # currently only btree is supported. This can be changed by adding another if.
-            if index_type=='btree':
-                logging.info('Creating Btree index.')
-                # insert a record with the name of the index and the table on which it's created to the meta_indexes table
-                self.tables['meta_indexes']._insert([table_name, index_name])
+        self._lock_database()
+        try:
+            self.load_database()
+            if index_type is None:
+                index_type = 'btree'
+            if index_type not in ('btree', 'hash'):
+                raise Exception(f'Cannot create index. Index type "{index_type}" is not supported (use btree or hash).')
+            # mdb passes the "on" part of the query as is, e.g. "takes ( id )"
+            if '(' in table_name:
+                table_name, column_name = table_name.replace(' ','').removesuffix(')').split('(')
+            else:
+                if self.tables[table_name].pk_idx is None: # if no primary key and no column, no index
+                    raise Exception('Cannot create index. Table has no primary key (specify the column as table_name(column_name)).')
+                column_name = self.tables[table_name].pk
+            if column_name not in self.tables[table_name].column_names:
+                raise Exception(f'Cannot create index. Column "{column_name}" does not exist in table "{table_name}".')
+            if index_name not in self.tables['meta_indexes'].column_by_name('index_name'):
+                logging.info(f'Creating {index_type} index.')
+                # insert a record with the name of the index, the table and the column on which it's created to the meta_indexes table
+                self.tables['meta_indexes']._insert([table_name, index_name, column_name])
                 # crate the actual index
-                self._construct_index(table_name, index_name)
+                self._construct_index(table_name, index_name, column_name, index_type)
                 self.save_database()
-        else:
-            raise Exception('Cannot create index. Another index with the same name already exists.')
+            else:
+                raise Exception('Cannot create index. Another index with the same name already exists.')
+        finally:
+            self._locks.release('database')
 
-    def _construct_index(self, table_name, index_name):
+    def _construct_index(self, table_name, index_name, column_name, index_type='btree'):
         '''
-        Construct a btree on a table and save.
+        Construct an index (btree or hash) on a table's column and save.
 
         Args:
             table_name: string. Table name (must be part of database).
             index_name: string. Name of the created index.
+            column_name: string. Name of the indexed column.
+            index_type: string. Type of the index (btree or hash).
+        '''
+        # save the index
+        self._save_index(index_name, self._build_index(table_name, column_name, index_type))
+
+    def _build_index(self, table_name, column_name, index_type='btree'):
         '''
-        bt = Btree(3) # 3 is arbitrary
+        Build and return an index (btree or hash) on a table's column, with the table's current rows.
 
-        # for each record in the primary key of the table, insert its value and index to the btree
-        for idx, key in enumerate(self.tables[table_name].column_by_name(self.tables[table_name].pk)):
-            bt.insert(key, idx)
-        # save the btree
-        self._save_index(index_name, bt)
+        Args:
+            table_name: string. Table name (must be part of database).
+            column_name: string. Name of the indexed column.
+            index_type: string. Type of the index (btree or hash).
+        '''
+        # the value and index of each record in the column (deleted rows and nulls are skipped)
+        table = self.tables[table_name]
+        column_idx = table.column_names.index(column_name)
+        column = table.column_by_name(column_name)
+        pairs = ((key, idx) for idx, key in enumerate(column) if self._is_indexed_value(table, column_idx, key))
+
+        if index_type == 'hash':
+            index = HashIndex()
+            for key, idx in pairs:
+                index.insert(key, idx)
+        else:
+            index = Btree(64) # nodes are searched with binary search, so a large branching factor keeps the tree shallow
+            index.bulk_load(pairs)
+        return index
 
 
     def _has_index(self, table_name):
         '''
-        Check whether the specified table's primary key column is indexed.
+        Check whether any of the specified table's columns is indexed.
 
         Args:
             table_name: string. Table name (must be part of database).
         '''
         return table_name in self.tables['meta_indexes'].column_by_name('table_name')
 
+    def _get_index(self, table_name, column_name, operator=None):
+        '''
+        Return the saved index of a table's column that can evaluate the operator, or None if there is no such index
+        (or the table is not part of the database, e.g. it is the result of a subquery).
+        Hash indexes are only used (and preferred) for equality, btrees for everything else.
+
+        Args:
+            table_name: string. Table name (must be part of database).
+            column_name: string. Name of the column.
+            operator: string. The operator of the condition.
+        '''
+        if isinstance(table_name, Table) or not self._has_index(table_name):
+            return None
+        indexes = self.tables['meta_indexes']._select_where('index_name,column_name', f'table_name={table_name}')
+        found = None
+        for index_name, indexed_column in indexes.data:
+            if indexed_column != column_name:
+                continue
+            index = self._load_idx(index_name)
+            if isinstance(index, HashIndex):
+                if operator == '=':
+                    return index
+            else:
+                found = index
+        return found
+
+    def _get_view_index(self, view, table_name, column_name, operator=None):
+        '''
+        Return the saved index (see _get_index) that can be used to read a view of a table (see _read_view). The indexes
+        only have the current rows, so None is returned if the view is an older snapshot of the table.
+
+        Args:
+            view: Table. The view of the table.
+            table_name: string. Table name (must be part of database).
+            column_name: string. Name of the column.
+            operator: string. The operator of the condition.
+        '''
+        if not isinstance(table_name, Table) and view is not self.tables[table_name]:
+            return None
+        return self._get_index(table_name, column_name, operator)
+
+    def _table_indexes(self, table_name):
+        '''
+        Return the name, the indexed column's index and the index object of every index of a table.
+
+        Args:
+            table_name: string. Table name (must be part of database).
+        '''
+        if table_name[:4]=='meta' or not self._has_index(table_name):
+            return []
+        column_names = self.tables[table_name].column_names
+        indexes = self.tables['meta_indexes']._select_where('index_name,column_name', f'table_name={table_name}')
+        return [(index_name, column_names.index(column_name), self._load_idx(index_name))
+                for index_name, column_name in indexes.data]
+
+    def _is_indexed_value(self, table, column_idx, value):
+        '''
+        Check whether a value is part of the indexes. Deleted rows (None) are not, and neither is 'null' in columns
+        that are not strings (it cannot be compared with their values).
+
+        Args:
+            table: Table. The indexed table.
+            column_idx: int. The index of the indexed column.
+            value: any. The value of the column.
+        '''
+        return value is not None and (value != 'null' or table.column_types[column_idx] == str)
+
+    def _index_insert(self, index_name, index, table, column_idx, row):
+        '''
+        Add a row to an index (if its value is indexed) and mark the index as modified.
+
+        Args:
+            index_name: string. Name of the index.
+            index: obj. The index object (btree or hash index object).
+            table: Table. The indexed table.
+            column_idx: int. The index of the indexed column.
+            row: int. The index of the row.
+        '''
+        value = table.data[row][column_idx]
+        if self._is_indexed_value(table, column_idx, value):
+            index.insert(value, row)
+            self._dirty_indexes.add(index_name)
+
+    def _index_delete(self, index_name, index, table, column_idx, row, value):
+        '''
+        Remove a row from an index (if its value is indexed) and mark the index as modified.
+
+        Args:
+            index_name: string. Name of the index.
+            index: obj. The index object (btree or hash index object).
+            table: Table. The indexed table.
+            column_idx: int. The index of the indexed column.
+            row: int. The index of the row.
+            value: any. The value of the row that is part of the index.
+        '''
+        if self._is_indexed_value(table, column_idx, value):
+            index.delete(value, row)
+            self._dirty_indexes.add(index_name)
+
+    def _upgrade_meta_indexes(self):
+        '''
+        Add the column_name column to a meta_indexes table that was saved before indexes could be created on any column.
+        The indexes of such a database are on the primary keys.
+        '''
+        meta_indexes = self.tables.get('meta_indexes')
+        if meta_indexes is None or 'column_name' in meta_indexes.column_names:
+            return
+        meta_indexes.column_names.append('column_name')
+        meta_indexes.column_types.append(str)
+        setattr(meta_indexes, 'column_name', [])
+        for row in meta_indexes.data:
+            row.append(self.tables[row[0]].pk if row[0] in self.tables else None)
+        meta_indexes._modified()
+
     def _save_index(self, index_name, index):
         '''
         Save the index object.
 
         Args:
             index_name: string. Name of the created index.
-            index: obj. The actual index object (btree object).
+            index: obj. The actual index object (btree or hash index object).
         '''
         try:
             os.mkdir(f'{self.savedir}/indexes')
         except:
             pass
 
-        with open(f'{self.savedir}/indexes/meta_{index_name}_index.pkl', 'wb') as f:
-            pickle.dump(index, f)
+        path = self._index_path(index_name, index)
+        self._write_index(index, path)
+        stat = os.stat(path)
+        self._indexes[index_name] = ((stat.st_mtime_ns, stat.st_size), index)
+
+    def _index_path(self, index_name, index=None):
+        '''
+        Return the path of an index's file. Btrees are stored in pages (idx files), hash indexes are pickled (pkl files).
+
+        Args:
+            index_name: string. Name of the index.
+            index: obj. The index object (btree or hash index object). If None, the path of the existing file.
+        '''
+        path = f'{self.savedir}/indexes/meta_{index_name}_index'
+        if index is None:
+            return f'{path}.idx' if os.path.isfile(f'{path}.idx') else f'{path}.pkl'
+        return f'{path}.idx' if isinstance(index, Btree) else f'{path}.pkl'
+
+    def _write_index(self, index, path, in_place=False):
+        '''
+        Write an index object to a file.
+
+        Args:
+            index: obj. The index object (btree or hash index object).
+            path: string. The path of the file.
+            in_place: boolean. If True, the changes of a btree read from an index file are written to the double-write
+                      file of that file (see pager.NodePages.write).
+        '''
+        if isinstance(index, Btree):
+            write_btree(index, path, in_place)
+        else:
+            with open(path, 'wb') as f:
+                pickle.dump(index, f)
 
     def _load_idx(self, index_name):
         '''
-        Load and return the specified index.
+        Load and return the specified index. Indexes are cached, the file is only read again if it changed on disk.
+        The nodes of btrees are read from their file when they are used.
 
         Args:
             index_name: string. Name of created index.
         '''
-        f = open(f'{self.savedir}/indexes/meta_{index_name}_index.pkl', 'rb')
-        index = pickle.load(f)
-        f.close()
+        path = self._index_path(index_name)
+        stat = os.stat(path)
+        if index_name in self._indexes and self._indexes[index_name][0] == (stat.st_mtime_ns, stat.st_size):
+            return self._indexes[index_name][1]
+        if path.endswith('.idx'):
+            index = read_btree(path)
+        else:
+            f = open(path, 'rb')
+            index = pickle.load(f)
+            f.close()
+            # btrees pickled by older versions keep the rows in other slots of their leaves, so they are built again
+            # from the table (and stored in pages by the next checkpoint)
+            if isinstance(index, Btree):
+                table_name, column_name = self.tables['meta_indexes']._select_where('table_name,column_name', f'index_name={index_name}').data[0]
+                index = self._build_index(table_name, column_name)
+                self._dirty_indexes.add(index_name)
+        self._indexes[index_name] = ((stat.st_mtime_ns, stat.st_size), index)
         return index
\ No newline at end of file
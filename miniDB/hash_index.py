@@ -0,0 +1,149 @@
+'''
+https://en.wikipedia.org/wiki/Linear_hashing
+'''
+from zlib import crc32
+
+class HashIndex:
+    '''
+    Hash index abstraction (linear hashing). Only supports equality (=) lookups, which cost O(1).
+
+    The values are spread in buckets by their hash. When the buckets get too full, a single bucket is split in two
+    (the next one in order, not necessarily the full one), so the index grows one bucket at a time
+    instead of rehashing everything at once. It shrinks the same way when values are removed.
+    '''
+    def __init__(self, no_of_buckets=8, max_load=2):
+        '''
+        Args:
+            no_of_buckets: int. The initial (and minimum) number of buckets.
+            max_load: int. The maximum average number of values per bucket, the buckets are split above it.
+        '''
+        self.no_of_buckets = no_of_buckets # initial number of buckets
+        self.max_load = max_load
+        self.level = 0 # the number of times the initial buckets have been doubled
+        self.next = 0 # the index of the next bucket to be split
+        self.size = 0 # the number of (distinct) values in the index
+        # every bucket is a list of [value, ptrs] pairs. Like the btree, every value has the list of the ptrs
+        # (e.g. the indexes) of all the records with that value
+        self.buckets = [[] for _ in range(no_of_buckets)]
+
+    def _hash(self, value):
+        '''
+        Hash of a value that does not change between runs (python randomizes the hash of strings),
+        since the index is saved to a file.
+
+        Args:
+            value: any. The hashed value.
+        '''
+        if isinstance(value, str):
+            return crc32(value.encode())
+        return hash(value)
+
+    def _bucket(self, value):
+        '''
+        Returns the index of the bucket that the given value exists or should exist in.
+
+        Args:
+            value: any. The value being searched for.
+        '''
+        h = self._hash(value)
+        idx = h % (self.no_of_buckets * 2**self.level)
+        # the buckets before next have already been split, so the next level decides the bucket
+        if idx < self.next:
+            idx = h % (self.no_of_buckets * 2**(self.level+1))
+        return idx
+
+    def insert(self, value, ptr):
+        '''
+        Insert the value and its ptr to the index.
+
+        Args:
+            value: any. The input value.
+            ptr: int. The ptr of the inserted value (e.g. its index).
+        '''
+        bucket = self.buckets[self._bucket(value)]
+        for entry in bucket:
+            if entry[0] == value:
+                entry[1].append(ptr)
+                return
+        bucket.append([value, [ptr]])
+        self.size += 1
+        if self.size > self.max_load*len(self.buckets):
+            self._split()
+
+    def delete(self, value, ptr):
+        '''
+        Remove a ptr of a value (and the value, if it was its last ptr).
+        Returns False if the value/ptr pair is not part of the index.
+
+        Args:
+            value: any. The value of the removed record.
+            ptr: int. The ptr of the removed record (e.g. its index).
+        '''
+        bucket = self.buckets[self._bucket(value)]
+        for position, entry in enumerate(bucket):
+            if entry[0] == value:
+                if ptr not in entry[1]:
+                    return False
+                entry[1].remove(ptr)
+                if not entry[1]:
+                    bucket.pop(position)
+                    self.size -= 1
+                    if len(self.buckets) > self.no_of_buckets and self.size < self.max_load*len(self.buckets)//4:
+                        self._merge()
+                return True
+        return False
+
+    def _split(self):
+        '''
+        Add a bucket and move to it the values of the bucket with index=next that belong to it.
+        '''
+        old_idx = self.next
+        entries = self.buckets[old_idx]
+        self.buckets[old_idx] = []
+        self.buckets.append([])
+        self.next += 1
+        # every bucket of the level has been split, the next level starts
+        if self.next == self.no_of_buckets * 2**self.level:
+            self.level += 1
+            self.next = 0
+        # the values either stay in the old bucket or move to the new one
+        for entry in entries:
+            self.buckets[self._bucket(entry[0])].append(entry)
+
+    def _merge(self):
+        '''
+        Remove the last bucket, moving its values back to the bucket it was split from (the opposite of _split).
+        '''
+        if self.next == 0:
+            self.level -= 1
+            self.next = self.no_of_buckets * 2**self.level
+        self.next -= 1
+        self.buckets[self.next].extend(self.buckets.pop())
+
+    def find(self, operator, value, return_ops=False):
+        '''
+        Return the ptrs of the elements with value equal to the supplied value.
+
+        Args:
+            operator: string. The provided evaluation operator (only = is supported).
+            value: any. The value being searched for.
+            return_ops: boolean. Set to True if you want to use the number of operations (for benchmarking).
+        '''
+        if operator != '=':
+            raise ValueError(f'Hash indexes only support equality (=), not "{operator}".')
+        results = []
+        ops = 0 # number of operations (comparisons). Used for benchmarking
+        for entry in self.buckets[self._bucket(value)]:
+            ops += 1
+            if entry[0] == value:
+                results = list(entry[1])
+                break
+        if return_ops:
+            return results, ops
+        return results
+
+    def __contains__(self, value):
+        '''
+        Check whether any record has the supplied value.
+        '''
+        return any(entry[0] == value for entry in self.buckets[self._bucket(value)])
@@ -0,0 +1,111 @@
+'''
+Shared (S) and exclusive (X) locks that work across processes, using advisory file locks (fcntl.flock).
+Every locked name (a table, the database or the write-ahead log) has its own lock file.
+'''
+import os
+import logging
+try:
+    import fcntl
+except ImportError: # e.g. on windows, the locks only work inside a single process
+    fcntl = None
+
+
+class LockManager:
+    '''
+    The locks held by this process. Locks are re-entrant: a name can be locked more than once (e.g. by an operation
+    that runs another one) and it is unlocked when every lock has been released. A shared lock can be upgraded to
+    an exclusive one, which is downgraded again when the exclusive lock is released.
+    '''
+    def __init__(self, directory):
+        '''
+        Args:
+            directory: string. The directory of the lock files.
+        '''
+        self.directory = directory
+        self.held = {} # name -> (lock file, list of the modes it is locked with, in order)
+        if fcntl is None:
+            logging.warning('fcntl is not available, tables are only locked inside this process.')
+
+    def _flock(self, f, mode, blocking=True):
+        '''
+        Lock an (open) lock file with the given mode ('s' or 'x'). Returns False if it is locked by another process
+        and blocking is False.
+        '''
+        if fcntl is None:
+            return True
+        operation = fcntl.LOCK_EX if mode == 'x' else fcntl.LOCK_SH
+        try:
+            fcntl.flock(f.fileno(), operation if blocking else operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def mode(self, name):
+        '''
+        Return the mode ('s' or 'x') that this process holds a name with (None if it is not locked).
+
+        Args:
+            name: string. The locked name.
+        '''
+        if name not in self.held:
+            return None
+        return 'x' if 'x' in self.held[name][1] else 's'
+
+    def acquire(self, name, mode='x', blocking=True):
+        '''
+        Lock a name. Waits until other processes release conflicting locks, unless blocking is False,
+        in which case it returns False if the lock cannot be acquired at once.
+
+        Args:
+            name: string. The locked name.
+            mode: string. 's' (shared, e.g. for reads) or 'x' (exclusive, e.g. for writes).
+            blocking: boolean. Whether to wait for the lock.
+        '''
+        if mode not in ('s', 'x'):
+            raise ValueError(f'Lock mode must be "s" or "x", not "{mode}".')
+        held_mode = self.mode(name)
+        if held_mode is None:
+            os.makedirs(self.directory, exist_ok=True)
+            f = open(f'{self.directory}/{name}.lock', 'a+')
+            if not self._flock(f, mode, blocking):
+                f.close()
+                return False
+            self.held[name] = (f, [mode])
+            return True
+
+        f, modes = self.held[name]
+        if held_mode == 's' and mode == 'x' and not self._flock(f, 'x', blocking):
+            # the upgrade releases the shared lock first, so it is acquired again
+            self._flock(f, 's')
+            return False
+        modes.append(mode)
+        return True
+
+    def release(self, name):
+        '''
+        Release the last lock of a name.
+
+        Args:
+            name: string. The locked name.
+        '''
+        f, modes = self.held[name]
+        mode = self.mode(name)
+        modes.pop()
+        if not modes:
+            # closing the file releases the lock
+            f.close()
+            del self.held[name]
+        elif mode == 'x' and self.mode(name) == 's':
+            self._flock(f, 's')
+
+    def is_locked(self, name):
+        '''
+        Check whether another process holds an exclusive lock on a name (so it cannot be read).
+
+        Args:
+            name: string. The locked name.
+        '''
+        if name in self.held or fcntl is None or not os.path.isfile(f'{self.directory}/{name}.lock'):
+            return False
+        with open(f'{self.directory}/{name}.lock', 'a+') as f:
+            return not self._flock(f, 's', blocking=False)
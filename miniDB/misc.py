@@ -1,21 +1,71 @@
 import operator
+import re
+import numpy as np
+
+# symbol -> function of the supported operators (built once, not on every comparison)
+op_funcs = {'>': operator.gt,
+            '<': operator.lt,
+            '>=': operator.ge,
+            '<=': operator.le,
+            '=': operator.eq,
+            # b is the (low, high) pair, both ends are included. & works for both values and arrays
+            'between': lambda a, b: (b[0] <= a) & (a <= b[1])}
 
 def get_op(op, a, b):
     '''
     Get op as a function of a and b by using a symbol
     '''
-    ops = {'>': operator.gt,
-                '<': operator.lt,
-                '>=': operator.ge,
-                '<=': operator.le,
-                '=': operator.eq}
-
     try:
-        return ops[op](a,b)
+        return op_funcs[op](a,b)
     except TypeError:  # if a or b is None (deleted record), python3 raises typerror
         return False
 
+def compile_op(op, b):
+    '''
+    Get op as a function of a only, for a fixed b (behaves like get_op, but the operator is looked up once)
+    '''
+    op_func = op_funcs[op]
+
+    def compiled_op(a):
+        try:
+            return op_func(a, b)
+        except TypeError:  # if a or b is None (deleted record), python3 raises typerror
+            return False
+
+    return compiled_op
+
+def get_op_mask(op, values, b, valid=None):
+    '''
+    Evaluate op for every value of a column at once and return a boolean mask.
+    Typed (numeric) arrays are compared with a single numpy operation, the positions that are not valid never match.
+    Object arrays are compared with a single numpy operation too, unless some values cannot be compared with b.
+    Anything else (lists, object arrays with uncomparable values) is evaluated with a compiled op.
+    '''
+    if isinstance(values, np.ndarray) and values.dtype != object:
+        mask = op_funcs[op](values, b)
+        return mask & valid if valid is not None else mask
+
+    if isinstance(values, np.ndarray):
+        # deleted records (None) never match, everything else (even 'null') is compared like get_op does
+        present = values != None
+        try:
+            result = op_funcs[op](values[present], b)
+        except TypeError:
+            result = None
+        if isinstance(result, np.ndarray) and result.dtype == bool:
+            mask = np.zeros(len(values), dtype=bool)
+            mask[present] = result
+            return mask
+
+    compiled_op = compile_op(op, b)
+    return np.fromiter((compiled_op(a) for a in values), dtype=bool, count=len(values))
+
 def split_condition(condition):
+    # 'column between low and high' returns (low, high) as the value (checked before removing the whitespaces)
+    between = re.fullmatch(r'\s*(\S+)\s+between\s+(.+?)\s+and\s+(.+?)\s*', condition, flags=re.IGNORECASE)
+    if between:
+        return between.group(1), 'between', (between.group(2), between.group(3))
+
     condition = condition.replace(' ','') # remove all whitespaces
     ops = {'>=': operator.ge,
            '<=': operator.le,
@@ -27,3 +77,21 @@ def split_condition(condition):
         splt=condition.split(op_key)
         if len(splt)>1:
             return splt[0], op_key, splt[1]
+
+# the literals that infer_type accepts as numbers (plain decimals, without spaces, underscores, nan or inf)
+INT_LITERAL = re.compile(r'[+-]?\d+', re.ASCII)
+FLOAT_LITERAL = re.compile(r'[+-]?(\d+\.\d*|\.\d+|\d+)([eE][+-]?\d+)?', re.ASCII)
+
+def infer_type(values):
+    '''
+    Return the narrowest type (int, float or str) that all the values (strings) can be casted to.
+    Only plain decimal literals are numbers (e.g. 'nan', 'inf', '1_000' and ' 12 ' are strings).
+    Empty and null values are ignored (str if no value is left).
+    '''
+    values = [value for value in values if value not in ('', 'null')]
+    if not values:
+        return str
+    for candidate, literal in ((int, INT_LITERAL), (float, FLOAT_LITERAL)):
+        if all(literal.fullmatch(value) for value in values):
+            return candidate
+    return str
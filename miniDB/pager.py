@@ -0,0 +1,664 @@
+'''
+Page based storage of the rows of large tables.
+
+The rows are stored in a heap file of fixed size pages. Every page is a slotted page: a header with the number of slots,
+the slot array (offset and length of every row in the page) and the (pickled) rows, filled from the end of the page.
+A row directory (a separate file) keeps the page and slot of every row, so rows keep their index when they move.
+
+The heap file is read through mmap and the pages that are read are kept in a buffer pool (LRU), so only the pages
+that are used are read and only a bounded number of them is kept in memory. Modified pages are kept in memory (pinned)
+until the next checkpoint, when only they (and the changed entries of the row directory) are written to the files.
+
+The files are changed in place through double-write files (see write_patches): the changes are first written to
+a separate file, which is on the disk before the checkpoint is logged, and only then to the files themselves. If the
+process crashes while the files are being changed, the double-write file is applied again when the checkpoint is
+finished (see Database._finish_checkpoint), so a file is never left with only some of its changes.
+
+The nodes of the btree indexes are stored the same way (see NodePages): every node is stored in one or more
+consecutive pages of an index file and a node directory maps the id of every node to its pages, so a lookup
+only reads the nodes on its path.
+'''
+import mmap
+import os
+import pickle
+import shutil
+import struct
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import count
+from btree import Btree, Node
+
+PAGE_SIZE = 8192
+PAGE_HEADER = struct.Struct('<H') # number of slots
+SLOT = struct.Struct('<HH') # offset and length of the row in the page
+# an entry of the row directory: the page and the slot of a row
+ENTRY_SIZE = 8
+# a double-write file starts with the size of the changed file, then has the offset and length of every change
+PATCHES_HEADER = struct.Struct('<q')
+PATCH = struct.Struct('<qI')
+
+
+class Page:
+    '''
+    A decoded page: its rows (None for free slots) and the size of each pickled row.
+    '''
+    def __init__(self, rows=None, sizes=None):
+        self.rows = rows if rows is not None else []
+        self.sizes = sizes if sizes is not None else []
+        self.used = PAGE_HEADER.size + SLOT.size*len(self.rows) + sum(self.sizes)
+
+    def fits(self, size, slot=None):
+        '''
+        Check whether a pickled row of the given size fits in the page (in a new slot, or replacing the row of slot).
+        '''
+        if slot is None:
+            return self.used + SLOT.size + size <= PAGE_SIZE
+        return self.used - self.sizes[slot] + size <= PAGE_SIZE
+
+    def set(self, slot, row, size):
+        '''
+        Set the row of a slot (a new slot if slot is equal to the number of slots).
+        '''
+        if slot == len(self.rows):
+            self.rows.append(row)
+            self.sizes.append(size)
+            self.used += SLOT.size + size
+        else:
+            self.used += size - self.sizes[slot]
+            self.rows[slot] = row
+            self.sizes[slot] = size
+
+    def encode(self):
+        '''
+        Return the bytes of the page.
+        '''
+        page = bytearray(PAGE_SIZE)
+        PAGE_HEADER.pack_into(page, 0, len(self.rows))
+        end = PAGE_SIZE
+        for slot, row in enumerate(self.rows):
+            payload = pickle.dumps(row) if row is not None else b''
+            end -= len(payload)
+            page[end:end+len(payload)] = payload
+            SLOT.pack_into(page, PAGE_HEADER.size + slot*SLOT.size, end, len(payload))
+        return bytes(page)
+
+    @classmethod
+    def decode(cls, page):
+        '''
+        Return the page stored in the given bytes.
+        '''
+        rows = []
+        sizes = []
+        no_of_slots = PAGE_HEADER.unpack_from(page, 0)[0]
+        for slot in range(no_of_slots):
+            offset, size = SLOT.unpack_from(page, PAGE_HEADER.size + slot*SLOT.size)
+            rows.append(pickle.loads(page[offset:offset+size]) if size else None)
+            sizes.append(size)
+        return cls(rows, sizes)
+
+
+class BufferPool:
+    '''
+    Keeps the most recently used (clean) pages of all the heap files in memory, up to a number of pages.
+    '''
+    def __init__(self, capacity):
+        '''
+        Args:
+            capacity: int. The maximum number of pages kept.
+        '''
+        self.capacity = capacity
+        self.pages = OrderedDict() # (heap file id, page number) -> page, least recently used first
+
+    def get(self, heap, page_no):
+        '''
+        Return a page of a heap file, reading it if it is not in the pool.
+
+        Args:
+            heap: PagedRows. The rows of the heap file.
+            page_no: int. The number of the page.
+        '''
+        key = (heap.id, page_no)
+        page = self.pages.get(key)
+        if page is not None:
+            self.pages.move_to_end(key)
+            return page
+        page = heap._read_page(page_no)
+        self.pages[key] = page
+        if len(self.pages) > self.capacity:
+            self.pages.popitem(last=False)
+        return page
+
+
+class PagedRows:
+    '''
+    The rows of a table, stored in a heap file. It is used like the list of rows of a table (Table.data):
+    rows can be read, replaced and appended by their index. A row that is read is not a part of the page,
+    so it has to be assigned back (data[i] = row) after it is modified.
+    '''
+    _ids = count()
+
+    def __init__(self, heap_path, rows_path, buffer_pool, split_directory=False):
+        '''
+        Args:
+            heap_path: string. The path of the heap file.
+            rows_path: string. The path of the row directory file.
+            buffer_pool: BufferPool. The pool that keeps the pages read.
+            split_directory: boolean. If True, the row directory has all the page numbers, then all the slots (written
+                             by older versions), else the page and slot of every row (see write_directory).
+        '''
+        self.id = next(self._ids)
+        self.heap_path = heap_path
+        self.rows_path = rows_path
+        self.buffer_pool = buffer_pool
+        # the page and slot of every row
+        with open(rows_path, 'rb') as f:
+            directory = array('i', f.read())
+        if split_directory:
+            self.pages, self.slots = directory[:len(directory)//2], directory[len(directory)//2:]
+        else:
+            self.pages, self.slots = directory[0::2], directory[1::2]
+        # the directory of older versions is written again (in the current layout) by the next checkpoint
+        self.split_directory = split_directory
+        # modified pages (page number -> page), kept until they are written by a checkpoint
+        self.dirty_pages = {}
+        # the rows that moved to another page and the number of rows in the row directory file
+        self.moved_rows = set()
+        self.written_rows = len(self.pages)
+        self._open()
+
+    def _open(self):
+        '''
+        Map the heap file to memory.
+        '''
+        self.no_of_pages = os.path.getsize(self.heap_path)//PAGE_SIZE
+        self.mmap = None
+        if self.no_of_pages:
+            with open(self.heap_path, 'rb') as f:
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read_page(self, page_no):
+        '''
+        Read a page from the heap file.
+        '''
+        return Page.decode(self.mmap[page_no*PAGE_SIZE:(page_no+1)*PAGE_SIZE])
+
+    def _page(self, page_no):
+        '''
+        Return a page, the modified ones first.
+        '''
+        page = self.dirty_pages.get(page_no)
+        if page is None:
+            page = self.buffer_pool.get(self, page_no)
+        return page
+
+    def _total_pages(self):
+        return max(self.no_of_pages, max(self.dirty_pages, default=-1)+1)
+
+    def _place(self, row):
+        '''
+        Store a row in the last page (or in a new one if it does not fit) and return its page and slot.
+        '''
+        payload_size = len(pickle.dumps(row))
+        if PAGE_HEADER.size + SLOT.size + payload_size > PAGE_SIZE:
+            raise ValueError(f'Row is too large ({payload_size} bytes) for a page of {PAGE_SIZE} bytes.')
+        page_no = self._total_pages()-1
+        page = self._page(page_no) if page_no >= 0 else None
+        if page is None or not page.fits(payload_size):
+            page_no += 1
+            page = Page()
+        page.set(len(page.rows), row, payload_size)
+        self.dirty_pages[page_no] = page
+        return page_no, len(page.rows)-1
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        page = self._page(self.pages[idx])
+        # a copy, so that changes to the row are not changes to the page
+        return list(page.rows[self.slots[idx]])
+
+    def __setitem__(self, idx, row):
+        if idx < 0:
+            idx += len(self)
+        page_no, slot = self.pages[idx], self.slots[idx]
+        page = self._page(page_no)
+        payload_size = len(pickle.dumps(row))
+        if page.fits(payload_size, slot):
+            page.set(slot, list(row), payload_size)
+            self.dirty_pages[page_no] = page
+        else:
+            # the row grew too large for its page, it moves to the last page and its slot is freed
+            page.set(slot, None, 0)
+            self.dirty_pages[page_no] = page
+            self.pages[idx], self.slots[idx] = self._place(list(row))
+            self.moved_rows.add(idx)
+
+    def append(self, row):
+        page_no, slot = self._place(list(row))
+        self.pages.append(page_no)
+        self.slots.append(slot)
+
+    def __iter__(self):
+        page_no, page = None, None
+        for idx in range(len(self)):
+            if self.pages[idx] != page_no:
+                page_no = self.pages[idx]
+                page = self._page(page_no)
+            yield list(page.rows[self.slots[idx]])
+
+    def write(self, heap_path, rows_path, in_place=False):
+        '''
+        Write the heap file and the row directory: a copy of the current ones with the modified pages and entries.
+        In place, only the changes are written, to the double-write files of the current ones (<file>.dw, see
+        write_patches), which change the files when they are applied.
+
+        Args:
+            heap_path: string. The path of the written heap file (ignored in place).
+            rows_path: string. The path of the written row directory file (ignored in place).
+            in_place: boolean. If True, the changes of the current files are written.
+        '''
+        heap_patches = [(page_no*PAGE_SIZE, self.dirty_pages[page_no].encode()) for page_no in sorted(self.dirty_pages)]
+        # the heap file never shrinks, so the pages of the current one that other processes mapped stay valid
+        heap_size = self._total_pages()*PAGE_SIZE
+        if in_place:
+            write_patches(f'{self.heap_path}.dw', heap_patches, heap_size)
+            write_patches(f'{self.rows_path}.dw', self._directory_patches(), ENTRY_SIZE*len(self))
+            return
+
+        shutil.copyfile(self.heap_path, heap_path)
+        with open(heap_path, 'r+b') as f:
+            _patch_file(f.fileno(), heap_patches, heap_size)
+        write_directory(self.pages, self.slots, rows_path)
+
+    def _directory_patches(self):
+        '''
+        Return the changes of the row directory file: the entries of the rows that moved and of the new rows.
+        '''
+        if self.split_directory:
+            return [(0, _directory_bytes(self.pages, self.slots))]
+        patches = [(ENTRY_SIZE*idx, _directory_bytes(self.pages[idx:idx+1], self.slots[idx:idx+1]))
+                   for idx in sorted(self.moved_rows) if idx < self.written_rows]
+        if len(self) > self.written_rows:
+            patches.append((ENTRY_SIZE*self.written_rows,
+                            _directory_bytes(self.pages[self.written_rows:], self.slots[self.written_rows:])))
+        return patches
+
+    def checkpointed(self):
+        '''
+        The written files replaced (or changed) the old ones: map the heap file again and keep the modified pages as
+        clean ones.
+        '''
+        if self.mmap is not None:
+            self.mmap.close()
+        self._open()
+        for page_no, page in self.dirty_pages.items():
+            self.buffer_pool.pages[(self.id, page_no)] = page
+        self.dirty_pages = {}
+        self.split_directory = False
+        self.moved_rows = set()
+        self.written_rows = len(self)
+
+
+def write_rows(rows, heap_path, rows_path):
+    '''
+    Write a heap file and a row directory file from a list of rows.
+
+    Args:
+        rows: list. The rows.
+        heap_path: string. The path of the written heap file.
+        rows_path: string. The path of the written row directory file.
+    '''
+    pages, slots = array('i'), array('i')
+    with open(heap_path, 'wb') as f:
+        page = Page()
+        page_no = 0
+        for row in rows:
+            payload_size = len(pickle.dumps(row))
+            if PAGE_HEADER.size + SLOT.size + payload_size > PAGE_SIZE:
+                raise ValueError(f'Row is too large ({payload_size} bytes) for a page of {PAGE_SIZE} bytes.')
+            if not page.fits(payload_size):
+                f.write(page.encode())
+                page = Page()
+                page_no += 1
+            page.set(len(page.rows), row, payload_size)
+            pages.append(page_no)
+            slots.append(len(page.rows)-1)
+        if page.rows:
+            f.write(page.encode())
+    write_directory(pages, slots, rows_path)
+
+
+def write_directory(pages, slots, rows_path):
+    '''
+    Write the row directory (the page and the slot of every row, one after the other).
+    '''
+    with open(rows_path, 'wb') as f:
+        f.write(_directory_bytes(pages, slots))
+
+
+def _directory_bytes(pages, slots):
+    '''
+    Return the bytes of the entries of the row directory with the given pages and slots.
+    '''
+    directory = array('i', bytes(ENTRY_SIZE*len(pages)))
+    directory[0::2] = pages
+    directory[1::2] = slots
+    return directory.tobytes()
+
+
+def write_patches(path, patches, size):
+    '''
+    Write a double-write file: the changes of a file, which are applied to it by apply_patches.
+    Writing the changes twice (here, then to the file) makes changing the file in place safe from crashes:
+    applying the changes again has the same result, so an interrupted apply_patches can simply be run again.
+
+    Args:
+        path: string. The path of the double-write file (<file>.dw).
+        patches: list. The changes, as (offset, bytes) pairs.
+        size: int. The size of the changed file.
+    '''
+    with open(path, 'wb') as f:
+        f.write(PATCHES_HEADER.pack(size))
+        for offset, payload in patches:
+            f.write(PATCH.pack(offset, len(payload)))
+            f.write(payload)
+
+
+def apply_patches(patches_path, path):
+    '''
+    Apply the changes of a double-write file (see write_patches) to a file and flush the file to the disk.
+
+    Args:
+        patches_path: string. The path of the double-write file.
+        path: string. The path of the changed file.
+    '''
+    with open(patches_path, 'rb') as f:
+        content = f.read()
+    size = PATCHES_HEADER.unpack_from(content)[0]
+    position = PATCHES_HEADER.size
+    patches = []
+    while position < len(content):
+        offset, length = PATCH.unpack_from(content, position)
+        position += PATCH.size
+        patches.append((offset, content[position:position+length]))
+        position += length
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+        _patch_file(fd, patches, size)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _patch_file(fd, patches, size):
+    '''
+    Write the changes (offset, bytes) to a file and set its size.
+    '''
+    os.ftruncate(fd, size)
+    for offset, payload in patches:
+        os.pwrite(fd, payload, offset)
+
+
+def remove_files(*paths):
+    '''
+    Remove the given files, if they exist (e.g. the files left by an interrupted checkpoint).
+    '''
+    for path in paths:
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+NODE_PAGE_SIZE = 4096
+INDEX_MAGIC = b'MDBIDX'
+INDEX_VERSION = 1
+# magic bytes, version, branching factor, root (-1 if empty), number of nodes, first page of the directory, unused pages
+INDEX_HEADER = struct.Struct(f'<{len(INDEX_MAGIC)}sHiqqqq')
+# the number of (unmodified) nodes of an index kept in memory
+NODE_CACHE_SIZE = 1024
+
+
+class NodePages:
+    '''
+    The nodes of a btree, stored in an index file. It is used like the list of nodes of a tree (Btree.nodes):
+    nodes are read when they are first used and the most recently used ones are kept in memory.
+
+    The nodes that are read while the tree is changed (see changes) are considered modified and are kept in memory
+    until they are written to the index file by the next checkpoint.
+    '''
+    def __init__(self, path, cache_size=NODE_CACHE_SIZE):
+        '''
+        Args:
+            path: string. The path of the index file.
+            cache_size: int. The maximum number of unmodified nodes kept in memory.
+        '''
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # node id -> node, least recently used first
+        self.dirty = {} # node id -> node (None for removed nodes)
+        self.changing = 0 # if more than 0, the nodes that are read are marked as modified
+        self._open()
+
+    def _open(self):
+        '''
+        Map the index file to memory and read its header and node directory.
+        '''
+        with open(self.path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.b, root, no_of_nodes, self.directory_page, self.unused_pages = INDEX_HEADER.unpack_from(self.mmap)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f'"{self.path}" is not an index file.')
+        if version > INDEX_VERSION:
+            raise ValueError(f'"{self.path}" was written by a newer version (index format {version}).')
+        self.root = root if root >= 0 else None
+        # the first page and the number of pages of every node (-1 and 0 for removed nodes)
+        position = self.directory_page*NODE_PAGE_SIZE
+        self.starts = array('q', self.mmap[position:position+8*no_of_nodes])
+        self.sizes = array('i', self.mmap[position+8*no_of_nodes:position+12*no_of_nodes])
+
+    @contextmanager
+    def changes(self):
+        '''
+        Context in which the tree is changed: every node read is marked as modified.
+        '''
+        self.changing += 1
+        try:
+            yield
+        finally:
+            self.changing -= 1
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, node_id):
+        if node_id in self.dirty:
+            return self.dirty[node_id]
+        node = self.cache.get(node_id)
+        if node is not None:
+            self.cache.move_to_end(node_id)
+        elif self.starts[node_id] >= 0:
+            start = self.starts[node_id]*NODE_PAGE_SIZE
+            size = struct.unpack_from('<I', self.mmap, start)[0]
+            node = _decode_node(self.mmap[start+4:start+4+size], self.b)
+            self.cache[node_id] = node
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        if self.changing:
+            self.cache.pop(node_id, None)
+            self.dirty[node_id] = node
+        return node
+
+    def __setitem__(self, node_id, node):
+        self.cache.pop(node_id, None)
+        self.dirty[node_id] = node
+
+    def append(self, node):
+        self.starts.append(-1)
+        self.sizes.append(0)
+        self.dirty[len(self.starts)-1] = node
+
+    def __iter__(self):
+        for node_id in range(len(self)):
+            yield self[node_id]
+
+    def write(self, path, root, in_place=False):
+        '''
+        Write the index file: a copy of the current one with the modified nodes (nodes that grew out of their pages
+        move to the end of the file). In place, only the changes are written, to the double-write file of the current
+        one (see PagedRows.write). When more than half of the pages are unused, the whole file is written again
+        (to path, also in place).
+
+        Args:
+            path: string. The path of the written index file.
+            root: int. The id of the root node.
+            in_place: boolean. If True, the changes of the current file are written.
+        '''
+        if 2*self.unused_pages > self.directory_page:
+            write_nodes(self, self.b, root, path)
+            return
+
+        starts, sizes = array('q', self.starts), array('i', self.sizes)
+        unused_pages = self.unused_pages
+        end = self.directory_page # the directory is written again after the nodes
+        patches = []
+        for node_id in sorted(self.dirty):
+            node = self.dirty[node_id]
+            if node is None:
+                unused_pages += sizes[node_id]
+                starts[node_id], sizes[node_id] = -1, 0
+                continue
+            payload = _encode_node(node)
+            no_of_pages = -(-len(payload)//NODE_PAGE_SIZE)
+            if no_of_pages > sizes[node_id]:
+                unused_pages += sizes[node_id]
+                starts[node_id], sizes[node_id] = end, no_of_pages
+                end += no_of_pages
+            patches.append((starts[node_id]*NODE_PAGE_SIZE, payload))
+        position = end*NODE_PAGE_SIZE
+        if end == self.directory_page and len(starts) == len(self.starts):
+            # the directory stays where it is, only the entries of the modified nodes change
+            for node_id in sorted(self.dirty):
+                patches.append((position + 8*node_id, starts[node_id:node_id+1].tobytes()))
+                patches.append((position + 8*len(starts) + 4*node_id, sizes[node_id:node_id+1].tobytes()))
+        else:
+            patches.append((position, starts.tobytes() + sizes.tobytes()))
+        patches.append((0, INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.b, _root(root), len(starts), end, unused_pages)))
+        # the directory only moves forward and never has fewer nodes, so the file never shrinks
+        size = position + 12*len(starts)
+        if in_place:
+            write_patches(f'{self.path}.dw', patches, size)
+            return
+
+        shutil.copyfile(self.path, path)
+        with open(path, 'r+b') as f:
+            _patch_file(f.fileno(), patches, size)
+
+    def checkpointed(self):
+        '''
+        The written file replaced (or changed) the old one: map the index file again and keep the modified nodes as
+        unmodified ones.
+        '''
+        self.mmap.close()
+        self._open()
+        for node_id, node in self.dirty.items():
+            if node is not None:
+                self.cache[node_id] = node
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        self.dirty = {}
+
+
+def _root(root):
+    return root if root is not None else -1
+
+
+def _encode_node(node):
+    '''
+    Return the bytes of a node (their size, then the pickled node), padded to whole pages.
+    '''
+    payload = pickle.dumps((node.values, node.ptrs, node.left_sibling, node.right_sibling, node.parent, node.is_leaf))
+    payload = struct.pack('<I', len(payload)) + payload
+    return payload + bytes(-len(payload) % NODE_PAGE_SIZE)
+
+
+def _decode_node(payload, b):
+    '''
+    Return the node stored in the given bytes (without their size).
+    '''
+    values, ptrs, left_sibling, right_sibling, parent, is_leaf = pickle.loads(payload)
+    return Node(b, values, ptrs, left_sibling, right_sibling, parent, is_leaf)
+
+
+def _write_directory(f, page, starts, sizes):
+    '''
+    Write the node directory (the first pages, then the number of pages of all the nodes) at the given page.
+    '''
+    f.seek(page*NODE_PAGE_SIZE)
+    f.write(starts.tobytes())
+    f.write(sizes.tobytes())
+    f.truncate()
+
+
+def write_nodes(nodes, b, root, path):
+    '''
+    Write an index file with the given nodes.
+
+    Args:
+        nodes: list. The nodes of the tree (None for removed nodes).
+        b: int. The branching factor of the tree.
+        root: int. The id of the root node.
+        path: string. The path of the written index file.
+    '''
+    starts, sizes = array('q'), array('i')
+    end = 1 # the first page is the header
+    with open(path, 'wb') as f:
+        f.write(bytes(NODE_PAGE_SIZE))
+        for node in nodes:
+            if node is None:
+                starts.append(-1)
+                sizes.append(0)
+                continue
+            payload = _encode_node(node)
+            starts.append(end)
+            sizes.append(len(payload)//NODE_PAGE_SIZE)
+            f.write(payload)
+            end += sizes[-1]
+        _write_directory(f, end, starts, sizes)
+        f.seek(0)
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, b, _root(root), len(starts), end, 0))
+
+
+def write_btree(btree, path, in_place=False):
+    '''
+    Write a btree to an index file (only its modified nodes, if it was read from one).
+
+    Args:
+        btree: Btree. The tree.
+        path: string. The path of the written index file.
+        in_place: boolean. If True, the modified nodes of a btree read from an index file are written to the
+                  double-write file of that file, instead of to path (see NodePages.write).
+    '''
+    if isinstance(btree.nodes, NodePages):
+        btree.nodes.write(path, btree.root, in_place)
+    else:
+        write_nodes(btree.nodes, btree.b, btree.root, path)
+
+
+def read_btree(path):
+    '''
+    Return the btree of an index file (its nodes are read when they are used).
+
+    Args:
+        path: string. The path of the index file.
+    '''
+    nodes = NodePages(path)
+    btree = Btree(nodes.b)
+    btree.nodes = nodes
+    btree.root = nodes.root
+    return btree
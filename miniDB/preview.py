@@ -16,7 +16,7 @@ def preview(dirname='dbdata', plot=False):
 
     labels = [name for name in os.listdir(dirname) if os.path.isdir(dirname+'/'+name)]
     if labels == []:
-        labels = [name for name in os.listdir(dirname) if name.endswith('.pkl')]
+        labels = [name for name in os.listdir(dirname) if name.endswith('.tbl')]
         table_flag = True
     sizes = []
 
@@ -0,0 +1,381 @@
+'''
+Binary table file format.
+
+A table file starts with a fixed header (magic bytes, format version and the size of the schema), followed by:
+    - the schema, as json (name, column names/types/extras, primary key, number of rows and of live (not deleted) rows, the encoding and size of every column chunk)
+    - a bitmap of the deleted rows (rows filled with Nones)
+    - one chunk per column, in the order of the columns
+
+The key indexes of the table (the hash indexes of the primary key and the unique columns) are pickled in a key index
+file (<name>.keys), so that they are not built again (reading every row) when the table is loaded. The file starts with
+a header (magic bytes and the size of the pickled indexes) and the indexes, followed by the (pickled) lists of the
+changes made to them since, so a checkpoint only appends the latest changes.
+
+Large tables (PAGED_TABLE_ROWS rows or more) are paged: their table file only has the schema and their rows are kept
+in a heap file (<name>.heap) and a row directory (<name>.rows), which are read a page at a time (see pager.py).
+
+Checkpoints write table files in place (see write_table): only the modified pages of the heap file, the changed entries
+of the row directory and the changes of the key indexes are written, through double-write files.
+
+Column chunks are encoded according to the values of the column:
+    - 'int64', 'float64', 'bool': a bitmap of the null values, then the values as a numpy array (0 for nulls and deleted rows)
+    - 'str': the character offsets of the values (int64), then all the values as a single utf-8 string
+    - 'pickle': the pickled list of the values (any other column, e.g. lists or values of mixed types)
+'''
+import builtins
+import gc
+import io
+import json
+import os
+import pickle
+import struct
+import numpy as np
+from table import Table
+from pager import PagedRows, BufferPool, write_rows, write_patches
+
+MAGIC = b'MDBTBL'
+VERSION = 1
+# magic bytes, version, size of the schema in bytes
+HEADER = struct.Struct(f'<{len(MAGIC)}sHI')
+KEYS_MAGIC = b'MDBKEY'
+# magic bytes, size of the pickled key indexes in bytes
+KEYS_HEADER = struct.Struct(f'<{len(KEYS_MAGIC)}sQ')
+
+NUMPY_TYPES = {int: ('int64', np.int64), float: ('float64', np.float64), bool: ('bool', np.bool_)}
+
+# tables with at least this many rows are paged (the meta tables are never paged)
+PAGED_TABLE_ROWS = 10000
+# the number of pages kept in memory by the buffer pool of a database (8KB each)
+BUFFER_POOL_PAGES = 4096
+
+
+def heap_paths(path):
+    '''
+    Return the paths of the heap file and the row directory of a paged table.
+
+    Args:
+        path: string. The path of the table file (e.g. 'x.tbl' or 'x.tbl.tmp').
+    '''
+    base, _, suffix = path.rpartition('.tbl')
+    return f'{base}.heap{suffix}', f'{base}.rows{suffix}'
+
+
+def keys_path(path):
+    '''
+    Return the path of the key index file of a table.
+
+    Args:
+        path: string. The path of the table file (e.g. 'x.tbl' or 'x.tbl.tmp').
+    '''
+    base, _, suffix = path.rpartition('.tbl')
+    return f'{base}.keys{suffix}'
+
+
+def is_paged(table):
+    '''
+    Check whether a table is (or will be, when it is written) paged.
+
+    Args:
+        table: Table. The table.
+    '''
+    if isinstance(table.data, PagedRows):
+        return True
+    return table._name[:4] != 'meta' and len(table.data) >= PAGED_TABLE_ROWS
+
+
+def write_table(table, path, in_place=False):
+    '''
+    Write a table to a file using the binary table format.
+
+    Args:
+        table: Table. The table to be written.
+        path: string. The path of the file.
+        in_place: boolean. If True, path is the temporary file of the table's file (<file>.tmp) written by a checkpoint,
+                  and the files that can be changed in place are: the changes of the key index file and, if the
+                  table was read from the file, of the heap file and the row directory are written to their
+                  double-write files (see pager.write_patches) instead of writing the files again.
+    '''
+    _write_key_indexes(table, keys_path(path), in_place)
+    if is_paged(table):
+        _write_paged_table(table, path, in_place)
+        return
+
+    no_of_rows = len(table.data)
+    deleted = np.fromiter((all(value is None for value in row) for row in table.data), dtype=bool, count=no_of_rows)
+
+    columns = []
+    chunks = []
+    for column_idx, column_type in enumerate(table.column_types):
+        # assign instead of np.array, so that list values (e.g. the insert stacks) are not turned into dimensions
+        values = np.empty(no_of_rows, dtype=object)
+        values[:] = [row[column_idx] for row in table.data]
+        encoding, chunk = _encode_column(values, column_type, deleted)
+        columns.append({'encoding': encoding, 'size': len(chunk)})
+        chunks.append(chunk)
+
+    with open(path, 'wb') as f:
+        _write_schema(f, table, {'no_of_rows': no_of_rows, 'live_rows': no_of_rows - int(deleted.sum()), 'columns': columns})
+        f.write(np.packbits(deleted).tobytes())
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def _write_paged_table(table, path, in_place=False):
+    '''
+    Write a paged table: the heap file and the row directory, then the table file (only the schema).
+
+    Args:
+        table: Table. The table to be written.
+        path: string. The path of the table file.
+        in_place: boolean. If True, the changes of the heap file and the row directory are written (see write_table).
+    '''
+    heap_path, rows_path = heap_paths(path)
+    if isinstance(table.data, PagedRows):
+        # only the modified pages are written, the rest are copied from the current heap file (or kept, in place)
+        in_place = in_place and (table.data.heap_path, table.data.rows_path) == heap_paths(path.removesuffix('.tmp'))
+        table.data.write(heap_path, rows_path, in_place)
+    else:
+        write_rows(table.data, heap_path, rows_path)
+
+    with open(path, 'wb') as f:
+        _write_schema(f, table, {'paged': True, 'directory': 'pairs', 'no_of_rows': len(table.data),
+                                 'live_rows': table._count_rows()})
+
+
+def _write_key_indexes(table, path, in_place=False):
+    '''
+    Write the key indexes of a table (they are built first, if they were not used since the table was loaded).
+    In place, only the changes made to them since the key index file was read or written are appended to it,
+    unless the changes would make the file more than twice the size of the indexes (then it is written again).
+
+    Args:
+        table: Table. The table.
+        path: string. The path of the key index file.
+        in_place: boolean. If True, path is the temporary file of the key index file (see write_table).
+    '''
+    key_columns = table._key_columns()
+    if not key_columns:
+        return
+    key_indexes = {column_idx: table._key_index(column_idx) for column_idx in key_columns}
+    # None if the indexes were built (again) since the file was read or written
+    changes = getattr(table, '_key_changes', None)
+    table._key_changes = []
+
+    if in_place and changes is not None:
+        current_path = path.removesuffix('.tmp')
+        indexes_size = _key_indexes_size(current_path)
+        if indexes_size is not None:
+            size = os.path.getsize(current_path)
+            payload = pickle.dumps(changes) if changes else b''
+            if size + len(payload) <= 2*(KEYS_HEADER.size + indexes_size):
+                if payload:
+                    write_patches(f'{current_path}.dw', [(size, payload)], size + len(payload))
+                return
+
+    payload = pickle.dumps(key_indexes)
+    with open(path, 'wb') as f:
+        f.write(KEYS_HEADER.pack(KEYS_MAGIC, len(payload)))
+        f.write(payload)
+
+
+def _key_indexes_size(path):
+    '''
+    Return the size of the pickled key indexes of a key index file (None if there is no file, or if it was written by
+    an older version, which only has the pickled indexes).
+
+    Args:
+        path: string. The path of the key index file.
+    '''
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        header = f.read(KEYS_HEADER.size)
+    if len(header) < KEYS_HEADER.size:
+        return None
+    magic, indexes_size = KEYS_HEADER.unpack(header)
+    return indexes_size if magic == KEYS_MAGIC else None
+
+
+def _write_schema(f, table, extra):
+    '''
+    Write the header and the schema of a table file.
+
+    Args:
+        f: file. The table file.
+        table: Table. The table.
+        extra: dict. The entries of the schema that describe the data.
+    '''
+    schema = {'name': table._name,
+              'column_names': table.column_names,
+              'column_types': [column_type.__name__ for column_type in table.column_types],
+              'column_extras': table.column_extras,
+              'pk': table.pk,
+              'pk_idx': table.pk_idx,
+              **extra}
+    schema = json.dumps(schema).encode()
+    f.write(HEADER.pack(MAGIC, VERSION, len(schema)))
+    f.write(schema)
+
+
+def _encode_column(values, column_type, deleted):
+    '''
+    Return the encoding and the bytes of a column chunk.
+
+    Args:
+        values: np.ndarray. The values of the column (object array).
+        column_type: type. The type of the column.
+        deleted: np.ndarray. The bitmap of the deleted rows.
+    '''
+    nulls = (values == 'null') & ~deleted
+    present = ~deleted & ~nulls
+    types = set(map(type, values[present]))
+
+    if column_type in NUMPY_TYPES and types <= {column_type}:
+        encoding, dtype = NUMPY_TYPES[column_type]
+        try:
+            array = np.where(present, values, 0).astype(dtype)
+            return encoding, np.packbits(nulls).tobytes() + array.tobytes()
+        except OverflowError: # ints that do not fit in 64 bits are pickled
+            pass
+
+    # in string columns 'null' is stored like every other string
+    if column_type == str and set(map(type, values[~deleted])) <= {str}:
+        strings = np.where(deleted, '', values).tolist()
+        offsets = np.zeros(len(strings)+1, dtype=np.int64)
+        np.cumsum([len(string) for string in strings], out=offsets[1:])
+        return 'str', offsets.tobytes() + ''.join(strings).encode()
+
+    return 'pickle', pickle.dumps(values.tolist())
+
+
+def _decode_column(encoding, chunk, no_of_rows):
+    '''
+    Return the values of a column chunk as a list (deleted rows are not set to None yet).
+
+    Args:
+        encoding: string. The encoding of the chunk.
+        chunk: bytes. The bytes of the chunk.
+        no_of_rows: int. The number of rows of the table.
+    '''
+    if encoding == 'pickle':
+        return pickle.loads(chunk)
+
+    if encoding == 'str':
+        offsets = np.frombuffer(chunk, dtype=np.int64, count=no_of_rows+1).tolist()
+        text = chunk[(no_of_rows+1)*8:].decode()
+        return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    bitmap_size = (no_of_rows+7)//8
+    nulls = np.unpackbits(np.frombuffer(chunk, dtype=np.uint8, count=bitmap_size), count=no_of_rows).astype(bool)
+    values = np.frombuffer(chunk, dtype=dict(NUMPY_TYPES.values())[encoding], offset=bitmap_size, count=no_of_rows).tolist()
+    for row in np.flatnonzero(nulls).tolist():
+        values[row] = 'null'
+    return values
+
+
+def read_table(path, buffer_pool=None):
+    '''
+    Read a table from a file written by write_table.
+
+    Args:
+        path: string. The path of the file.
+        buffer_pool: BufferPool. The pool that keeps the pages of paged tables (a new one if None).
+    '''
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    magic, version, schema_size = HEADER.unpack_from(content)
+    if magic != MAGIC:
+        raise ValueError(f'"{path}" is not a table file.')
+    if version > VERSION:
+        raise ValueError(f'"{path}" was written by a newer version (table format {version}).')
+    position = HEADER.size
+    schema = json.loads(content[position:position+schema_size])
+    position += schema_size
+
+    if schema.get('paged'):
+        # the rows are read from the heap file when they are used
+        # the row directories of older versions have all the page numbers, then all the slots
+        rows = PagedRows(*heap_paths(path), buffer_pool or BufferPool(BUFFER_POOL_PAGES), schema.get('directory') != 'pairs')
+        table = _table_from_schema(schema, rows)
+        _read_key_indexes(table, keys_path(path))
+        return table
+
+    no_of_rows = schema['no_of_rows']
+    bitmap_size = (no_of_rows+7)//8
+    deleted = np.unpackbits(np.frombuffer(content, dtype=np.uint8, count=bitmap_size, offset=position), count=no_of_rows)
+    position += bitmap_size
+
+    # the garbage collector would scan all the objects every few thousand new rows, but none of them is garbage
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        columns = []
+        for column in schema['columns']:
+            columns.append(_decode_column(column['encoding'], content[position:position+column['size']], no_of_rows))
+            position += column['size']
+
+        data = list(map(list, zip(*columns))) if columns else [[] for _ in range(no_of_rows)]
+        for row in np.flatnonzero(deleted).tolist():
+            data[row] = [None for _ in schema['column_names']]
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    table = _table_from_schema(schema, data)
+    _read_key_indexes(table, keys_path(path))
+    return table
+
+
+def _read_key_indexes(table, path):
+    '''
+    Read the key indexes of a table from its key index file (if any, else they are built when they are first needed).
+
+    Args:
+        table: Table. The table.
+        path: string. The path of the key index file.
+    '''
+    if not os.path.isfile(path):
+        return
+    with open(path, 'rb') as f:
+        content = f.read()
+    if not content.startswith(KEYS_MAGIC):
+        # written by an older version, the next checkpoint writes it again
+        table._key_indexes = pickle.loads(content)
+        return
+
+    indexes_size = KEYS_HEADER.unpack_from(content)[1]
+    f = io.BytesIO(content)
+    f.seek(KEYS_HEADER.size)
+    table._key_indexes = pickle.load(f)
+    # the changes appended by checkpoints, as (column index, 'insert' or 'delete', value, index of the row)
+    while f.tell() < len(content):
+        for column_idx, operation, value, rowid in pickle.load(f):
+            getattr(table._key_indexes[column_idx], operation)(value, rowid)
+    table._key_changes = []
+
+
+def _table_from_schema(schema, data):
+    '''
+    Return the table described by a schema, with the given rows.
+
+    Args:
+        schema: dict. The schema of the table file.
+        data: list or PagedRows. The rows of the table.
+    '''
+    # the attributes of the columns (table.column_name) that tables created by Table() have. Like Table() does, they are
+    # set before the state of the table, so that a column named like an attribute (e.g. data) does not replace it
+    state = {column_name: [] for column_name in schema['column_names']}
+    state.update({'_name': schema['name'],
+                  'column_names': schema['column_names'],
+                  'columns': [[] for _ in schema['column_names']],
+                  'column_types': [getattr(builtins, column_type) for column_type in schema['column_types']],
+                  'column_extras': schema['column_extras'],
+                  'pk': schema['pk'],
+                  'pk_idx': schema['pk_idx'],
+                  'data': data,
+                  '_dirty': False})
+    table = Table(load=state)
+    # files written by older versions do not have the number of rows that are not deleted (they are counted when needed)
+    table._live_rows = schema.get('live_rows')
+    return table
@@ -3,8 +3,11 @@ from tabulate import tabulate
 import pickle
 import os
 import math
+from itertools import islice
+import numpy as np
 from btree import Btree
-from misc import get_op, split_condition
+from hash_index import HashIndex
+from misc import get_op, get_op_mask, split_condition
 
 
 class Table:
@@ -30,6 +33,15 @@ class Table:
             # if load is a dict, replace the object dict with it (replaces the object with the specified one)
             if isinstance(load, dict):
                 self.__dict__.update(load)
+                # the cached column arrays, key indexes, row versions and number of rows (if any) belong to the table
+                # the dict was copied from
+                self._column_arrays = {}
+                self._key_indexes = {}
+                self._key_changes = None
+                self._live_rows = None
+                self._txid = None
+                self._versions = {}
+                self._row_xmin = {}
                 # self._update()
             # if load is str, load from a file
             elif isinstance(load, str):
@@ -71,13 +83,273 @@ class Table:
                     raise ValueError(f'{val}\' is not a valid keyword!')
             print(column_extras) #if we remove this the whole project doent work
             self.column_extras = column_extras #column extras has to be initialised
+            # a new table has never been saved, so it is dirty
+            self._dirty = True
+            self._column_arrays = {}
+            self._key_indexes = {}
+            # the changes of the key indexes since they were read from (or written to) a file, None if they were built
+            # after that (see storage.py)
+            self._key_changes = None
+            # the number of rows that are not deleted (None until they are first counted, see _count_rows)
+            self._live_rows = None
+            # the transaction that is writing to the table. While it is set (snapshots are open, see Database.snapshot)
+            # the old versions of the rows it changes are kept, as (xmin, xmax, row) in _versions, and the transaction
+            # that created the current version of a changed row is kept in _row_xmin (0 for the rows that did not change)
+            self._txid = None
+            self._versions = {}
+            self._row_xmin = {}
             # self._update()
 
     # if any of the name, columns_names and column types are none. return an empty table object
 
+    def __getstate__(self):
+        '''
+        Return the state that is pickled. The cached column arrays are left out, since they are rebuilt from data.
+        '''
+        state = self.__dict__.copy()
+        state.pop('_column_arrays', None)
+        # the row versions only exist while the snapshots of a process are open
+        state.pop('_txid', None)
+        state.pop('_versions', None)
+        state.pop('_row_xmin', None)
+        return state
+
+    def __setstate__(self, state):
+        '''
+        Restore a pickled table. It has no row versions.
+        '''
+        self.__dict__.update(state)
+        # tables pickled by older versions do not have the number of rows
+        self._live_rows = state.get('_live_rows')
+        self._txid = None
+        self._versions = {}
+        self._row_xmin = {}
+
     def column_by_name(self, column_name):
         return [row[self.column_names.index(column_name)] for row in self.data]
 
+    def column_array(self, column_name):
+        '''
+        Return a column as a typed numpy array and its validity bitmap (False for null values and deleted rows).
+        int, float and bool columns are stored as int64, float64 and bool arrays, all other columns as object arrays
+        (as are columns that contain values of the wrong type). Invalid positions of typed arrays hold 0.
+
+        The arrays are a cache of the column (the rows stay in data), built the first time the column is scanned.
+        Inserts, updates and deletes write the rows they change to the cached arrays (see _modified), so repeated
+        scans do not copy the column again. The returned arrays are read only views of the cache.
+
+        Args:
+            column_name: string. Name of column.
+        '''
+        if not hasattr(self, '_column_arrays'): # tables loaded from pkl files do not have the cache
+            self._column_arrays = {}
+        if column_name not in self._column_arrays:
+            self._column_arrays[column_name] = self._build_column_array(column_name)
+
+        array, valid, length = self._column_arrays[column_name]
+        array, valid = array[:length], valid[:length]
+        array.flags.writeable = False
+        valid.flags.writeable = False
+        return array, valid
+
+    def _build_column_array(self, column_name):
+        '''
+        Return the cached arrays of a column (see column_array): the array, the validity bitmap and the number of rows
+        (the arrays have room for more rows, so that inserted rows are added without copying them).
+
+        Args:
+            column_name: string. Name of column.
+        '''
+        column_idx = self.column_names.index(column_name)
+        column_type = self.column_types[column_idx]
+        # assign instead of np.array, so that list values (e.g. the insert stacks) are not turned into dimensions
+        array = np.empty(len(self.data), dtype=object)
+        array[:] = [row[column_idx] for row in self.data]
+        valid = (array != None) & (array != 'null')
+
+        dtype = {int: np.int64, float: np.float64, bool: np.bool_}.get(column_type)
+        if dtype is not None and set(map(type, array[valid])) <= {column_type}:
+            try:
+                array = np.where(valid, array, 0).astype(dtype)
+            except OverflowError: # ints that do not fit in 64 bits stay in the object array
+                pass
+        return [array, valid, len(array)]
+
+    def _update_column_arrays(self, rowids):
+        '''
+        Write the given rows to the cached column arrays. The arrays of a column are dropped (and built again when they
+        are next used) if a value does not fit in them, e.g. a value of the wrong type in a typed array.
+
+        Args:
+            rowids: list. The indexes of the rows that changed (or were added).
+        '''
+        for column_name, cached in list(self._column_arrays.items()):
+            array, valid, length = cached
+            column_idx = self.column_names.index(column_name)
+            column_type = self.column_types[column_idx]
+            for rowid in rowids:
+                if rowid >= len(array):
+                    # the capacity is doubled, so that appending rows one at a time copies the arrays rarely
+                    capacity = max(2*len(array), rowid+1, 16)
+                    array = np.concatenate([array, np.zeros(capacity - len(array), dtype=array.dtype)])
+                    valid = np.concatenate([valid, np.zeros(capacity - len(valid), dtype=bool)])
+                value = self.data[rowid][column_idx]
+                is_valid = value is not None and not (isinstance(value, str) and value == 'null')
+                if array.dtype != object and is_valid and type(value) is not column_type:
+                    del self._column_arrays[column_name]
+                    break
+                try:
+                    array[rowid] = value if is_valid or array.dtype == object else 0
+                except OverflowError: # an int that does not fit in 64 bits
+                    del self._column_arrays[column_name]
+                    break
+                valid[rowid] = is_valid
+                length = max(length, rowid+1)
+            else:
+                cached[:] = [array, valid, length]
+
+    def _where_rows(self, condition):
+        '''
+        Return the indexes of the rows where condition is met, evaluating the condition on the whole column at once.
+
+        Args:
+            condition: string. A condition using the following format:
+                'column[<,<=,==,>=,>]value' or
+                'value[<,<=,==,>=,>]column'.
+
+                Operatores supported: (<,<=,==,>=,>)
+        '''
+        column_name, operator, value = self._parse_condition(condition)
+        array, valid = self.column_array(column_name)
+        if array.dtype != object and isinstance(value, str):
+            # comparing with 'null', which is not part of the typed array
+            mask = get_op_mask(operator, self.column_by_name(column_name), value)
+        else:
+            mask = get_op_mask(operator, array, value, valid)
+        return np.flatnonzero(mask).tolist()
+
+    def _count_rows(self):
+        '''
+        Return the number of rows that are not deleted (filled with Nones). The rows are only counted the first time
+        (e.g. for tables saved by older versions), then the count is kept up to date by inserts and deletes.
+        '''
+        if getattr(self, '_live_rows', None) is None:
+            self._live_rows = sum(1 for row in self.data if any(value is not None for value in row))
+        return self._live_rows
+
+    def _key_columns(self):
+        '''
+        Return the indexes of the columns whose values must be unique (the primary key and the unique columns).
+        '''
+        unique = [i for i, extra in enumerate(self.column_extras) if extra == 'unique'] if len(self.column_extras) == len(self.column_names) else []
+        return sorted({self.pk_idx, *unique} - {None})
+
+    def _key_index(self, column_idx):
+        '''
+        Return a hash index of a primary key or unique column, used to check for duplicate values in O(1).
+        The index is saved with the table (see storage.py) or built the first time it is needed, then it is kept up to
+        date by inserts, updates and deletes. It is only built again if the rows move (order_by) or change type (cast).
+
+        Args:
+            column_idx: int. The index of the column.
+        '''
+        if not hasattr(self, '_key_indexes'): # tables loaded from pkl files do not have the key indexes
+            self._key_indexes = {}
+        if column_idx not in self._key_indexes:
+            index = HashIndex()
+            for rowid, row in enumerate(self.data):
+                if row[column_idx] is not None: # deleted row
+                    index.insert(row[column_idx], rowid)
+            self._key_indexes[column_idx] = index
+            self._key_changes = None
+        return self._key_indexes[column_idx]
+
+    def _key_changed(self, column_idx, operation, value, rowid):
+        '''
+        Keep a change of a key index, so that the next checkpoint only writes the changes (see storage.py).
+
+        Args:
+            column_idx: int. The index of the column.
+            operation: string. 'insert' or 'delete'.
+            value: any. The value of the column.
+            rowid: int. The index of the row.
+        '''
+        if getattr(self, '_key_changes', None) is not None:
+            self._key_changes.append((column_idx, operation, value, rowid))
+
+    def _modified(self, rowids=None):
+        '''
+        Mark the table as modified. The table needs to be saved and its cached column arrays have to follow the change.
+
+        Args:
+            rowids: list. The indexes of the rows that changed (or were added), they are written to the cached column
+                    arrays. If None (e.g. the rows moved), the cached arrays are dropped.
+        '''
+        self._dirty = True
+        if rowids is None or not hasattr(self, '_column_arrays'):
+            self._column_arrays = {}
+        elif self._column_arrays:
+            self._update_column_arrays(rowids)
+
+    def _save_version(self, rowid):
+        '''
+        Keep the current version of a row (None if the row does not exist yet), before the transaction that is writing
+        to the table changes it. Nothing is kept if no transaction is set (no snapshot is open).
+
+        Args:
+            rowid: int. The index of the row.
+        '''
+        txid = getattr(self, '_txid', None)
+        if txid is None:
+            return
+        row = list(self.data[rowid]) if rowid < len(self.data) else None
+        self._versions.setdefault(rowid, []).append((self._row_xmin.get(rowid, 0), txid, row))
+        self._row_xmin[rowid] = txid
+
+    def _as_of(self, txid):
+        '''
+        Return the table as it was when the transaction with the given id was the last one (a snapshot).
+        The table itself is returned if none of its rows changed since then.
+
+        Args:
+            txid: int. The id of the transaction.
+        '''
+        changed = [rowid for rowid, xmin in getattr(self, '_row_xmin', {}).items() if xmin > txid]
+        if not changed:
+            return self
+        data = list(self.data)
+        empty = [None for _ in self.column_names]
+        for rowid in changed:
+            # the newest version that was created before the snapshot
+            for xmin, xmax, row in reversed(self._versions[rowid]):
+                if xmin <= txid:
+                    data[rowid] = row if row is not None else empty
+                    break
+        # the rows that were appended after the snapshot did not exist
+        while data and data[-1] is empty:
+            data.pop()
+        table = Table(load={key: value for key, value in self.__dict__.items() if key != 'data'})
+        table.data = data
+        return table
+
+    def _vacuum(self, oldest_txid=None):
+        '''
+        Remove the row versions that no open snapshot can see (every version, if no snapshot is open).
+
+        Args:
+            oldest_txid: int. The id of the transaction of the oldest open snapshot (None if there are none).
+        '''
+        if oldest_txid is None:
+            self._versions = {}
+            self._row_xmin = {}
+            return
+        for rowid in list(getattr(self, '_versions', {})):
+            # a version is dead if it was replaced before the oldest snapshot was taken
+            self._versions[rowid] = [version for version in self._versions[rowid] if version[1] > oldest_txid]
+            if not self._versions[rowid]:
+                del self._versions[rowid]
+                del self._row_xmin[rowid]
+
     def _update(self):
         '''
         Update all the available columns with the appended rows.
@@ -98,9 +370,15 @@ class Table:
         column_idx = self.column_names.index(column_name)
         # for every column's value in each row, replace it with itself but casted as the specified type
         for i in range(len(self.data)):
-            self.data[i][column_idx] = cast_type(self.data[i][column_idx])
+            # the row is assigned back, since the rows of large tables are copies of the stored ones
+            self._save_version(i)
+            row = self.data[i]
+            row[column_idx] = cast_type(row[column_idx])
+            self.data[i] = row
         # change the type of the column
         self.column_types[column_idx] = cast_type
+        self._modified()
+        self._key_indexes = {} # the values of the key indexes changed type
         # self._update()
 
     def _insert(self, row, insert_stack=[]):
@@ -111,7 +389,41 @@ class Table:
             row: list. A list of values to be inserted (will be casted to a predifined type automatically).
             insert_stack: list. The insert stack (empty by default).
         '''
+        self._check_row(row)
+        return self._store_row(row, insert_stack)
+
+    def _insert_many(self, rows, insert_stack=[]):
+        '''
+        Insert a batch of rows to table. Every row is checked before any of them is inserted,
+        so either all of the rows are inserted or none (if any of them is not valid).
+        Returns the indexes of the inserted rows.
+
+        Args:
+            rows: list. A list of rows (lists of values, will be casted to a predifined type automatically).
+            insert_stack: list. The insert stack (empty by default). Its slots are used from the last one.
+        '''
+        # the key values of the batch, so that the rows of the batch do not have duplicate keys either
+        batch_keys = {}
+        for row in rows:
+            self._check_row(row, batch_keys)
+
+        insert_stack = list(insert_stack)
+        rowids = []
+        for row in rows:
+            rowids.append(self._store_row(row, insert_stack))
+            if insert_stack:
+                insert_stack.pop()
+        return rowids
+
+    def _check_row(self, row, batch_keys=None):
+        '''
+        Cast the values of a row (in place) and check that it can be inserted (number of values, primary key,
+        not null and unique constraints).
 
+        Args:
+            row: list. A list of values to be inserted.
+            batch_keys: dict. The key values of the rows of the same batch (column index -> set of values), if any.
+        '''
         if len(row) != len(self.column_names):
             raise ValueError(f'ERROR -> Cannot insert {len(row)} values. Only {len(self.column_names)} columns exist')
 
@@ -124,25 +436,46 @@ class Table:
             #     raise ValueError(f'ERROR -> Value {row[i]} of type {type(row[i])} is not of type {self.column_types[i]}.')
 
             # if value is to be appended to the primary_key column, check that it doesnt alrady exist (no duplicate primary keys)
-            if i == self.pk_idx and row[i] in self.column_by_name(self.pk):
-                raise ValueError(f'## ERROR -> Value {row[i]} already exists in primary key column.')
+            if i == self.pk_idx:
+                if row[i] in self._key_index(i) or (batch_keys is not None and row[i] in batch_keys.get(i, ())):
+                    raise ValueError(f'## ERROR -> Value {row[i]} already exists in primary key column.')
             if len(self.column_extras) == len(row):   #for not nul
                 if self.column_extras[i] == 'not null' and row[i] == 'null':
                     raise ValueError(f'Value {row[i]} can not be NULL.')
-                if self.column_extras[i] == 'unique': # Search unique using btree
-                    if len(self.column_by_name(self.column_names[i]))>0:
-                        btree = Btree(2)
-                        for btree_ptr_index, record_value in enumerate(self.column_by_name(self.column_names[i])):
-                            btree.insert(str(record_value),btree_ptr_index)
-                        if btree.find("=",row[i]) != []:
-                            raise ValueError(f'This Value {row[i]} already exists.')
+                if self.column_extras[i] == 'unique': # Search unique using the hash index of the column
+                    if row[i] in self._key_index(i) or (batch_keys is not None and row[i] in batch_keys.get(i, ())):
+                        raise ValueError(f'This Value {row[i]} already exists.')
+
+            if batch_keys is not None and i in getattr(self, '_key_indexes', {}):
+                batch_keys.setdefault(i, set()).add(row[i])
+
+    def _store_row(self, row, insert_stack=[]):
+        '''
+        Store a (checked) row and return its index.
 
+        Args:
+            row: list. The row to be stored.
+            insert_stack: list. The insert stack (empty by default).
+        '''
+        # the slots of the insert stack are deleted rows, so a row is added either way
+        if getattr(self, '_live_rows', None) is not None:
+            self._live_rows += 1
         # if insert_stack is not empty, append to its last index
         if insert_stack != []:
-            self.data[insert_stack[-1]] = row
+            rowid = insert_stack[-1]
+            self._save_version(rowid)
+            self.data[rowid] = row
         else:  # else append to the end
+            rowid = len(self.data)
+            self._save_version(rowid)
             self.data.append(row)
+        for column_idx, index in getattr(self, '_key_indexes', {}).items():
+            index.insert(row[column_idx], rowid)
+            self._key_changed(column_idx, 'insert', row[column_idx], rowid)
+        self._modified([rowid])
         # self._update()
+        # the index of the inserted row (used to keep the indexes of the table up to date)
+        return rowid
 
     def _update_rows(self, set_value, set_column, condition):
         '''
@@ -157,19 +490,43 @@ class Table:
 
                 Operatores supported: (<,<=,==,>=,>)
         '''
-        # parse the condition
-        column_name, operator, value = self._parse_condition(condition)
+        self._set_rows(self._where_rows(condition), set_value, set_column)
 
-        # get the condition and the set column
-        column = self.column_by_name(column_name)
+    def _set_rows(self, rows, set_value, set_column):
+        '''
+        Replace the value of a column in the specified rows.
+
+        Args:
+            rows: list. The indexes of the rows to be altered.
+            set_value: string. The provided set value.
+            set_column: string. The column to be altered.
+        '''
+        # get the set column
         set_column_idx = self.column_names.index(set_column)
+        # cast the set value like _insert does, so that every column holds values of its type
+        if set_value != 'null':
+            set_value = self.column_types[set_column_idx](set_value)
 
         # set_columns_indx = [self.column_names.index(set_column_name) for set_column_name in set_column_names]
 
-        # for each value in column, if condition, replace it with set_value
-        for row_ind, column_value in enumerate(column):
-            if get_op(operator, column_value, value):
-                self.data[row_ind][set_column_idx] = set_value
+        # for each row, replace the value with set_value
+        for row_ind in rows:
+            # only mark the table as dirty if a value actually changes (the meta tables are
+            # "updated" after every statement, most of the time with the values they already have)
+            row = self.data[row_ind]
+            if row[set_column_idx] != set_value:
+                self._save_version(row_ind)
+                # the row moves from the old to the new value in the key index of the column (if any)
+                if set_column_idx in getattr(self, '_key_indexes', {}):
+                    key_index = self._key_indexes[set_column_idx]
+                    key_index.delete(row[set_column_idx], row_ind)
+                    key_index.insert(set_value, row_ind)
+                    self._key_changed(set_column_idx, 'delete', row[set_column_idx], row_ind)
+                    self._key_changed(set_column_idx, 'insert', set_value, row_ind)
+                row[set_column_idx] = set_value
+                # assigned back, since the rows of large tables are copies of the stored ones
+                self.data[row_ind] = row
+                self._modified([row_ind])
 
         # self._update()
         # print(f"Updated {len(indexes_to_del)} rows")
@@ -188,26 +545,39 @@ class Table:
 
                 Operatores supported: (<,<=,==,>=,>)
         '''
-        column_name, operator, value = self._parse_condition(condition)
-
-        indexes_to_del = []
+        return self._delete_rows(self._where_rows(condition))
 
-        column = self.column_by_name(column_name)
-        for index, row_value in enumerate(column):
-            if get_op(operator, row_value, value):
-                indexes_to_del.append(index)
+    def _delete_rows(self, indexes_to_del):
+        '''
+        Deletes the specified rows (replaces them with rows filled with Nones, meta tables pop them).
 
+        Args:
+            indexes_to_del: list. The indexes of the rows to be deleted.
+        '''
         # we pop from highest to lowest index in order to avoid removing the wrong item
         # since we dont delete, we dont have to to pop in that order, but since delete is used
         # to delete from meta tables too, we still implement it.
 
         for index in sorted(indexes_to_del, reverse=True):
+            if getattr(self, '_live_rows', None) is not None and any(value is not None for value in self.data[index]):
+                self._live_rows -= 1
             if self._name[:4] != 'meta':
-                # if the table is not a metatable, replace the row with a row of nones
+                # remove the row from the key indexes, then replace the row with a row of nones
+                row = self.data[index]
+                for column_idx, key_index in getattr(self, '_key_indexes', {}).items():
+                    key_index.delete(row[column_idx], index)
+                    self._key_changed(column_idx, 'delete', row[column_idx], index)
+                self._save_version(index)
                 self.data[index] = [None for _ in range(len(self.column_names))]
             else:
                 self.data.pop(index)
 
+        if indexes_to_del:
+            # the rows of the meta tables are removed, so the ones after them move
+            self._modified(None if self._name[:4] == 'meta' else indexes_to_del)
+            if self._name[:4] == 'meta':
+                # the rows after the removed ones moved, the key indexes are built again when next needed
+                self._key_indexes = {}
         # self._update()
         # we have to return the deleted indexes, since they will be appended to the insert_stack
         return indexes_to_del
@@ -237,16 +607,14 @@ class Table:
         # if condition is None, return all rows
         # if not, return the rows with values where condition is met for value
         if condition is not None:
-            column_name, operator, value = self._parse_condition(condition)
-            column = self.column_by_name(column_name)
-            rows = [ind for ind, x in enumerate(column) if get_op(operator, x, value)]
+            rows = self._where_rows(condition)
         else:
             rows = [i for i in range(len(self.data))]
 
         # top k rows
         # rows = rows[:int(top_k)] if isinstance(top_k,str) else rows
         # copy the old dict, but only the rows and columns of data with index in rows/columns (the indexes that we want returned)
-        dict = {(key): ([[self.data[i][j] for j in return_cols] for i in rows] if key == "data" else value) for
+        dict = {(key): ([[row[j] for j in return_cols] for row in map(self.data.__getitem__, rows)] if key == "data" else value) for
                 key, value in self.__dict__.items()}
 
         # we need to set the new column names/types and no of columns, since we might
@@ -262,39 +630,49 @@ class Table:
 
         return s_table
 
-    def _select_where_with_btree(self, return_columns, bt, condition, order_by=None, desc=True, top_k=None):
+    def _select_where_with_btree(self, return_columns, bt, condition, order_by=None, desc=True, top_k=None, analyze=False):
 
         # if * return all columns, else find the column indexes for the columns specified
         if return_columns == '*':
             return_cols = [i for i in range(len(self.column_names))]
         else:
-            return_cols = [self.column_names.index(colname) for colname in return_columns]
+            return_cols = [self.column_names.index(col.strip()) for col in return_columns.split(',')]
 
         column_name, operator, value = self._parse_condition(condition)
 
-        # if the column in condition is not a primary key, abort the select
-        if column_name != self.column_names[self.pk_idx]:
-            print('Column is not PK. Aborting')
-
-        # here we run the same select twice, sequentially and using the btree.
-        # we then check the results match and compare performance (number of operation)
-        column = self.column_by_name(column_name)
-
-        # sequential
-        rows1 = []
-        opsseq = 0
-        for ind, x in enumerate(column):
-            opsseq += 1
-            if get_op(operator, x, value):
-                rows1.append(ind)
+        # 'null' cannot be compared with the (typed) values of the btree, so it is handled by the simple select
+        if value == 'null' and self.column_types[self.column_names.index(column_name)] != str:
+            return self._select_where(return_columns, condition, order_by, desc, top_k)
+
+        # explain analyze: run the same select sequentially too and compare the number of operations.
+        # only for benchmarking, the result always comes from the btree
+        if analyze:
+            opsseq = 0
+            for x in self.column_by_name(column_name):
+                opsseq += 1
+                get_op(operator, x, value)
+            print(f'Sequential -> {opsseq} comparison operations')
+            print(f'With {bt.__class__.__name__} -> {bt.find(operator, value, return_ops=True)[1]} comparison operations')
+
+        # index lookup (btree or hash index) for =, else btree range scan. The bounds of the range are given by the operator
+        if operator == '=':
+            rows = bt.find(operator, value)
+        elif operator == 'between':
+            rows = bt.range(value[0], value[1])
+        elif operator in ('>', '>='):
+            rows = bt.range(value, None, lo_incl=operator=='>=')
+        else:
+            rows = bt.range(None, value, hi_incl=operator=='<=')
 
-        # btree find
-        rows = bt.find(operator, value)
+        # the rows come in the order of the indexed column, so if the result is not ordered (or it is ordered
+        # ascending by the indexed column) only the first top_k rows are needed and the scan can stop early
+        if isinstance(top_k, str) and (not order_by or (order_by == column_name and not desc)):
+            rows = islice(rows, int(top_k))
+        rows = list(rows)
 
-        # same as simple select from now on
-        rows = rows[:top_k]
+        # same as simple select from now on (top_k is applied at the end)
         # TODO: this needs to be dumbed down
-        dict = {(key): ([[self.data[i][j] for j in return_cols] for i in rows] if key == "data" else value) for
+        dict = {(key): ([[row[j] for j in return_cols] for row in map(self.data.__getitem__, rows)] if key == "data" else value) for
                 key, value in self.__dict__.items()}
 
         dict['column_names'] = [self.column_names[i] for i in return_cols]
@@ -320,6 +698,8 @@ class Table:
         idx = sorted(range(len(column)), key=lambda k: column[k], reverse=desc)
         # print(idx)
         self.data = [self.data[i] for i in idx]
+        self._modified()
+        self._key_indexes = {} # the rows moved
         # self._update()
 
     def _inner_join(self, table_right: Table, condition):
@@ -378,6 +758,70 @@ class Table:
 
         return join_table
 
+    def _hash_join(self, table_right: Table, condition):
+        '''
+        Join table (left) with a supplied table (right) where an equality condition is met, using a hash join.
+        The smaller table is the build side (its rows are hashed on the join column) and the other one probes it,
+        so the cost is linear to the size of the tables (plus the size of the result).
+
+        Args:
+            condition: string. A condition using the following format:
+                'column=column'.
+        '''
+        # get columns and operator
+        column_name_left, operator, column_name_right = self._parse_condition(condition, join=True)
+        if operator != '=':
+            raise ValueError('Hash join can only be used with an equality (=) condition.')
+        # try to find both columns, if you fail raise error
+        try:
+            column_index_left = self.column_names.index(column_name_left)
+        except:
+            raise Exception(
+                f'Column "{column_name_left}" dont exist in left table. Valid columns: {self.column_names}.')
+
+        try:
+            column_index_right = table_right.column_names.index(column_name_right)
+        except:
+            raise Exception(
+                f'Column "{column_name_right}" dont exist in right table. Valid columns: {table_right.column_names}.')
+
+        join_table = self._empty_join_table(table_right)
+
+        # build: hash the rows of the smaller table on the join column
+        left_is_build = len(self.data) <= len(table_right.data)
+        build_table, build_index = (self, column_index_left) if left_is_build else (table_right, column_index_right)
+        probe_table, probe_index = (table_right, column_index_right) if left_is_build else (self, column_index_left)
+
+        hash_table = {}
+        for row in build_table.data:
+            if row[build_index] is None: # deleted row
+                continue
+            hash_table.setdefault(row[build_index], []).append(row)
+
+        # probe: look up the join value of every row of the larger table
+        for probe_row in probe_table.data:
+            if probe_row[probe_index] is None: # deleted row
+                continue
+            for build_row in hash_table.get(probe_row[probe_index], []):
+                # the result rows are always left row + right row
+                join_table.data.append(build_row + probe_row if left_is_build else probe_row + build_row)
+
+        join_table._modified()
+        return join_table
+
+    def _empty_join_table(self, table_right: Table):
+        '''
+        Create the (empty) table that holds the result of joining table (left) with a supplied table (right).
+        Its columns are the columns of both tables, named "table_name.column_name".
+        '''
+        left_names = [f'{self._name}.{colname}' if self._name != '' else colname for colname in self.column_names]
+        right_names = [f'{table_right._name}.{colname}' if table_right._name != '' else colname for colname in
+                       table_right.column_names]
+
+        join_table_colextras = self.column_extras + table_right.column_extras
+        return Table(name='', column_names=left_names + right_names, column_types=self.column_types + table_right.column_types,
+                     column_extras=join_table_colextras)
+
     def show(self, no_of_rows=None, is_locked=False):
         '''
         Print the table in a nice readable format.
@@ -417,9 +861,10 @@ class Table:
         Args:
             condition: string. A condition using the following format:
                 'column[<,<=,==,>=,>]value' or
-                'value[<,<=,==,>=,>]column'.
+                'value[<,<=,==,>=,>]column' or
+                'column between value and value'.
 
-                Operatores supported: (<,<=,==,>=,>)
+                Operatores supported: (<,<=,==,>=,>,between)
             join: boolean. Whether to join or not (False by default).
         '''
         # if both_columns (used by the join function) return the names of the names of the columns (left first)
@@ -431,6 +876,8 @@ class Table:
         if left not in self.column_names:
             raise ValueError(f'Condition is not valid (cant find column name)')
         coltype = self.column_types[self.column_names.index(left)]
+        if op == 'between':
+            return left, op, (coltype(right[0]), coltype(right[1]))
         if right == 'null':  # ignore null
             return left, op, right
         return left, op, coltype(right)
@@ -448,10 +895,14 @@ class Table:
 
         self.__dict__.update(tmp_dict)
 
-    def _inlj_join(self, right_table: Table, condition):
+    def _inlj_join(self, right_table: Table, condition, index=None):
         '''
         Join table (left) with a table on the right where a condition is met using index nested loop join.
+        The index on the join column of the right table is used if supplied (e.g. the one saved by create index),
+        else a temporary one is built.
+
         Args:
+            index: Btree. The index of the right table's join column (None to build a temporary one).
             the condition: string. A condition using the following format:
                 'column[<,<=,==,>=,>]btree_ptr_index' or
                 'btree_ptr_index[<,<=,==,>=,>]column'.
@@ -483,16 +934,8 @@ class Table:
             else:
                 # If left can be indexed, but right can't, switch places, for a more otpimal way to join
                 # the result is the same, and there is no need to run inlj where the inner table is not indexed
-                join_table = right_table._inl_join(self, condition)  # inner join parameters
+                join_table = right_table._inlj_join(self, condition)  # inner join parameters
             return join_table
-        # Finding the height of the Btree
-        record_count = right_table.column_by_name(right_table.pk)  #
-        height = round(math.log(len(record_count)))
-        # Create Btree index
-        btree_index = Btree(height)
-        # inserting the value of each primary key's record and the index to the appropriate node
-        for btree_ptr_index, record_value in enumerate(right_table.column_by_name(right_table.pk)):
-            btree_index.insert(record_value, btree_ptr_index)
         # try to see if there are any indexes for pending columns to join using inlj, if not error
         # and show the available ones
         try:
@@ -506,41 +949,42 @@ class Table:
             raise Exception(
                 f'Index for column "{column_name_right}" doesnt exist in right table. Valid columns: {right_table.column_names}.')
 
-        # get the column names so that they later match the condition
-        # the left column name becomes left_table_name_name
-        left_names = [f'{self._name}.{colname}'
-                      if self._name != ''  # if the table has a name
-                      else
-                      colname for colname in self.column_names  # or it searches for a name in the columns
-                      ]
-        # likewise
-        right_names = [f'{right_table._name}.{colname}' if right_table._name != '' else colname for colname in
-                       right_table.column_names]
-
-        # creating a new temporary table with its values and types
-        join_table_name = ''
-        join_table_colextras = self.column_extras + right_table.column_extras
-        join_table_colnames = left_names + right_names
-        join_table_coltypes = self.column_types + right_table.column_types
-        #new version of the updated table
-        join_table = Table(name=join_table_name, column_names=join_table_colnames, column_types= join_table_coltypes, column_extras=join_table_colextras)
+        # deleted rows (None) and values that are not of the type of their column (e.g. 'null' in an int column) are
+        # not part of the index (like in the saved ones), they cannot be compared with its keys and never match
+        left_type, right_type = self.column_types[left_column_index], right_table.column_types[right_column_index]
+        if index is None:
+            record_count = right_table.column_by_name(column_name_right)
+            # Create a temporary Btree index from the value of each record's join column and its index
+            index = Btree(64)
+            index.bulk_load((record_value, btree_ptr_index) for btree_ptr_index, record_value in enumerate(record_count)
+                            if isinstance(record_value, right_type))
+
+        # creating a new temporary table with the columns of both tables
+        join_table = self._empty_join_table(right_table)
 
         # INLJ with a cost of blocks in the left_table + left_record records * the records in the right's table index
         for outer_record in self.data:  # going through the first table(with the fewer records)
             left_record = outer_record[left_column_index]
-            matching_index = btree_index.find(operator, left_record)  # condition
-            if len(matching_index) > 0:  # if there are records in the index that satisfy the condition
-                for match_id in matching_index:  # however many are the records in the nested table
-                    join_table._insert(outer_record + right_table.data[match_id])  # putting the results in a table
-
+            if not isinstance(left_record, left_type): # deleted row or null
+                continue
+            for match_id in index.find(operator, left_record):  # however many are the records in the nested table
+                inner_record = right_table.data[match_id]
+                # a saved index might point to a row that has since been deleted or changed
+                if inner_record[right_column_index] != left_record:
+                    continue
+                join_table.data.append(outer_record + inner_record)  # putting the results in a table
+
+        join_table._modified()
         return join_table
 
-
-
-
     def _smj_join(self, table_right: Table, condition):
         '''
-        Join table (left) with a supplied table (right) where condition is met, using the 2-way External Merge-Sort
+        Join table (left) with a supplied table (right) where condition is met, using a sort-merge join.
+
+        The join columns are extracted once and the row positions of both tables are sorted on them (the tables
+        themselves are not reordered). For = the sorted runs of equal values are merged (duplicate values produce
+        every pair of their rows). For <,<=,>,>= (band join) every left row matches a prefix or a suffix of the sorted
+        right rows, whose boundary only moves forward while the left rows are merged in order.
 
         Args:
             condition: string. A condition using the following format:
@@ -555,40 +999,63 @@ class Table:
 
         # get columns and operator
         column_name_left, operator, column_name_right = self._parse_condition(condition, join=True)
+        try:
+            column_index_left = self.column_names.index(column_name_left)
+        except:
+            raise Exception(
+                f'Column "{column_name_left}" dont exist in left table. Valid columns: {self.column_names}.')
 
-        # get the column names so that they later match the condition
-        # the left column name becomes left_table_name_name
-        left_names = [f'{self._name}.{colname}'
-                     if self._name!='' # if the table has a name
-                     else
-                     colname for colname in self.column_names # or it searches for a name in the columns
-                     ]
-
-        #likewise
-        right_names = [f'{table_right._name}.{colname}' if table_right._name!='' else colname for colname in table_right.column_names]
-
-        # define the new tables name, its column names and types
-        join_table_name = ''
-        join_table_colextras = self.column_extras + table_right.column_extras
-        join_table_colnames = left_names+right_names
-        join_table_coltypes = self.column_types+table_right.column_types
-        # new version of the updated table
-        join_table = Table(name=join_table_name, column_names=join_table_colnames, column_types= join_table_coltypes, column_extras=join_table_colextras)
-        #Smj
-        self.order_by(column_name_left,False) #sort the left table(self) by pk
-        table_right.order_by(column_name_right,False) #sorting the right table by pk
-        left_datalen = len(self.data) #the resulting records will be as many as the records in the left table,so we have to
-        right_datalen = len(table_right.data) #find how many will be
-        l_count, r_count = 0, 0 #starting from the begginning
-        while l_count < left_datalen and r_count < right_datalen: #and for the length of the records
-            if(self.column_by_name(column_name_left)[l_count] == table_right.column_by_name(column_name_right)[r_count]): # we check if the
-                # records match in the column of the pk(left and right),in the current record of the counting counter
-                join_table._insert(self.data[l_count]+table_right.data[r_count]) #then we put the result in the joined table(which takes space)
-                l_count+=1 # in the current possition of the counter so that the records print in order
-                r_count+=1 #then we increase both counter
-            elif(self.data[l_count] < table_right.data[r_count]): #if one counter has surpased the other(cause maybe there were double records on the
-                l_count+=1                 #column that we check)we bring the other counter right back up
-            else:
-                r_count+=1
+        try:
+            column_index_right = table_right.column_names.index(column_name_right)
+        except:
+            raise Exception(
+                f'Column "{column_name_right}" dont exist in right table. Valid columns: {table_right.column_names}.')
 
-        return join_table #and we return the table for printing
\ No newline at end of file
+        join_table = self._empty_join_table(table_right)
+
+        # extract the join columns once and sort the positions of the rows on them. Deleted rows (None) are skipped and
+        # so are the values that are not of the type of their column (e.g. 'null' in an int column): they cannot be
+        # sorted with the rest and, like in the nested loop join, they never match
+        left_keys = [row[column_index_left] for row in self.data]
+        right_keys = [row[column_index_right] for row in table_right.data]
+        left_type, right_type = self.column_types[column_index_left], table_right.column_types[column_index_right]
+        left_order = sorted((ind for ind, key in enumerate(left_keys) if isinstance(key, left_type)), key=left_keys.__getitem__)
+        right_order = sorted((ind for ind, key in enumerate(right_keys) if isinstance(key, right_type)), key=right_keys.__getitem__)
+        sorted_right_keys = [right_keys[ind] for ind in right_order]
+
+        if operator == '=':
+            l_count, r_count = 0, 0
+            while l_count < len(left_order) and r_count < len(right_order):
+                left_key = left_keys[left_order[l_count]]
+                right_key = sorted_right_keys[r_count]
+                if left_key < right_key:
+                    l_count += 1
+                elif left_key > right_key:
+                    r_count += 1
+                else:
+                    # find the end of the run of equal values on both sides and join every pair of their rows
+                    l_end, r_end = l_count, r_count
+                    while l_end < len(left_order) and left_keys[left_order[l_end]] == left_key:
+                        l_end += 1
+                    while r_end < len(right_order) and sorted_right_keys[r_end] == right_key:
+                        r_end += 1
+                    for l_ind in left_order[l_count:l_end]:
+                        for r_ind in right_order[r_count:r_end]:
+                            join_table.data.append(self.data[l_ind] + table_right.data[r_ind])
+                    l_count, r_count = l_end, r_end
+        else:
+            # the boundary is the first right position that does not satisfy (for > and >=) or satisfies (for < and <=)
+            # the condition. Since the left values are visited in ascending order, it only moves forward.
+            boundary = 0
+            for l_ind in left_order:
+                left_key = left_keys[l_ind]
+                while boundary < len(sorted_right_keys) and (sorted_right_keys[boundary] <= left_key if operator in ('<', '>=')
+                                                             else sorted_right_keys[boundary] < left_key):
+                    boundary += 1
+                # < and <= match the right values after the boundary, > and >= the ones before it
+                matches = right_order[boundary:] if operator in ('<', '<=') else right_order[:boundary]
+                for r_ind in matches:
+                    join_table.data.append(self.data[l_ind] + table_right.data[r_ind])
+
+        join_table._modified()
+        return join_table
@@ -1,8 +1,9 @@
-from ..db.btree import Btree
 from random import randrange
 import sys
 
 import os
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'miniDB'))
+from btree import Btree
 os.environ["PATH"] += os.pathsep + 'C:/Program Files/Graphviz/bin/'
 
 '''
@@ -0,0 +1,58 @@
+import os
+import random
+import sys
+
+import pytest
+
+# the modules of miniDB import each other by name (e.g. from table import Table)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'miniDB'))
+
+import storage
+from table import Table
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    '''
+    Run the test inside a temporary directory (databases are saved under ./dbdata).
+    '''
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    '''
+    Page the tables with 50 rows or more.
+    '''
+    monkeypatch.setattr(storage, 'PAGED_TABLE_ROWS', 50)
+
+
+def live_rows(table):
+    '''
+    Return the rows of a table that are not deleted, sorted.
+    '''
+    return sorted(list(row) for row in table.data if any(value is not None for value in row))
+
+
+def pair_tables(seed=0):
+    '''
+    Return two tables (l and r) to be joined on their k columns, with random (duplicate) keys.
+    '''
+    random.seed(seed)
+    left = Table('l', ['id', 'k'], [int, int], [''])
+    right = Table('r', ['k', 'v'], [int, int], [''])
+    for i in range(200):
+        left._insert([str(i), str(random.randint(0, 30))])
+    for i in range(150):
+        right._insert([str(random.randint(0, 40)), str(i)])
+    # deleted rows are skipped
+    right.data[3] = [None, None]
+    return left, right
+
+
+def joined(table):
+    '''
+    Return the rows of a join result whose left and right rows both exist, sorted.
+    '''
+    return sorted(row for row in table.data if row[0] is not None and row[2] is not None)
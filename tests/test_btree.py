@@ -0,0 +1,32 @@
+import random
+
+import pytest
+
+from btree import Btree
+
+
+def expected_ptrs(ref):
+    return [ptr for value in sorted(ref) for ptr in sorted(ref[value])]
+
+
+@pytest.mark.parametrize('b', [3, 4, 8, 64])
+def test_btree_insert_and_delete(b):
+    random.seed(b)
+    bt = Btree(b)
+    ref = {}
+    for step in range(2000):
+        if random.random() < 0.55 or not ref:
+            value = random.randint(0, 200)
+            bt.insert(value, step)
+            ref.setdefault(value, []).append(step)
+        else:
+            value = random.choice(list(ref))
+            ptr = random.choice(ref[value])
+            assert bt.delete(value, ptr)
+            ref[value].remove(ptr)
+            if not ref[value]:
+                del ref[value]
+    assert not bt.delete(1000, 1)
+    assert sorted(bt.range()) == sorted(expected_ptrs(ref))
+    for value in random.sample(list(ref), 20):
+        assert sorted(bt.find('=', value)) == sorted(ref[value])
@@ -0,0 +1,29 @@
+import random
+
+import pytest
+
+from btree import Btree
+
+
+def test_btree_bulk_load_and_range():
+    bt = Btree(4)
+    bt.bulk_load([(value % 50, value) for value in range(500)])
+    assert list(bt.range(10, 12)) == [ptr for value in (10, 11, 12) for ptr in range(value, 500, 50)]
+    assert list(bt.range(10, 12, lo_incl=False, hi_incl=False)) == list(range(11, 500, 50))
+
+
+@pytest.mark.parametrize('b', [3, 4, 64])
+@pytest.mark.parametrize('fill_factor', [0.5, 0.75, 1])
+def test_btree_bulk_load_accepts_inserts(b, fill_factor):
+    random.seed(b)
+    pairs = [(random.randint(0, 300), ptr) for ptr in range(1000)]
+    bt = Btree(b)
+    bt.bulk_load(pairs, fill_factor)
+    # the free space of the nodes is used by later inserts
+    for ptr in range(1000, 1200):
+        value = random.randint(0, 300)
+        bt.insert(value, ptr)
+        pairs.append((value, ptr))
+    assert list(bt.range()) == [ptr for value, ptr in sorted(pairs)]
+    for value in (0, 150, 300, 301):
+        assert sorted(bt.find('=', value)) == sorted(ptr for other, ptr in pairs if other == value)
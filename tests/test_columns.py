@@ -0,0 +1,59 @@
+import random
+
+import numpy as np
+
+from table import Table
+
+
+def built_arrays(table, column_name):
+    array, valid, length = table._build_column_array(column_name)
+    return array[:length], valid[:length]
+
+
+def test_column_arrays_are_typed():
+    table = Table('t', ['i', 'f', 's', 'l'], [int, float, str, list], [''])
+    table._insert([1, 1.5, 'one', [1]])
+    table._insert(['null', 'null', 'null', 'null'])
+    table._delete_rows([0])
+
+    array, valid = table.column_array('i')
+    assert array.dtype == np.int64 and array.tolist() == [0, 0] and valid.tolist() == [False, False]
+    assert table.column_array('f')[0].dtype == np.float64
+    assert table.column_array('s')[0].dtype == object
+    assert not array.flags.writeable and not valid.flags.writeable
+
+
+def test_column_arrays_follow_the_writes():
+    random.seed(0)
+    table = Table('t', ['id', 'v', 'name'], [int, float, str], [''])
+    insert_stack = []
+    for step in range(2000):
+        operation = random.random()
+        if operation < 0.5 or not table.data:
+            table._insert([str(step), random.choice(['null', str(step / 3)]), random.choice(['a', 'null'])], insert_stack)
+            if insert_stack:
+                insert_stack.pop()
+        else:
+            rowid = random.randrange(len(table.data))
+            if table.data[rowid][0] is None:
+                continue
+            if operation < 0.75:
+                table._set_rows([rowid], random.choice(['null', '7']), random.choice(['id', 'v']))
+            else:
+                insert_stack.extend(table._delete_rows([rowid]))
+        if step % 100 == 0:
+            for column_name in table.column_names:
+                array, valid = table.column_array(column_name)
+                expected_array, expected_valid = built_arrays(table, column_name)
+                assert array.dtype == expected_array.dtype
+                assert valid.tolist() == expected_valid.tolist()
+                assert array[valid].tolist() == expected_array[expected_valid].tolist()
+
+
+def test_column_array_is_dropped_when_a_value_does_not_fit():
+    table = Table('t', ['id'], [int], [''])
+    table._insert(['1'])
+    assert table.column_array('id')[0].dtype == np.int64
+    table._insert([str(2**70)])
+    array, valid = table.column_array('id')
+    assert array.dtype == object and array.tolist() == [1, 2**70]
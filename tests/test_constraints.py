@@ -0,0 +1,33 @@
+import pytest
+
+from database import Database
+from .conftest import live_rows
+
+
+def test_primary_key_is_unique(workdir):
+    db = Database('ix', load=False)
+    db.create_table('t', 'id,name', 'int,str', 'None,unique', primary_key='id')
+    db.insert_into('t', '1,a')
+    db.insert_into('t', '1,b')
+    db.insert_into('t', '2,a')
+    assert [row for row in db.tables['t'].data if row[0] is not None] == [[1, 'a']]
+
+
+@pytest.mark.parametrize('reload', [False, True])
+def test_key_checks_follow_updates_and_deletes(workdir, reload):
+    db = Database('ix', load=False)
+    db.create_table('t', 'id,name', 'int,str', 'None,unique', primary_key='id')
+    db.insert_many('t', [[i, f'n{i}'] for i in range(10)])
+    db.delete_from('t', 'id=3')
+    db.update_table('t', 'id=20', condition='id=4')
+    if reload:
+        db.save_database()
+        db = Database('ix')
+
+    # the deleted and the updated keys can be inserted again, the new key cannot
+    db.insert_into('t', '3,n3')
+    db.insert_into('t', '4,x')
+    db.insert_into('t', '20,y')
+    db.insert_into('t', '21,n5')
+    expected = sorted([[i, f'n{i}'] for i in range(10) if i != 4] + [[4, 'x'], [20, 'n4']])
+    assert live_rows(db.tables['t']) == expected
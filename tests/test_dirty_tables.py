@@ -0,0 +1,38 @@
+import os
+
+from database import Database
+
+
+def file_stats(names):
+    return {name: os.stat(f'dbdata/d_db/{name}.tbl').st_mtime_ns for name in names}
+
+
+def test_only_dirty_tables_are_saved(workdir):
+    db = Database('d', load=False)
+    for name in ('a', 'b'):
+        db.create_table(name, 'x', 'int', 'None')
+        db.insert_into(name, '1')
+    db.save_database()
+    before = file_stats(['a', 'b', 'meta_indexes'])
+
+    db.insert_into('a', '2')
+    db.save_database()
+    after = file_stats(['a', 'b', 'meta_indexes'])
+    assert after['a'] != before['a']
+    assert after['b'] == before['b']
+    assert after['meta_indexes'] == before['meta_indexes']
+
+
+def test_update_without_changes_does_not_dirty_the_table(workdir):
+    db = Database('d', load=False)
+    db.create_table('a', 'x,y', 'int,str', 'None,None')
+    db.insert_into('a', '1,one')
+    db.save_database()
+    before = file_stats(['a'])
+
+    # the value is already set, so nothing is written
+    db.update_table('a', 'y=one', condition='x=1')
+    assert not db.tables['a']._dirty
+    db.save_database()
+    assert file_stats(['a']) == before
+    assert Database('d').select('*', 'a', None).data == [[1, 'one']]
@@ -0,0 +1,38 @@
+from database import Database
+from table import Table
+
+
+def indexed_db():
+    db = Database('ea', load=False)
+    db.create_table('t', 'id,name', 'int,str', 'None,None', primary_key='id')
+    db.insert_many('t', [[i, f'n{i}'] for i in range(500)])
+    db.create_index('pk', 't')
+    return db
+
+
+def test_indexed_select_does_not_scan_the_table(workdir, monkeypatch):
+    db = indexed_db()
+
+    # the meta tables (e.g. meta_indexes) are still read
+    def no_scan(method):
+        def wrapper(self, *args, **kwargs):
+            assert self._name != 't', 'the table was scanned'
+            return method(self, *args, **kwargs)
+        return wrapper
+    monkeypatch.setattr(Table, 'column_by_name', no_scan(Table.column_by_name))
+    monkeypatch.setattr(Table, '_where_rows', no_scan(Table._where_rows))
+    assert db.select('*', 't', 'id=42').data == [[42, 'n42']]
+    assert db.select('*', 't', 'id>497').data == [[498, 'n498'], [499, 'n499']]
+
+
+def test_analyze_reports_the_operations_of_both_plans(workdir, capsys):
+    db = indexed_db()
+    capsys.readouterr()
+    db.select('*', 't', 'id=42')
+    assert 'comparison operations' not in capsys.readouterr().out
+
+    db.analyze = True
+    assert db.select('*', 't', 'id=42').data == [[42, 'n42']]
+    out = capsys.readouterr().out
+    assert 'Sequential -> 500 comparison operations' in out
+    assert 'With Btree -> ' in out
@@ -0,0 +1,42 @@
+import csv
+
+import pytest
+
+from database import Database
+
+
+def make_db():
+    db = Database('ex', load=False)
+    db.create_table('t', 'id,name,score', 'int,str,float', 'None,None,None', primary_key='id')
+    db.insert_many('t', [[1, ' two  spaces ', 1.5], [2, 'say "hi"', 2.0], [3, 'a,b', 'null'], [4, 'line\nbreak', 4.25]])
+    db.delete_from('t', 'id=2')
+    return db
+
+
+def read_csv(filename, delimiter=','):
+    with open(filename, newline='') as f:
+        return list(csv.reader(f, delimiter=delimiter))
+
+
+def test_export_skips_deleted_rows_and_keeps_the_values(workdir):
+    make_db().export('t', 'out.csv')
+    assert read_csv('out.csv') == [['id', 'name', 'score'], ['1', ' two  spaces ', '1.5'], ['3', 'a,b', 'null'], ['4', 'line\nbreak', '4.25']]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 10000])
+def test_export_of_columns_where_a_condition_is_met(workdir, chunk_size):
+    make_db().export('t', 'out.csv', columns='name, id', condition='id>1', delimiter=';', chunk_size=chunk_size)
+    assert read_csv('out.csv', ';') == [['name', 'id'], ['a,b', '3'], ['line\nbreak', '4']]
+
+
+def test_export_of_a_select_result(workdir):
+    db = make_db()
+    db.export(db.select('id,score', 't', 'score>=1.5'), 'out.csv')
+    assert read_csv('out.csv') == [['id', 'score'], ['1', '1.5'], ['4', '4.25']]
+
+
+def test_exported_table_can_be_imported(workdir):
+    db = make_db()
+    db.export('t', 'out.csv')
+    db.import_table('copy', 'out.csv')
+    assert db.tables['copy'].data == [row for row in db.tables['t'].data if row[0] is not None]
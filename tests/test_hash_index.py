@@ -0,0 +1,53 @@
+import random
+
+from database import Database
+from hash_index import HashIndex
+
+
+def test_hash_index_insert_and_delete():
+    random.seed(0)
+    index = HashIndex()
+    ref = {}
+    for step in range(5000):
+        if random.random() < 0.6 or not ref:
+            value = random.choice([random.randint(0, 500), f's{random.randint(0, 500)}'])
+            index.insert(value, step)
+            ref.setdefault(value, []).append(step)
+        else:
+            value = random.choice(list(ref))
+            ptr = random.choice(ref[value])
+            assert index.delete(value, ptr)
+            ref[value].remove(ptr)
+            if not ref[value]:
+                del ref[value]
+    assert all(index.find('=', value) == ref[value] for value in ref)
+    # the buckets grow and shrink one at a time with the number of values
+    assert len(index.buckets) > index.no_of_buckets
+    assert index.size <= index.max_load*len(index.buckets)
+    no_of_buckets = len(index.buckets)
+    for value in ref:
+        for ptr in ref[value]:
+            assert index.delete(value, ptr)
+    assert index.size == 0 and len(index.buckets) < no_of_buckets
+
+
+def test_equality_selects_use_the_hash_index(workdir, monkeypatch):
+    db = Database('hx', load=False)
+    db.create_table('t', 'id,name', 'int,str', 'None,None', primary_key='id')
+    db.insert_many('t', [[i, f'n{i % 10}'] for i in range(100)])
+    db.create_index('names', 't(name)', 'hash')
+    db.save_database()
+
+    lookups = []
+    find = HashIndex.find
+    def counting_find(self, *args, **kwargs):
+        lookups.append(args)
+        return find(self, *args, **kwargs)
+    monkeypatch.setattr(HashIndex, 'find', counting_find)
+    for database in (db, Database('hx')):
+        lookups.clear()
+        assert sorted(row[0] for row in database.select('*', 't', 'name=n3').data) == list(range(3, 100, 10))
+        assert lookups == [('=', 'n3')]
+        # only equality can be evaluated by a hash index
+        assert len(database.select('*', 't', 'name<n1').data) == 10
+        assert lookups == [('=', 'n3')]
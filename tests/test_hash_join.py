@@ -0,0 +1,6 @@
+from .conftest import pair_tables, joined
+
+
+def test_hash_join_matches_nested_loop():
+    left, right = pair_tables(1)
+    assert joined(left._hash_join(right, 'k=k')) == joined(left._inner_join(right, 'k=k'))
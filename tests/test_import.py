@@ -0,0 +1,28 @@
+import pytest
+
+from misc import infer_type
+from database import Database
+
+
+@pytest.mark.parametrize('values, expected', [
+    (['1', '-2', '+3', 'null', ''], int),
+    (['1', '2.5', '.5', '3.', '1e5', '-2E-3'], float),
+    (['1', 'nan'], str),
+    (['inf', '-inf'], str),
+    (['1_000'], str),
+    ([' 12 '], str),
+    (['٣'], str),
+    (['null', ''], str),
+])
+def test_infer_type(values, expected):
+    assert infer_type(values) is expected
+
+
+def test_import_keeps_text_columns(workdir):
+    with open('people.csv', 'w') as f:
+        f.write('id,name,score,code\n1,nan,1.5,1_000\n2,inf,2,007\n3,"Doe, J",null,12\n')
+    db = Database('imp', load=False)
+    db.import_table('people', 'people.csv')
+    table = db.tables['people']
+    assert table.column_types == [int, str, float, str]
+    assert table.data == [[1, 'nan', 1.5, '1_000'], [2, 'inf', 2.0, '007'], [3, 'Doe, J', 'null', '12']]
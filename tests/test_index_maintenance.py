@@ -0,0 +1,31 @@
+from database import Database
+
+
+def test_indexes_follow_writes_and_reload(workdir):
+    db = Database('ix', load=False)
+    db.create_table('t', 'id,name,year', 'int,str,int', 'None,None,None', primary_key='id')
+    db.insert_many('t', [[i, f'n{i}', 2000 + i % 10] for i in range(100)])
+    db.create_index('pk', 't')
+    db.create_index('years', 't(year)', 'hash')
+    db.delete_from('t', 'year=2004')
+    db.update_table('t', 'year=2004', condition='id=7')
+    db.insert_into('t', '1000,new,2004')
+    db.save_database()
+
+    for database in (db, Database('ix')):
+        assert sorted(row[0] for row in database.select('*', 't', 'year=2004').data) == [7, 1000]
+        assert database.select('*', 't', 'id=1000').data == [[1000, 'new', 2004]]
+        assert database.select('*', 't', 'id=4').data == []
+
+
+def test_indexes_of_a_cast_column_are_rebuilt(workdir):
+    db = Database('ix', load=False)
+    db.create_table('t', 'id,year', 'int,str', 'None,None', primary_key='id')
+    db.insert_many('t', [[i, str(2000 + i % 10)] for i in range(30)])
+    db.create_index('years', 't(year)')
+    db.create_index('years_hash', 't(year)', 'hash')
+    db.cast('year', 't', 'int')
+
+    for database in (db, Database('ix')):
+        assert sorted(row[0] for row in database.select('*', 't', 'year>2007').data) == [8, 9, 18, 19, 28, 29]
+        assert sorted(row[0] for row in database.select('*', 't', 'year=2004').data) == [4, 14, 24]
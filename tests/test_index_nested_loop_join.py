@@ -0,0 +1,44 @@
+import pytest
+
+from btree import Btree
+from database import Database
+from .conftest import pair_tables, joined
+
+
+def test_index_nested_loop_join_matches_nested_loop():
+    left, right = pair_tables(2)
+    right.pk, right.pk_idx = 'k', 0
+    assert joined(left._inlj_join(right, 'k=k')) == joined(left._inner_join(right, 'k=k'))
+
+
+@pytest.mark.parametrize('saved_index', [False, True])
+def test_index_nested_loop_join_skips_nulls(saved_index):
+    left, right = pair_tables(4)
+    right.pk, right.pk_idx = 'k', 0
+    left._insert(['1000', 'null'])
+    right._insert(['null', '1000'])
+    index = None
+    if saved_index:
+        # like the indexes saved by create index, which only have the values of the column's type
+        index = Btree(64)
+        index.bulk_load((row[0], ind) for ind, row in enumerate(right.data) if isinstance(row[0], int))
+    expected = [row for row in joined(left._inner_join(right, 'k=k')) if 'null' not in (row[1], row[2])]
+    assert joined(left._inlj_join(right, 'k=k', index)) == expected
+
+
+def test_join_reuses_the_saved_index(workdir, monkeypatch):
+    db = Database('j', load=False)
+    db.create_table('l', 'id,k', 'int,int', 'None,None')
+    db.create_table('r', 'k,v', 'int,int', 'None,None', primary_key='k')
+    for i in range(50):
+        db.insert_into('l', f'{i},{i % 20}')
+    for i in range(30):
+        db.insert_into('r', f'{i},{i * 10}')
+    db.create_index('r_k', 'r')
+    expected = joined(db.tables['l']._inner_join(db.tables['r'], 'k=k'))
+
+    # the join has to use the saved index instead of building a temporary one
+    def fail(*args, **kwargs):
+        raise AssertionError('a temporary index was built')
+    monkeypatch.setattr(Btree, 'bulk_load', fail)
+    assert joined(db.join('inner', 'l', 'r', 'k=k')) == expected
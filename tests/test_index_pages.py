@@ -0,0 +1,41 @@
+import os
+
+from database import Database
+from pager import NodePages
+
+
+def indexed_db():
+    db = Database('ip', load=False)
+    db.create_table('t', 'id,name', 'int,str', 'None,None', primary_key='id')
+    db.insert_many('t', [[i, f'n{i}'] for i in range(20000)])
+    db.create_index('pk', 't')
+    db.save_database()
+    return db
+
+
+def test_index_nodes_are_read_on_demand(workdir):
+    indexed_db()
+    reopened = Database('ip')
+    assert reopened.select('*', 't', 'id=1234').data == [[1234, 'n1234']]
+    nodes = reopened._load_idx('pk').nodes
+    assert isinstance(nodes, NodePages)
+    # only the path from the root to the leaf of the value was read
+    assert 0 < len(nodes.cache) <= 4 < len(nodes)
+
+
+def test_only_the_modified_nodes_are_written(workdir):
+    indexed_db()
+    path = 'dbdata/ip_db/indexes/meta_pk_index.idx'
+    inode, size = os.stat(path).st_ino, os.path.getsize(path)
+    db = Database('ip')
+    db.insert_into('t', '20000,new')
+    db.delete_from('t', 'id=5')
+    nodes = db._load_idx('pk').nodes
+    assert isinstance(nodes, NodePages) and 0 < len(nodes.dirty) <= 8
+    db.save_database()
+    # the index file was changed in place
+    assert os.stat(path).st_ino == inode and os.path.getsize(path) >= size
+
+    reopened = Database('ip')
+    assert reopened.select('*', 't', 'id>19998').data == [[19999, 'n19999'], [20000, 'new']]
+    assert reopened.select('*', 't', 'id between 4 and 6').data == [[4, 'n4'], [6, 'n6']]
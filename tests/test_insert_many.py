@@ -0,0 +1,46 @@
+import pytest
+
+import mdb
+from database import Database
+from .conftest import live_rows
+
+
+def test_insert_into_with_many_rows_is_a_batch():
+    assert mdb.interpret('insert into t values (1,a),(2,b) , (3,c);') == {'insert many': 't', 'values': ['1,a', '2,b', '3,c']}
+    assert mdb.interpret('insert into t values (1,a);') == {'insert into': 't', 'values': ' 1,a '}
+
+
+def test_mdb_inserts_many_rows(workdir, monkeypatch):
+    db = Database('im', load=False)
+    db.create_table('t', 'id,name', 'int,str', 'None,None', primary_key='id')
+    monkeypatch.setattr(mdb, 'db', db, raising=False)
+    mdb.execute_dic(mdb.interpret('insert into t values (1,a),(2,b b);'))
+    assert live_rows(Database('im').tables['t']) == [[1, 'a'], [2, 'b b']]
+
+
+def make_db():
+    db = Database('im', load=False)
+    db.create_table('t', 'id,name', 'int,str', 'None,unique', primary_key='id')
+    db.insert_many('t', ['1,a', '2,b'])
+    db.delete_from('t', 'id=2')
+    db.save_database()
+    return db
+
+
+@pytest.mark.parametrize('rows', [
+    ['3,c', '1,d'], # primary key of an existing row
+    ['3,c', '4,a'], # unique value of an existing row
+    ['3,c', '3,d'], # primary key repeated in the batch
+    ['3,c', '4,c'], # unique value repeated in the batch
+    ['3,c', 'x,d'], # value of the wrong type
+    ['3,c', '4'], # wrong number of values
+])
+def test_insert_many_inserts_no_row_of_a_failed_batch(workdir, rows):
+    db = make_db()
+    db.insert_many('t', rows)
+    for database in (db, Database('im')):
+        assert live_rows(database.tables['t']) == [[1, 'a']]
+        # the slot of the deleted row is still free
+        assert database._get_insert_stack_for_table('t') == [1]
+    db.insert_many('t', ['3,c', '4,d'])
+    assert live_rows(Database('im').tables['t']) == [[1, 'a'], [3, 'c'], [4, 'd']]
@@ -0,0 +1,33 @@
+from database import Database
+
+
+def test_tables_are_loaded_lazily(workdir):
+    db = Database('l', load=False)
+    for name in ('a', 'b'):
+        db.create_table(name, 'x', 'int', 'None')
+        db.insert_into(name, '1')
+    db.save_database()
+
+    reopened = Database('l', max_loaded_tables=1)
+    assert 'a' in reopened.tables and not reopened.tables.is_loaded('a')
+    assert reopened.select('*', 'a', None).data == [[1]]
+    assert reopened.select('*', 'b', None).data == [[1]]
+    assert not reopened.tables.is_loaded('a')
+
+
+def test_row_count_is_kept_without_reading_the_table(workdir, small_pages):
+    db = Database('c', load=False)
+    db.create_table('big', 'id,name', 'int,str', 'None,None')
+    db.insert_many('big', [[i, f'name {i:05}' * 4] for i in range(3000)])
+    db.delete_from('big', 'id<10')
+    db.save_database()
+
+    reopened = Database('c')
+    reopened.insert_into('big', '3000,new')
+    table = reopened.tables['big']
+    assert len(table.data.pages) > 10
+    # only the page of the new row is read
+    assert len(reopened._buffer_pool.pages) <= 1
+    assert reopened.select('*', 'meta_length', 'table_name=big').data == [['big', 2991]]
+    reopened.delete_from('big', 'id<20')
+    assert reopened.select('*', 'meta_length', 'table_name=big').data == [['big', 2981]]
@@ -0,0 +1,44 @@
+import multiprocessing
+
+from locks import LockManager
+from database import Database
+from .conftest import live_rows
+
+
+def test_shared_and_exclusive_locks(tmp_path):
+    first = LockManager(tmp_path)
+    second = LockManager(tmp_path)
+
+    assert first.acquire('t', 's')
+    assert second.acquire('t', 's', blocking=False)
+    # the upgrade must wait for the other reader
+    assert not first.acquire('t', 'x', blocking=False)
+    assert first.mode('t') == 's'
+    second.release('t')
+
+    assert first.acquire('t', 'x')
+    assert second.is_locked('t')
+    assert not second.acquire('t', 's', blocking=False)
+    first.release('t')
+    assert first.mode('t') == 's'
+    first.release('t')
+    assert not second.is_locked('t')
+
+
+def _insert_rows(worker, n):
+    db = Database('lk')
+    for i in range(n):
+        db.insert_into('a', f'{worker * 1000 + i},{worker}')
+
+
+def test_concurrent_inserts_are_not_lost(workdir):
+    db = Database('lk', load=False)
+    db.create_table('a', 'id,w', 'int,int', 'None,None', primary_key='id')
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_insert_rows, args=(worker, 20)) for worker in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0, 0, 0]
+    assert len(live_rows(Database('lk').tables['a'])) == 60
@@ -0,0 +1,41 @@
+import multiprocessing
+
+import database
+from database import Database
+from .conftest import live_rows
+
+
+def _insert_rows(worker, n):
+    db = Database('m')
+    for i in range(n):
+        db.insert_into('t', f'{worker * 1000 + i},{worker}')
+
+
+def _open_database(n):
+    for _ in range(n):
+        Database('m')
+
+
+def test_open_while_other_processes_save(workdir, monkeypatch):
+    # the writers save the database (checkpoint) every few inserts
+    monkeypatch.setattr(database, 'WAL_CHECKPOINT_SIZE', 2000)
+    db = Database('m', load=False)
+    db.create_table('t', 'id,w', 'int,int', 'None,None', primary_key='id')
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_insert_rows, args=(worker, 150)) for worker in range(4)]
+    processes += [context.Process(target=_open_database, args=(150,)) for _ in range(6)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert [process.exitcode for process in processes] == [0] * len(processes)
+    reopened = Database('m')
+    assert len(live_rows(reopened.tables['t'])) == 600
+    assert reopened.select('*', 'meta_length', 'table_name=t').data == [['t', 600]]
+
+
+def test_missing_database_is_created(workdir, recwarn):
+    db = Database('new')
+    assert 'meta_length' in db.tables
+    assert any('does not exist' in str(warning.message) for warning in recwarn)
@@ -0,0 +1,104 @@
+import os
+from array import array
+
+import storage
+from database import Database
+from pager import PagedRows, apply_patches
+from storage import write_table
+
+
+def test_paged_table(workdir, small_pages):
+    db = Database('p', load=False)
+    db.create_table('big', 'id,name,v', 'int,str,int', 'None,None,None', primary_key='id')
+    rows = [[i, f'n{i}', i % 10] for i in range(500)]
+    db.insert_many('big', [list(row) for row in rows])
+    db.save_database()
+    assert isinstance(db.tables['big'].data, PagedRows)
+    assert os.path.exists('dbdata/p_db/big.heap')
+
+    # rows that grow out of their page are moved
+    db.update_table('big', 'name=' + 'x' * 3000, condition='v=7')
+    db.delete_from('big', 'id<5')
+    for row in rows:
+        if row[2] == 7:
+            row[1] = 'x' * 3000
+    rows[:5] = [[None] * 3 for _ in range(5)]
+    assert db.tables['big'].data[:] == rows
+    db.save_database()
+
+    reopened = Database('p')
+    assert reopened.tables['big'].data[:] == rows
+    assert reopened.select('*', 'big', 'id=499').data == [[499, 'n499', 9]]
+
+
+def paged_database(name):
+    db = Database(name, load=False)
+    db.create_table('big', 'id,name', 'int,str', 'None,None', primary_key='id')
+    db.insert_many('big', [[i, f'n{i}'] for i in range(500)])
+    db.save_database()
+    return db
+
+
+def test_checkpoint_changes_the_files_in_place(workdir, small_pages):
+    db = paged_database('p')
+    paths = [f'dbdata/p_db/big.{extension}' for extension in ('heap', 'rows', 'keys')]
+    inodes = [os.stat(path).st_ino for path in paths]
+    keys_size = os.path.getsize('dbdata/p_db/big.keys')
+
+    db.insert_into('big', '500,new')
+    # the row grows out of its page and moves
+    db.update_table('big', 'name=' + 'x' * 3000, condition='id=3')
+    db.delete_from('big', 'id=7')
+    db.save_database()
+    # the files were changed, not written again, and the changes of the key indexes were appended
+    assert [os.stat(path).st_ino for path in paths] == inodes
+    assert os.path.getsize('dbdata/p_db/big.keys') > keys_size
+    assert not [file for file in os.listdir('dbdata/p_db') if file.endswith(('.dw', '.tmp'))]
+
+    reopened = Database('p')
+    assert reopened.select('*', 'big', 'id=3').data == [[3, 'x' * 3000]]
+    assert reopened.select('*', 'big', 'id=500').data == [[500, 'new']]
+    assert reopened.select('*', 'big', 'id=7').data == []
+    reopened.insert_into('big', '500,duplicate')
+    reopened.insert_into('big', '7,again')
+    assert reopened.select('*', 'big', 'id=500').data == [[500, 'new']]
+    assert reopened.select('*', 'big', 'id=7').data == [[7, 'again']]
+
+
+def test_interrupted_in_place_checkpoint_is_finished_on_load(workdir, small_pages):
+    db = paged_database('p')
+    db.insert_into('big', '500,new')
+    db.update_table('big', 'name=' + 'x' * 3000, condition='id=3')
+    db.delete_from('big', 'id=7')
+    # the changes were written and the checkpoint logged, then the process crashed while changing the heap file
+    table = db.tables['big']
+    table._dirty = False
+    write_table(table, 'dbdata/p_db/big.tbl.tmp', in_place=True)
+    assert os.path.exists('dbdata/p_db/big.heap.dw') and os.path.exists('dbdata/p_db/big.rows.dw')
+    db._append_to_wal(('checkpoint', ['big']))
+    apply_patches('dbdata/p_db/big.heap.dw', 'dbdata/p_db/big.heap')
+
+    reopened = Database('p')
+    assert not [file for file in os.listdir('dbdata/p_db') if file.endswith(('.dw', '.tmp'))]
+    assert reopened.select('*', 'big', 'id=3').data == [[3, 'x' * 3000]]
+    assert reopened.select('*', 'big', 'id=500').data == [[500, 'new']]
+    assert reopened.select('*', 'big', 'id=7').data == []
+    assert reopened.select('*', 'meta_length', 'table_name=big').data == [['big', 500]]
+
+
+def test_row_directory_of_older_versions(workdir, small_pages):
+    db = paged_database('p')
+    # older versions wrote all the page numbers, then all the slots (and no layout in the schema)
+    with open('dbdata/p_db/big.rows', 'rb') as f:
+        directory = array('i', f.read())
+    with open('dbdata/p_db/big.rows', 'wb') as f:
+        f.write(directory[0::2].tobytes() + directory[1::2].tobytes())
+    table = db.tables['big']
+    with open('dbdata/p_db/big.tbl', 'wb') as f:
+        storage._write_schema(f, table, {'paged': True, 'no_of_rows': 500, 'live_rows': 500})
+
+    reopened = Database('p')
+    assert reopened.tables['big'].data[:] == [[i, f'n{i}'] for i in range(500)]
+    reopened.insert_into('big', '500,new')
+    reopened.save_database()
+    assert Database('p').tables['big'].data[:] == [[i, f'n{i}'] for i in range(500)] + [[500, 'new']]
@@ -0,0 +1,54 @@
+import pytest
+
+from btree import Btree
+from table import Table
+
+
+class CountingBtree(Btree):
+    '''
+    Btree that counts the ptrs its range scans yield.
+    '''
+    def range(self, *args, **kwargs):
+        for ptr in super().range(*args, **kwargs):
+            self.yielded += 1
+            yield ptr
+
+
+def indexed_table():
+    table = Table('t', ['id', 'v'], [int, int], [''])
+    for i in range(5000):
+        table._insert([str(i), str(i % 7)])
+    bt = CountingBtree(64)
+    bt.bulk_load((row[0], rowid) for rowid, row in enumerate(table.data))
+    bt.yielded = 0
+    return table, bt
+
+
+def test_btree_range_yields_in_value_order():
+    bt = Btree(4)
+    bt.bulk_load([(value, value) for value in range(0, 100, 2)])
+    assert list(bt.range(None, 10, hi_incl=False)) == [0, 2, 4, 6, 8]
+    assert list(bt.range(91)) == [92, 94, 96, 98]
+    assert list(bt.range(10, 20, lo_incl=False)) == [12, 14, 16, 18, 20]
+
+
+@pytest.mark.parametrize('condition', ['id>=100', 'id<4000', 'id between 10 and 4000'])
+def test_top_k_stops_the_range_scan_early(condition):
+    table, bt = indexed_table()
+    result = table._select_where_with_btree('*', bt, condition, top_k='5')
+    assert result.data == table._select_where('*', condition, top_k='5').data
+    assert bt.yielded == 5
+
+
+def test_top_k_ordered_by_another_column_scans_the_whole_range():
+    table, bt = indexed_table()
+    result = table._select_where_with_btree('*', bt, 'id between 100 and 199', order_by='v', top_k='3')
+    assert sorted(result.data) == sorted(table._select_where('*', 'id between 100 and 199', order_by='v', top_k='3').data)
+    assert [row[1] for row in result.data] == [6, 6, 6]
+    assert bt.yielded == 100
+
+
+@pytest.mark.parametrize('condition', ['id between 4990 and 6000', 'id between 7 and 7', 'id between 3 and 1'])
+def test_between_through_the_index(condition):
+    table, bt = indexed_table()
+    assert table._select_where_with_btree('*', bt, condition).data == table._select_where('*', condition).data
@@ -0,0 +1,34 @@
+from database import Database
+
+
+def make_db():
+    db = Database('r', load=False)
+    for name in ('a', 'b'):
+        db.create_table(name, 'x', 'int', 'None')
+        db.insert_into(name, '1')
+    db.save_database()
+    return db
+
+
+def test_only_tables_whose_file_changed_are_read_again(workdir):
+    db = make_db()
+    a, b = db.tables['a'], db.tables['b']
+
+    other = Database('r')
+    other.insert_into('a', '2')
+    other.save_database()
+
+    db.load_database()
+    assert db.tables['a'] is not a
+    assert db.tables['a'].data == [[1], [2]]
+    assert db.tables['b'] is b
+
+
+def test_own_saves_are_not_read_again(workdir):
+    db = make_db()
+    db.insert_into('a', '2')
+    db.save_database()
+    a = db.tables['a']
+
+    db.load_database()
+    assert db.tables['a'] is a
@@ -0,0 +1,39 @@
+import os
+import pickle
+
+import pytest
+
+from btree import Btree, Node
+from database import Database
+
+
+@pytest.mark.parametrize('condition', ['year=2004', 'year<2003', 'year>=2008', 'year between 2002 and 2004', 'year=1999'])
+def test_secondary_index_finds_every_row_of_a_value(workdir, condition):
+    db = Database('ix', load=False)
+    db.create_table('t', 'id,year', 'int,int', 'None,None', primary_key='id')
+    db.insert_many('t', [[i, 2000 + i % 10] for i in range(200)])
+    db.insert_into('t', '1000,null')
+    expected = sorted(db.select('*', 't', condition).data)
+    db.create_index('years', 't(year)')
+    assert sorted(db.select('*', 't', condition).data) == expected
+    assert sorted(Database('ix').select('*', 't', condition).data) == expected
+
+
+def test_pickled_btree_of_older_versions_is_rebuilt(workdir):
+    db = Database('ix', load=False)
+    db.create_table('t', 'id,name', 'int,str', 'None,None', primary_key='id')
+    db.insert_many('t', [[i, f'n{i}'] for i in range(5)])
+    db.create_index('pk', 't')
+    # older versions pickled the btree, with a single row (not a list of rows) per key in other slots of the leaves
+    legacy = Btree(3)
+    legacy.nodes = [Node(3, values=[0, 1, 2, 3, 4], ptrs=[0, 0, 1, 2, 3, 4], is_leaf=True)]
+    legacy.root = 0
+    os.remove(f'{db.savedir}/indexes/meta_pk_index.idx')
+    with open(f'{db.savedir}/indexes/meta_pk_index.pkl', 'wb') as f:
+        pickle.dump(legacy, f)
+
+    reopened = Database('ix')
+    assert reopened.select('*', 't', 'id>2').data == [[3, 'n3'], [4, 'n4']]
+    reopened.save_database()
+    assert os.path.isfile(f'{db.savedir}/indexes/meta_pk_index.idx') and not os.path.isfile(f'{db.savedir}/indexes/meta_pk_index.pkl')
+    assert Database('ix').select('*', 't', 'id<2').data == [[0, 'n0'], [1, 'n1']]
@@ -0,0 +1,39 @@
+from database import Database
+from .conftest import live_rows
+
+
+def make_db():
+    db = Database('mv', load=False)
+    db.create_table('acc', 'id,bal', 'int,int', 'None,None', primary_key='id')
+    db.create_table('own', 'id,name', 'int,str', 'None,None', primary_key='id')
+    for i in range(5):
+        db.insert_into('acc', f'{i},100')
+        db.insert_into('own', f'{i},n{i}')
+    db.create_index('acc_idx', 'acc')
+    return db
+
+
+def test_snapshot_does_not_see_later_writes(workdir):
+    writer = make_db()
+    reader = Database('mv')
+    before = [[i, 100] for i in range(5)]
+    with reader.snapshot():
+        assert live_rows(reader.select('*', 'acc', None)) == before
+        writer.update_table('acc', 'bal=0', condition='id=1')
+        writer.delete_from('acc', 'id=2')
+        writer.insert_into('acc', '7,700')
+        writer.insert_into('acc', '8,800')
+        reader.update_table('acc', 'bal=5', condition='id=3')
+
+        assert live_rows(reader.select('*', 'acc', None)) == before
+        # the index has the new rows, it is not used to read the snapshot
+        assert reader.select('*', 'acc', 'id=1').data == [[1, 100]]
+        assert reader.select('*', 'acc', 'id>=7').data == []
+        assert len(live_rows(reader.join('inner', 'acc', 'own', 'id=id'))) == 5
+
+    after = [[0, 100], [1, 0], [3, 5], [4, 100], [7, 700], [8, 800]]
+    assert live_rows(reader.select('*', 'acc', None)) == after
+    # the old versions are dropped when the snapshot is closed
+    assert reader.tables['acc']._versions == {}
+    reader.save_database()
+    assert live_rows(Database('mv').tables['acc']) == after
@@ -0,0 +1,23 @@
+import pytest
+
+from .conftest import pair_tables, joined
+
+
+@pytest.mark.parametrize('operator', ['=', '<', '<=', '>', '>='])
+def test_sort_merge_join_matches_nested_loop(operator):
+    left, right = pair_tables()
+    expected = joined(left._inner_join(right, f'k{operator}k'))
+    assert joined(left._smj_join(right, f'k{operator}k')) == expected
+
+
+@pytest.mark.parametrize('operator', ['=', '<', '<=', '>', '>='])
+def test_sort_merge_join_skips_nulls(operator):
+    left, right = pair_tables(3)
+    left._insert(['1000', 'null'])
+    right._insert(['null', '1000'])
+    right._insert(['null', '1001'])
+    # 'null' never matches a value of the (int) join column
+    expected = [row for row in joined(left._inner_join(right, f'k{operator}k')) if 'null' not in (row[1], row[2])]
+    result = joined(left._smj_join(right, f'k{operator}k'))
+    assert result == expected
+    assert all(row[1] != 'null' and row[2] != 'null' for row in result)
@@ -0,0 +1,45 @@
+import os
+
+from table import Table
+from database import Database
+from storage import read_table, write_table
+
+
+def test_table_file_round_trip(tmp_path):
+    table = Table('t', ['i', 'f', 's', 'b', 'l'], [int, float, str, bool, list], [''])
+    table._insert([1, 1.5, 'one', True, [1, 2]])
+    table._insert(['null', 'null', 'null', 'null', 'null'])
+    table._insert([2**70, 2.5, 'ένα', False, []])
+    table.data.append([None] * 5)
+
+    write_table(table, str(tmp_path / 't.tbl'))
+    loaded = read_table(str(tmp_path / 't.tbl'))
+    assert loaded.data == table.data
+    assert loaded.column_types == table.column_types
+    assert loaded._dirty is False
+
+
+def test_column_named_like_a_table_attribute(tmp_path):
+    table = Table('t', ['id', 'data'], [int, str], [''])
+    table._insert([1, 'one'])
+    write_table(table, str(tmp_path / 't.tbl'))
+    assert read_table(str(tmp_path / 't.tbl')).data == [[1, 'one']]
+
+
+def test_key_indexes_are_saved_with_the_table(workdir, small_pages):
+    db = Database('k', load=False)
+    db.create_table('big', 'id,name', 'int,str', 'None,unique', primary_key='id')
+    db.insert_many('big', [[i, f'name {i:05}' * 4] for i in range(3000)])
+    db.save_database()
+    assert os.path.exists('dbdata/k_db/big.keys')
+
+    reopened = Database('k')
+    reopened.insert_into('big', '3000,new')
+    # the key indexes were read from the key index file, not built from the rows
+    assert len(reopened._buffer_pool.pages) <= 1
+    reopened.insert_into('big', '5,other')
+    reopened.insert_into('big', f'3001,name {7:05}' + f'name {7:05}' * 3)
+    assert reopened.select('*', 'meta_length', 'table_name=big').data == [['big', 3001]]
+
+    reopened.drop_table('big')
+    assert not os.path.exists('dbdata/k_db/big.keys')
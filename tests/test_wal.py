@@ -0,0 +1,97 @@
+import os
+import pickle
+
+import pytest
+
+from database import Database
+from storage import write_table
+from .conftest import live_rows
+
+
+def make_db(name='t'):
+    db = Database(name, load=False)
+    db.create_table('a', 'x,y', 'int,str', 'None,None', primary_key='x')
+    return db
+
+
+def test_statements_are_replayed_by_other_databases(workdir):
+    db = make_db()
+    other = Database('t')
+    for i in range(10):
+        db.insert_into('a', f'{i},v{i}')
+    db.update_table('a', 'y=zz', condition='x>7')
+    db.delete_from('a', 'x<2')
+
+    # nothing was saved, the statements are only in the log
+    assert os.path.getsize('dbdata/t_db/wal.log') > 0
+    other.load_database()
+    assert live_rows(other.tables['a']) == live_rows(db.tables['a'])
+    assert live_rows(Database('t').tables['a']) == [[i, f'v{i}'] for i in range(2, 8)] + [[8, 'zz'], [9, 'zz']]
+
+
+def test_torn_record_is_ignored(workdir):
+    db = make_db()
+    db.insert_into('a', '1,one')
+    with open('dbdata/t_db/wal.log', 'ab') as f:
+        f.write(pickle.dumps(('insert', 'a', ['2', 'two']))[:7])
+    assert live_rows(Database('t').tables['a']) == [[1, 'one']]
+
+
+def test_save_database_empties_the_log(workdir):
+    db = make_db()
+    db.insert_into('a', '1,one')
+    db.save_database()
+    # only the header of the new log is left
+    assert os.path.getsize('dbdata/t_db/wal.log') == db._wal_offset
+    assert live_rows(Database('t').tables['a']) == [[1, 'one']]
+
+
+def test_interrupted_checkpoint_is_finished_on_load(workdir):
+    db = make_db()
+    db.insert_into('a', '1,one')
+    # the table was written and the checkpoint logged, but the files were not replaced
+    table = db.tables['a']
+    table._dirty = False
+    write_table(table, 'dbdata/t_db/a.tbl.tmp')
+    db._append_to_wal(('checkpoint', ['a']))
+
+    reopened = Database('t')
+    assert live_rows(reopened.tables['a']) == [[1, 'one']]
+    assert not os.path.exists('dbdata/t_db/a.tbl.tmp')
+
+
+def test_table_dropped_by_another_database_is_forgotten(workdir):
+    db = make_db()
+    db.create_table('b', 'x', 'int', 'None')
+    other = Database('t')
+    # the insert is only in the log, the table is dirty
+    db.insert_into('a', '1,one')
+    other.drop_table('a')
+    db.insert_into('b', '1')
+    db.save_database()
+
+    assert 'a' not in db.tables
+    assert not os.path.exists('dbdata/t_db/a.tbl')
+    reopened = Database('t')
+    assert 'a' not in reopened.tables
+    assert reopened.tables['meta_length']._select_where('*', 'table_name=a').data == []
+
+
+def test_log_and_checkpoint_files_are_flushed_to_disk(workdir, monkeypatch):
+    if not os.path.isdir('/proc/self/fd'):
+        pytest.skip('the paths of the flushed files are found through /proc')
+    db = make_db()
+    synced = []
+    fsync = os.fsync
+    def recording_fsync(fd):
+        synced.append(os.path.basename(os.readlink(f'/proc/self/fd/{fd}')))
+        fsync(fd)
+    monkeypatch.setattr(os, 'fsync', recording_fsync)
+
+    db.insert_into('a', '1,one')
+    assert synced == ['wal.log']
+    synced.clear()
+    db.save_database()
+    # the new table file, the checkpoint record, the directory after the rename and the emptied log
+    assert synced.index('a.tbl.tmp') < synced.index('wal.log') < synced.index('t_db')
+    assert synced[-2:] == ['wal.log', 't_db']
@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from misc import get_op
+from table import Table
+
+
+def sample_table():
+    random.seed(0)
+    table = Table('t', ['i', 'f', 's'], [int, float, str], [''])
+    for _ in range(300):
+        table._insert([random.choice(['null', str(random.randint(-5, 5))]),
+                       random.choice(['null', str(random.randint(-50, 50) / 10)]),
+                       random.choice(['null', 'a', 'b', 'c'])])
+    table._delete_rows(random.sample(range(300), 30))
+    return table
+
+
+def matching_rows(table, condition):
+    # the rows are evaluated one at a time, like the selects did before the conditions were vectorized
+    column_name, operator, value = table._parse_condition(condition)
+    column_idx = table.column_names.index(column_name)
+    return [rowid for rowid, row in enumerate(table.data) if get_op(operator, row[column_idx], value)]
+
+
+@pytest.mark.parametrize('operator', ['=', '<', '<=', '>', '>='])
+@pytest.mark.parametrize('column_name,value', [('i', '2'), ('i', 'null'), ('f', '0.5'), ('s', 'b'), ('s', 'null')])
+def test_where_rows_match_the_rows_of_get_op(operator, column_name, value):
+    table = sample_table()
+    condition = f'{column_name}{operator}{value}'
+    assert table._where_rows(condition) == matching_rows(table, condition)
+
+
+@pytest.mark.parametrize('condition', ['i between -2 and 3', 'f between 0 and 1.5', 's between a and b'])
+def test_where_rows_of_between(condition):
+    table = sample_table()
+    assert table._where_rows(condition) == matching_rows(table, condition)